@@ -0,0 +1,168 @@
+"""Per-board cache TTLs learned from service frequency.
+
+Every board fetch is observed: the gap between its scheduled departures
+(headway) and how far PTV's realtime estimates drift per second of wall
+clock are tracked as moving averages. Drift is measured in seconds of
+estimate movement, so it does not depend on how often the board happens to
+be fetched. Learned TTLs only ever lengthen the fixed TTL: a long-headway
+board with stable estimates, or an overnight one, is fetched less often.
+The fixed TTL is undercut only when the next departure leaves before it
+would expire, so the board rolls over promptly.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from statistics import median
+
+# Weight of the newest sample in the moving averages.
+_ALPHA = 0.3
+# Estimate drift (seconds) tolerated within one TTL.
+_DRIFT_TOLERANCE_SECONDS = 30
+# Fetches further apart than this restart the drift estimate.
+_MAX_OBSERVATION_GAP_SECONDS = 3600
+
+
+def _instant(raw: str | None) -> datetime | None:
+    if not raw:
+        return None
+    try:
+        return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+@dataclass(slots=True)
+class BoardProfile:
+    headway_seconds: float | None = None
+    drift_per_second: float | None = None  # Seconds of estimate movement per second
+    empty_streak: int = 0
+    observed_at: datetime | None = None
+    estimates: dict[tuple, datetime | None] = field(default_factory=dict)
+    fetches: int = 0
+    last_ttl_seconds: float = 0.0
+    baseline_ttl_seconds: float = 0.0
+    calls_saved: float = 0.0
+
+
+class AdaptiveTTLPolicy:
+    def __init__(self, min_seconds: int, max_seconds: int):
+        self.min_seconds = max(1, min_seconds)
+        self.max_seconds = max(self.min_seconds, max_seconds)
+        self.profiles: dict[str, BoardProfile] = {}
+
+    def observe(self, key: str, data: dict, fetched_at: datetime) -> None:
+        """Learn from a fresh PTV payload for this board."""
+        profile = self.profiles.setdefault(key, BoardProfile())
+        departures = data.get("departures") or []
+        if data.get("scheduled"):
+            # Timetable fallback: nothing to learn about realtime behaviour.
+            return
+
+        if not departures:
+            profile.empty_streak += 1
+        else:
+            profile.empty_streak = 0
+            scheduled = sorted(
+                t for t in (_instant(d.get("scheduled_departure_utc")) for d in departures) if t is not None
+            )
+            gaps = [(b - a).total_seconds() for a, b in zip(scheduled, scheduled[1:]) if b > a]
+            if gaps:
+                headway = median(gaps)
+                profile.headway_seconds = (
+                    headway if profile.headway_seconds is None
+                    else _ALPHA * headway + (1 - _ALPHA) * profile.headway_seconds
+                )
+
+        estimates = {
+            (d.get("scheduled_departure_utc"), d.get("destination")): _instant(
+                d.get("estimated_departure_utc") or d.get("scheduled_departure_utc")
+            )
+            for d in departures
+        }
+        if profile.observed_at is not None:
+            elapsed = (fetched_at - profile.observed_at).total_seconds()
+            if 0 < elapsed <= _MAX_OBSERVATION_GAP_SECONDS:
+                # Largest movement of any run seen in both fetches.
+                moved = [
+                    abs((estimate - profile.estimates[run]).total_seconds())
+                    for run, estimate in estimates.items()
+                    if estimate is not None and profile.estimates.get(run) is not None
+                ]
+                if moved:
+                    rate = max(moved) / elapsed
+                    profile.drift_per_second = (
+                        rate if profile.drift_per_second is None
+                        else _ALPHA * rate + (1 - _ALPHA) * profile.drift_per_second
+                    )
+            elif elapsed > _MAX_OBSERVATION_GAP_SECONDS:
+                profile.drift_per_second = None
+        profile.estimates = estimates
+        profile.observed_at = fetched_at
+
+    def ttl_seconds(
+        self,
+        key: str,
+        data: dict,
+        fetched_at: datetime,
+        default_seconds: int,
+        empty_seconds: int,
+    ) -> tuple[float, float]:
+        """Return ``(ttl, no_departures_ttl)`` for this board, falling back to
+        the configured defaults until something has been learned.
+
+        The TTL never drops below ``default_seconds`` except to expire when
+        the next departure leaves."""
+        profile = self.profiles.get(key)
+        if profile is None:
+            return default_seconds, empty_seconds
+
+        # Empty boards (e.g. overnight) back off exponentially.
+        empty_ttl = min(self.max_seconds, empty_seconds * 2 ** max(0, profile.empty_streak - 1))
+
+        ttl = default_seconds
+        if profile.drift_per_second is not None:
+            # Lengthen only once drift has been measured between two fetches.
+            limits = [
+                _DRIFT_TOLERANCE_SECONDS / profile.drift_per_second if profile.drift_per_second else self.max_seconds
+            ]
+            if profile.headway_seconds is not None:
+                limits.append(profile.headway_seconds / 3)
+            ttl = min(self.max_seconds, max(default_seconds, min(limits)))
+
+        departures = data.get("departures") or []
+        if departures:
+            first = _instant(departures[0].get("estimated_departure_utc") or departures[0].get("scheduled_departure_utc"))
+            if first is not None:
+                # Imminent departure: refresh as it leaves.
+                ttl = min(ttl, max(self.min_seconds, (first - fetched_at).total_seconds()))
+
+        return ttl, empty_ttl
+
+    def record(self, key: str, baseline: timedelta, adaptive: timedelta) -> None:
+        """Account the PTV calls saved (or spent) by this TTL versus the fixed
+        policy, assuming the board stays in demand for the whole TTL."""
+        profile = self.profiles.setdefault(key, BoardProfile())
+        baseline_seconds = max(1.0, baseline.total_seconds())
+        adaptive_seconds = max(1.0, adaptive.total_seconds())
+        profile.fetches += 1
+        profile.last_ttl_seconds = adaptive_seconds
+        profile.baseline_ttl_seconds = baseline_seconds
+        profile.calls_saved += adaptive_seconds / baseline_seconds - 1
+
+    def report(self) -> list[dict]:
+        rows = []
+        for key, profile in self.profiles.items():
+            rows.append({
+                "board": key,
+                "fetches": profile.fetches,
+                "headway_seconds": round(profile.headway_seconds, 1) if profile.headway_seconds is not None else None,
+                "estimate_drift_seconds_per_minute": (
+                    round(profile.drift_per_second * 60, 2) if profile.drift_per_second is not None else None
+                ),
+                "empty_streak": profile.empty_streak,
+                "last_ttl_seconds": round(profile.last_ttl_seconds, 1),
+                "baseline_ttl_seconds": round(profile.baseline_ttl_seconds, 1),
+                "ptv_calls_saved": round(profile.calls_saved, 1),
+            })
+        rows.sort(key=lambda row: row["ptv_calls_saved"], reverse=True)
+        return rows
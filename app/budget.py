@@ -0,0 +1,114 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+# Absolute time.monotonic() deadline for the current request, if any. Tasks
+# started from a request inherit it, so PTV calls made on its behalf are
+# bounded by whatever budget the request has left.
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+class BudgetExhausted(Exception):
+    """The request's deadline passed or upstream admission was refused."""
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """Bound everything awaited inside the block to ``seconds`` from now."""
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(at if outer is None else min(at, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def reserve(seconds: float):
+    """Hold ``seconds`` of the current budget back from the block, leaving the
+    caller time to use a partial result once the block gives up."""
+    at = _deadline.get()
+    if at is None:
+        yield
+        return
+    token = _deadline.set(at - seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def clear_deadline() -> None:
+    """Detach the current task from any inherited request deadline."""
+    _deadline.set(None)
+
+
+def current_deadline() -> float | None:
+    """The current absolute time.monotonic() deadline, or None when unbounded."""
+    return _deadline.get()
+
+
+def set_deadline(at: float | None) -> None:
+    """Replace the current task's deadline (None for unbounded)."""
+    _deadline.set(at)
+
+
+def remaining() -> float | None:
+    """Seconds left in the current deadline, or None when unbounded."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - time.monotonic())
+
+
+class AdmissionGate:
+    """Bounded concurrency for upstream fetches with a bounded wait queue.
+
+    Callers beyond ``max_waiting`` are shed immediately, and waiters give up
+    when their deadline runs out, so a slow upstream cannot pile up work.
+    """
+
+    def __init__(self, max_concurrent: int, max_waiting: int):
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrent))
+        self.max_waiting = max(0, max_waiting)
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._semaphore.locked() and self.waiting >= self.max_waiting:
+            self.shed += 1
+            raise BudgetExhausted("upstream admission queue full")
+
+        self.waiting += 1
+        try:
+            async with asyncio.timeout(remaining()):
+                await self._semaphore.acquire()
+        except TimeoutError:
+            self.shed += 1
+            raise BudgetExhausted("deadline passed waiting for upstream admission") from None
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
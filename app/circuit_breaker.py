@@ -0,0 +1,65 @@
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is currently failing."""
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures.
+
+    closed    — calls pass through; consecutive failures are counted.
+    open      — calls fail fast with CircuitOpenError for reset_seconds.
+    half_open — one trial call is let through; success closes the circuit,
+                failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.opened_count = 0
+        self.rejected_count = 0
+
+    def before_call(self) -> None:
+        if self.state == "closed":
+            return
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_seconds:
+                self.rejected_count += 1
+                raise CircuitOpenError(f"{self.name} circuit open")
+            self.state = "half_open"
+        if self._trial_in_flight:
+            self.rejected_count += 1
+            raise CircuitOpenError(f"{self.name} circuit half-open, trial in flight")
+        self._trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._trial_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened_count += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+
+    def record_ignored(self) -> None:
+        """The call finished with an error that says nothing about upstream health."""
+        self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opened": self.opened_count,
+            "rejected": self.rejected_count,
+        }
@@ -1,23 +1,112 @@
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+class PushTarget(BaseModel):
+    """One push-mode display: a TRMNL webhook and the board it shows."""
+
+    webhook_url: str
+    stop_id: int
+    station_name: str
+    platform_numbers: str | None = None  # Comma-separated, e.g. "1,2"
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=False)
 
     ptv_dev_id: str
     ptv_api_key: str
+    ptv_base_url: str | None = None  # Defaults to the public PTV API; see loadtest/fake_ptv.py
     trmnl_webhook_url: str | None = None
     trmnl_client_id: str | None = None
     trmnl_client_secret: str | None = None
     database_path: str = "./data/trmnl.db"
+    sqlite_synchronous: str = "NORMAL"  # OFF | NORMAL | FULL (database runs in WAL mode)
+    sqlite_busy_timeout_ms: int = 5000
+    user_cache_size: int = 10000
+    user_cache_ttl_seconds: int = 300
     default_stop_id: int = 19843  # Melbourne Central
     station_name: str = "Melbourne Central"
     platform_numbers: str | None = None  # Comma-separated, e.g. "1,2"
     refresh_minutes: int = 5
+    push_targets: list[PushTarget] = []  # JSON list; adds to TRMNL_WEBHOOK_URL's station
+    push_concurrency: int = 4  # Targets fetched and pushed in parallel
     public_cache_seconds: int = 60
     no_departures_cache_seconds: int = 30
     departure_cache_grace_seconds: int = 60
+    adaptive_ttl_enabled: bool = True  # Learn per-board TTLs from headways and estimate drift
+    adaptive_ttl_min_seconds: int = 20  # Floor when a departure is imminent
+    adaptive_ttl_max_seconds: int = 600
     render_freshness_seconds: int = 60
+    stale_max_seconds: int = 600  # Serve expired board data this long while revalidating
+    markup_deadline_seconds: float = 8.0  # Latency budget for /trmnl/markup, incl. PTV calls
+    upstream_fetch_concurrency: int = 16  # Concurrent board fetches from PTV
+    upstream_fetch_queue: int = 64  # Board fetches allowed to wait for a slot before shedding
+    markup_cache_size: int = 512  # Rendered /trmnl/markup bodies kept in memory
+    trace_sample_rate: float = 0.0  # Fraction of /trmnl/markup requests traced (0 = off, 1 = all)
+    admin_token: str | None = None  # Bearer token for /admin endpoints (unset = admin disabled)
+
+    # Sampling profiler (see app/profiler.py); not installed unless enabled
+    profiler_enabled: bool = False
+    profile_sample_rate: float = 0.0  # Fraction of /trmnl/markup requests profiled
+    profile_interval_ms: float = 5.0  # Stack sampling interval
+    profile_max_window_seconds: int = 300  # Longest window /admin/profile may open
+    profile_dir: str = "./data/profiles"  # Collapsed-stack output files
+    profile_max_files: int = 200  # Newest profiles kept in profile_dir; older ones are deleted
+    station_index_path: str | None = "./data/stops.json"  # PTV stops dump for offline search
+
+    # GTFS static timetable, used when PTV is unavailable or has no departures
+    gtfs_path: str | None = None  # GTFS zip or extracted directory
+    gtfs_member: str | None = None  # Inner zip of the combined feed, e.g. "2/google_transit.zip"
+    gtfs_skip_live_in_gaps: bool = False  # Serve the timetable without calling PTV during service gaps
+    gtfs_gap_minutes: int = 60  # No scheduled departure within this long counts as a gap
+
+    # Shared upstream HTTP clients (one pooled client per upstream)
+    http_max_connections: int = 20
+    http_max_keepalive_connections: int = 10
+    http_keepalive_expiry_seconds: float = 30.0
+    http_timeout_seconds: float = 10.0
+    http_connect_timeout_seconds: float = 5.0
+    http2_enabled: bool = False  # Requires the optional 'h2' package
+
+    # Whole-run stopping patterns, cached until the run's last departure + grace
+    pattern_cache_size: int = 512
+    pattern_cache_grace_seconds: int = 300
+    pattern_cache_max_seconds: int = 14400
+    pattern_single_request: bool = False  # Derive express stops from one request when it provably can
+    route_topology_ttl_seconds: int = 7 * 24 * 3600  # Route stop lists, persisted in SQLite (unused by boards)
+
+    # PTV circuit breaker
+    ptv_breaker_failure_threshold: int = 5
+    ptv_breaker_reset_seconds: int = 30
+
+    # PTV rate limiter (token bucket shared by all PTV calls)
+    ptv_rate_per_second: float = 5.0
+    ptv_rate_burst: int = 20
+    ptv_search_reserve: float = 0.2  # Fraction of the bucket search may not dip into
+    ptv_scheduled_reserve: float = 0.25  # Fraction of the bucket push mode may not dip into
+    ptv_background_reserve: float = 0.5  # Fraction of the bucket prefetch/revalidation may not dip into
+    ptv_interactive_max_wait_seconds: float = 5.0
+    ptv_search_max_wait_seconds: float = 2.0
+    ptv_scheduled_max_wait_seconds: float = 30.0  # Push waits for tokens instead of being dropped
+    ptv_background_max_wait_seconds: float = 0.0  # 0 = drop immediately when dry
+
+    # Background prefetch of popular boards (public plugin mode)
+    prefetch_enabled: bool = True
+    prefetch_interval_seconds: int = 5
+    prefetch_lead_seconds: int = 10  # Refresh this long before a board's next expected poll
+    prefetch_active_window_seconds: int = 900  # Only boards polled within this window
+    prefetch_concurrency: int = 4
+    prefetch_ptv_budget_per_minute: int = 60  # Each board refresh counts as two PTV calls
+
+    # State shared across worker processes (uvicorn --workers, containers on one volume)
+    web_concurrency: int = 1  # Worker processes; the PTV rate budget is split between them
+    multi_worker_user_cache_ttl_seconds: int = 5  # User cache TTL cap with several workers
+    shared_state_backend: str = "sqlite"  # sqlite | memory (single process only)
+    leader_lease_seconds: int = 30  # Scheduler jobs run only in the worker holding this lease
+    pending_settings_ttl_seconds: int = 3600  # Setup-page settings awaiting /install/success
+    pending_settings_max_entries: int = 5000  # Oldest entries are evicted beyond this
+    shared_state_sweep_seconds: int = 300  # How often expired shared entries are deleted
 
 
 settings = Settings()
@@ -1,10 +1,46 @@
 import json
 import os
+import time
+from dataclasses import dataclass
 from datetime import datetime, timezone
 
 import aiosqlite
 
+from . import metrics, tracing
+from .cache import TTLCache
+
 DATABASE_PATH = os.environ.get("DATABASE_PATH", "./data/trmnl.db")
+SQLITE_SYNCHRONOUS = "NORMAL"  # Safe with WAL; FULL fsyncs on every commit
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_CACHED_STATEMENTS = 256
+
+# One long-lived connection per process, opened on first use and closed by
+# the app lifespan. aiosqlite serialises statements on its worker thread, so
+# the connection's prepared-statement cache is shared by every caller.
+_connection: aiosqlite.Connection | None = None
+
+
+@dataclass(slots=True, frozen=True)
+class UserSettings:
+    """The subset of a user row needed to render their display."""
+
+    uuid: str
+    stop_id: int
+    station_name: str
+    platform_numbers: str | None
+    refresh_minutes: int
+
+
+# Hot-path cache of UserSettings so device polls do not touch SQLite.
+# Invalidated by every write to a user row; the TTL bounds staleness when
+# another process changed the row.
+USER_CACHE_TTL_SECONDS = 300
+user_cache = TTLCache(10000)
+
+def _instrumented(fn):
+    """Record a database coroutine in /metrics and as a trace span."""
+    return metrics.timed_sqlite(tracing.traced(f"sqlite.{fn.__name__}")(fn))
+
 
 _CREATE_TABLE = """
 CREATE TABLE IF NOT EXISTS users (
@@ -25,46 +61,148 @@ CREATE TABLE IF NOT EXISTS users (
 );
 """
 
+# Departure payloads shared by every user watching the same board, keyed by
+# stop_id plus the normalised platform filter (see departure_cache.station_key).
+_CREATE_DEPARTURE_CACHE = """
+CREATE TABLE IF NOT EXISTS departure_cache (
+    cache_key TEXT PRIMARY KEY,
+    stop_id INTEGER NOT NULL,
+    platform_numbers TEXT,
+    payload TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+"""
+
+# Route stop lists change a few times a year; cached with a long TTL.
+_CREATE_ROUTE_TOPOLOGY = """
+CREATE TABLE IF NOT EXISTS route_topology (
+    route_id INTEGER NOT NULL,
+    direction_id INTEGER NOT NULL,
+    route_type INTEGER NOT NULL,
+    stops TEXT NOT NULL,
+    fetched_at TEXT NOT NULL,
+    PRIMARY KEY (route_id, direction_id, route_type)
+);
+"""
+
+# State shared by every worker process (see app/shared_state.py): JSON values
+# grouped by namespace with an optional epoch expiry, and named leases.
+_CREATE_SHARED_STATE = """
+CREATE TABLE IF NOT EXISTS shared_state (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+_CREATE_LEASES = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
 # Migrations for existing databases that predate new columns.
 _MIGRATIONS = [
     "ALTER TABLE users ADD COLUMN refresh_minutes INTEGER DEFAULT 5",
     "ALTER TABLE users ADD COLUMN cached_departures TEXT",
     "ALTER TABLE users ADD COLUMN cache_updated_at TEXT",
+    # Per-user payloads were replaced by the shared departure_cache table.
+    "UPDATE users SET cached_departures = NULL, cache_updated_at = NULL WHERE cached_departures IS NOT NULL",
 ]
 
 
 async def _get_db() -> aiosqlite.Connection:
+    global _connection
+    if _connection is not None:
+        return _connection
+
     os.makedirs(os.path.dirname(DATABASE_PATH) or ".", exist_ok=True)
-    db = await aiosqlite.connect(DATABASE_PATH)
+    db = await aiosqlite.connect(DATABASE_PATH, cached_statements=SQLITE_CACHED_STATEMENTS)
     db.row_factory = aiosqlite.Row
+    await db.execute("PRAGMA journal_mode=WAL")
+    synchronous = SQLITE_SYNCHRONOUS.upper()
+    if synchronous not in {"OFF", "NORMAL", "FULL", "EXTRA"}:
+        await db.close()
+        raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {SQLITE_SYNCHRONOUS!r}")
+    await db.execute(f"PRAGMA synchronous={synchronous}")
+    await db.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+
+    if _connection is not None:
+        # Another caller connected while we were awaiting; keep theirs.
+        await db.close()
+        return _connection
+    _connection = db
     return db
 
 
+async def close_db():
+    global _connection
+    if _connection is not None:
+        db, _connection = _connection, None
+        await db.close()
+
+
 async def init_db():
     db = await _get_db()
-    try:
-        await db.execute(_CREATE_TABLE)
-        await db.commit()
-        for sql in _MIGRATIONS:
-            try:
-                await db.execute(sql)
-                await db.commit()
-            except Exception:
-                pass  # Column already exists — safe to ignore
-    finally:
-        await db.close()
+    await db.execute(_CREATE_TABLE)
+    await db.execute(_CREATE_DEPARTURE_CACHE)
+    await db.execute(_CREATE_ROUTE_TOPOLOGY)
+    await db.execute(_CREATE_SHARED_STATE)
+    await db.execute(_CREATE_LEASES)
+    await db.commit()
+    for sql in _MIGRATIONS:
+        try:
+            await db.execute(sql)
+            await db.commit()
+        except Exception:
+            pass  # Column already exists — safe to ignore
 
 
+@_instrumented
 async def get_user(uuid: str) -> dict | None:
     db = await _get_db()
-    try:
-        cursor = await db.execute("SELECT * FROM users WHERE uuid = ?", (uuid,))
+    async with db.execute("SELECT * FROM users WHERE uuid = ?", (uuid,)) as cursor:
         row = await cursor.fetchone()
-        return dict(row) if row else None
-    finally:
-        await db.close()
+    return dict(row) if row else None
+
+
+async def get_user_settings(uuid: str) -> UserSettings | None:
+    cached = user_cache.get(uuid)
+    if cached is not None:
+        return cached
+
+    db = await _get_db()
+    with metrics.SQLITE_SECONDS.labels("get_user_settings").time(), tracing.span("sqlite.get_user_settings"):
+        async with db.execute(
+            """SELECT uuid, stop_id, station_name, platform_numbers, refresh_minutes
+               FROM users WHERE uuid = ?""",
+            (uuid,),
+        ) as cursor:
+            row = await cursor.fetchone()
+    if row is None:
+        return None
 
+    user = UserSettings(
+        uuid=row["uuid"],
+        stop_id=row["stop_id"],
+        station_name=row["station_name"],
+        platform_numbers=row["platform_numbers"],
+        refresh_minutes=row["refresh_minutes"] or 5,
+    )
+    user_cache.set(uuid, user, time.time() + USER_CACHE_TTL_SECONDS)
+    return user
 
+
+def invalidate_user(uuid: str) -> None:
+    user_cache.pop(uuid)
+
+
+@_instrumented
 async def create_user(
     uuid: str,
     access_token: str,
@@ -75,19 +213,19 @@ async def create_user(
 ) -> dict:
     now = datetime.now(timezone.utc).isoformat()
     db = await _get_db()
-    try:
-        await db.execute(
-            """INSERT INTO users (uuid, access_token, plugin_setting_id,
-               user_name, user_email, time_zone, created_at, updated_at)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-            (uuid, access_token, plugin_setting_id, user_name, user_email, time_zone, now, now),
-        )
-        await db.commit()
-    finally:
-        await db.close()
-    return await get_user(uuid)
+    async with db.execute(
+        """INSERT INTO users (uuid, access_token, plugin_setting_id,
+           user_name, user_email, time_zone, created_at, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?) RETURNING *""",
+        (uuid, access_token, plugin_setting_id, user_name, user_email, time_zone, now, now),
+    ) as cursor:
+        row = await cursor.fetchone()
+    await db.commit()
+    invalidate_user(uuid)
+    return dict(row)
 
 
+@_instrumented
 async def update_user_token(
     uuid: str,
     access_token: str,
@@ -97,17 +235,16 @@ async def update_user_token(
     (e.g. after install/success webhook when user was auto-created by /manage)."""
     now = datetime.now(timezone.utc).isoformat()
     db = await _get_db()
-    try:
-        await db.execute(
-            """UPDATE users SET access_token = ?, plugin_setting_id = ?, updated_at = ?
-               WHERE uuid = ?""",
-            (access_token, plugin_setting_id, now, uuid),
-        )
-        await db.commit()
-    finally:
-        await db.close()
+    await db.execute(
+        """UPDATE users SET access_token = ?, plugin_setting_id = ?, updated_at = ?
+           WHERE uuid = ?""",
+        (access_token, plugin_setting_id, now, uuid),
+    )
+    await db.commit()
+    invalidate_user(uuid)
 
 
+@_instrumented
 async def update_user_settings(
     uuid: str,
     stop_id: int,
@@ -117,49 +254,212 @@ async def update_user_settings(
 ) -> dict | None:
     now = datetime.now(timezone.utc).isoformat()
     db = await _get_db()
-    try:
-        await db.execute(
-            """UPDATE users SET stop_id = ?, station_name = ?,
-               platform_numbers = ?, refresh_minutes = ?, updated_at = ? WHERE uuid = ?""",
-            (stop_id, station_name, platform_numbers, refresh_minutes, now, uuid),
-        )
-        await db.commit()
-    finally:
-        await db.close()
-    return await get_user(uuid)
+    async with db.execute(
+        """UPDATE users SET stop_id = ?, station_name = ?,
+           platform_numbers = ?, refresh_minutes = ?, updated_at = ? WHERE uuid = ?
+           RETURNING *""",
+        (stop_id, station_name, platform_numbers, refresh_minutes, now, uuid),
+    ) as cursor:
+        row = await cursor.fetchone()
+    await db.commit()
+    invalidate_user(uuid)
+    return dict(row) if row else None
 
 
-async def set_cached_departures(uuid: str, data: dict) -> None:
-    """Persist a fresh departure payload against the user for short cache reuse."""
-    now = datetime.now(timezone.utc).isoformat()
+@_instrumented
+async def get_board_subscriptions() -> list[dict]:
+    """Distinct (stop_id, platform_numbers) boards with their subscriber count
+    and the shortest refresh interval any subscriber asked for."""
     db = await _get_db()
-    try:
-        await db.execute(
-            "UPDATE users SET cached_departures = ?, cache_updated_at = ? WHERE uuid = ?",
-            (json.dumps(data), now, uuid),
-        )
-        await db.commit()
-    finally:
-        await db.close()
+    async with db.execute(
+        """SELECT stop_id, platform_numbers, COUNT(*) AS subscribers,
+                  MIN(COALESCE(refresh_minutes, 5)) AS refresh_minutes
+           FROM users GROUP BY stop_id, platform_numbers"""
+    ) as cursor:
+        return [dict(row) for row in await cursor.fetchall()]
 
 
-async def flush_cached_departures(uuid: str) -> None:
-    """Clear cached departure data for a user, forcing a fresh PTV fetch on next request."""
+@_instrumented
+async def get_departure_cache(cache_key: str) -> dict | None:
     db = await _get_db()
-    try:
-        await db.execute(
-            "UPDATE users SET cached_departures = NULL, cache_updated_at = NULL WHERE uuid = ?",
-            (uuid,),
+    async with db.execute(
+        "SELECT * FROM departure_cache WHERE cache_key = ?", (cache_key,)
+    ) as cursor:
+        row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+@_instrumented
+async def set_departure_cache(
+    cache_key: str,
+    stop_id: int,
+    platform_numbers: str | None,
+    data: dict,
+    fetched_at: datetime,
+    expires_at: datetime,
+) -> None:
+    """Persist a fresh departure payload shared by every user of this board."""
+    db = await _get_db()
+    await db.execute(
+        """INSERT OR REPLACE INTO departure_cache
+           (cache_key, stop_id, platform_numbers, payload, fetched_at, expires_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (
+            cache_key,
+            stop_id,
+            platform_numbers,
+            json.dumps(data),
+            fetched_at.isoformat(),
+            expires_at.isoformat(),
+        ),
+    )
+    await db.commit()
+
+
+@_instrumented
+async def get_route_topology(route_id: int, direction_id: int, route_type: int) -> dict | None:
+    db = await _get_db()
+    async with db.execute(
+        """SELECT * FROM route_topology
+           WHERE route_id = ? AND direction_id = ? AND route_type = ?""",
+        (route_id, direction_id, route_type),
+    ) as cursor:
+        row = await cursor.fetchone()
+    return dict(row) if row else None
+
+
+@_instrumented
+async def set_route_topology(
+    route_id: int,
+    direction_id: int,
+    route_type: int,
+    stops: list,
+    fetched_at: datetime,
+) -> None:
+    db = await _get_db()
+    await db.execute(
+        """INSERT OR REPLACE INTO route_topology
+           (route_id, direction_id, route_type, stops, fetched_at)
+           VALUES (?, ?, ?, ?, ?)""",
+        (route_id, direction_id, route_type, json.dumps(stops), fetched_at.isoformat()),
+    )
+    await db.commit()
+
+
+@_instrumented
+async def get_shared_value(namespace: str, key: str, now: float) -> str | None:
+    db = await _get_db()
+    async with db.execute(
+        """SELECT value FROM shared_state WHERE namespace = ? AND key = ?
+           AND (expires_at IS NULL OR expires_at > ?)""",
+        (namespace, key, now),
+    ) as cursor:
+        row = await cursor.fetchone()
+    return row["value"] if row else None
+
+
+@_instrumented
+async def set_shared_value(namespace: str, key: str, value: str, expires_at: float | None) -> None:
+    db = await _get_db()
+    await db.execute(
+        """INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at)
+           VALUES (?, ?, ?, ?)""",
+        (namespace, key, value, expires_at),
+    )
+    await db.commit()
+
+
+@_instrumented
+async def pop_shared_value(namespace: str, key: str, now: float) -> tuple[str | None, bool]:
+    """Delete a value and return ``(value, expired)``; the value is None when
+    the key was missing or had expired. Atomic across processes, so only
+    one caller ever receives a given value."""
+    db = await _get_db()
+    async with db.execute(
+        """DELETE FROM shared_state WHERE namespace = ? AND key = ?
+           RETURNING value, expires_at""",
+        (namespace, key),
+    ) as cursor:
+        row = await cursor.fetchone()
+    await db.commit()
+    if row is None:
+        return None, False
+    if row["expires_at"] is not None and row["expires_at"] <= now:
+        return None, True
+    return row["value"], False
+
+
+@_instrumented
+async def get_shared_values(namespace: str, now: float) -> dict[str, str]:
+    db = await _get_db()
+    async with db.execute(
+        """SELECT key, value FROM shared_state WHERE namespace = ?
+           AND (expires_at IS NULL OR expires_at > ?)""",
+        (namespace, now),
+    ) as cursor:
+        return {row["key"]: row["value"] for row in await cursor.fetchall()}
+
+
+@_instrumented
+async def delete_expired_shared_values(namespace: str | None, now: float) -> int:
+    db = await _get_db()
+    if namespace is None:
+        cursor = await db.execute(
+            "DELETE FROM shared_state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
         )
-        await db.commit()
-    finally:
-        await db.close()
+    else:
+        cursor = await db.execute(
+            """DELETE FROM shared_state WHERE namespace = ?
+               AND expires_at IS NOT NULL AND expires_at <= ?""",
+            (namespace, now),
+        )
+    await db.commit()
+    return cursor.rowcount
 
 
+@_instrumented
+async def trim_shared_values(namespace: str, max_entries: int) -> int:
+    """Delete the entries closest to expiry until at most ``max_entries`` remain."""
+    db = await _get_db()
+    cursor = await db.execute(
+        """DELETE FROM shared_state WHERE namespace = ? AND key IN (
+               SELECT key FROM shared_state WHERE namespace = ?
+               ORDER BY COALESCE(expires_at, 1e300)
+               LIMIT MAX(0, (SELECT COUNT(*) FROM shared_state WHERE namespace = ?) - ?)
+           )""",
+        (namespace, namespace, namespace, max_entries),
+    )
+    await db.commit()
+    return cursor.rowcount
+
+
+@_instrumented
+async def acquire_lease(name: str, holder: str, expires_at: float, now: float) -> bool:
+    """Take or renew a named lease. Succeeds when the lease is free, expired,
+    or already held by ``holder``."""
+    db = await _get_db()
+    async with db.execute(
+        """INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+           ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+           WHERE leases.holder = excluded.holder OR leases.expires_at <= ?
+           RETURNING holder""",
+        (name, holder, expires_at, now),
+    ) as cursor:
+        row = await cursor.fetchone()
+    await db.commit()
+    return row is not None
+
+
+@_instrumented
+async def release_lease(name: str, holder: str) -> None:
+    db = await _get_db()
+    await db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+    await db.commit()
+
+
+@_instrumented
 async def delete_user(uuid: str):
     db = await _get_db()
-    try:
-        await db.execute("DELETE FROM users WHERE uuid = ?", (uuid,))
-        await db.commit()
-    finally:
-        await db.close()
+    await db.execute("DELETE FROM users WHERE uuid = ?", (uuid,))
+    await db.commit()
+    invalidate_user(uuid)
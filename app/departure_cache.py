@@ -0,0 +1,88 @@
+"""Station-level departure cache shared by every user watching the same board.
+
+Entries are keyed by stop_id plus the platform filter, held in memory and
+persisted to the ``departure_cache`` table so they survive restarts and are
+shared with other worker processes.
+"""
+
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from . import database as db
+from . import tracing
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    data: dict
+    fetched_at: datetime
+    expires_at: datetime
+
+    def is_fresh(self, now: datetime | None = None) -> bool:
+        return (now or datetime.now(timezone.utc)) < self.expires_at
+
+
+_memory: dict[str, CacheEntry] = {}
+# Last database re-read of each expired memory entry (monotonic seconds).
+_rechecked: dict[str, float] = {}
+# Expired entries are re-read at most this often while they stay expired.
+RECHECK_SECONDS = 5.0
+
+
+def station_key(stop_id: int, platform_numbers: list[int] | None) -> str:
+    """Normalise a board to its cache key, e.g. ``1071:1,2`` or ``19843:``."""
+    platforms = ",".join(str(p) for p in sorted(set(platform_numbers or [])))
+    return f"{stop_id}:{platforms}"
+
+
+def _parse_row(row: dict) -> CacheEntry | None:
+    try:
+        return CacheEntry(
+            data=json.loads(row["payload"]),
+            fetched_at=datetime.fromisoformat(row["fetched_at"]),
+            expires_at=datetime.fromisoformat(row["expires_at"]),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+async def get(key: str) -> CacheEntry | None:
+    """Return the cached entry for a board (fresh or not), or None.
+
+    Expired memory entries are re-read from the database (at most every
+    RECHECK_SECONDS), since another worker process may already have
+    refreshed the board; in between, the stale memory entry is returned.
+    """
+    entry = _memory.get(key)
+    if entry is not None:
+        if entry.is_fresh():
+            return entry
+        now = time.monotonic()
+        if now - _rechecked.get(key, float("-inf")) < RECHECK_SECONDS:
+            return entry
+        _rechecked[key] = now
+
+    row = await db.get_departure_cache(key)
+    with tracing.span("cache.decode"):
+        stored = _parse_row(row) if row is not None else None
+    if stored is not None and (entry is None or stored.fetched_at > entry.fetched_at):
+        _memory[key] = entry = stored
+    return entry
+
+
+async def put(
+    key: str,
+    stop_id: int,
+    platform_numbers: list[int] | None,
+    data: dict,
+    fetched_at: datetime,
+    expires_at: datetime,
+) -> CacheEntry:
+    entry = CacheEntry(data=data, fetched_at=fetched_at, expires_at=expires_at)
+    _memory[key] = entry
+    _rechecked.pop(key, None)
+    platforms = ",".join(str(p) for p in platform_numbers) if platform_numbers else None
+    await db.set_departure_cache(key, stop_id, platforms, data, fetched_at, expires_at)
+    return entry
@@ -0,0 +1,37 @@
+import httpx
+
+from .config import settings
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_async_client(http2: bool | None = None) -> httpx.AsyncClient:
+    """Build a long-lived pooled client for one upstream.
+
+    Created once in the app lifespan and closed on shutdown so TCP/TLS
+    connections are kept alive between requests instead of being
+    renegotiated on every call.
+    """
+    use_http2 = settings.http2_enabled if http2 is None else http2
+    if use_http2 and not _http2_available():
+        print("[http] HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+        use_http2 = False
+
+    return httpx.AsyncClient(
+        http2=use_http2,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            settings.http_timeout_seconds,
+            connect=settings.http_connect_timeout_seconds,
+        ),
+    )
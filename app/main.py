@@ -1,6 +1,13 @@
+import asyncio
+import functools
+import gzip
+import hashlib
+import hmac
 import json
 import os
+import time
 from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from urllib.parse import quote
 from zoneinfo import ZoneInfo
@@ -9,27 +16,132 @@ import httpx
 import jinja2
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from fastapi import FastAPI, Form, Query, Request
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from . import budget, metrics, tracing
 from . import database as db
-from .config import settings
+from . import departure_cache
+from .config import PushTarget, settings
+from .adaptive_ttl import AdaptiveTTLPolicy
+from .cache import TTLCache
+from .circuit_breaker import CircuitBreaker
+from .http_clients import create_async_client
+from .minify import MinifyingLoader
+from .pending_settings import PendingSettingsStore
+from .profiler import ProfilerMiddleware, StackProfiler
 from .ptv_client import PTVClient
+from .rate_limiter import Priority, PriorityRateLimiter, priority, worker_share
+from .route_topology import RouteTopologyStore
+from .shared_state import WORKER_ID, create_shared_state
+from .singleflight import SingleFlight
+from .station_index import ReloadingStationIndex
+from .timetable import Timetable
 from .trmnl_client import TRMNLClient
 
 scheduler = AsyncIOScheduler()
 MELBOURNE_TZ = ZoneInfo("Australia/Melbourne")
 
-# Pending settings from setup page, keyed by access_token.
-# Applied when the /install/success webhook arrives.
-_pending_settings: dict[str, dict] = {}
+# Long-lived upstream clients, created and closed by the app lifespan.
+ptv_client: PTVClient | None = None
+push_http_client: httpx.AsyncClient | None = None
 
-# Jinja2 environment for server-side rendering
+# Local station search index; reloaded when its file changes.
+station_index = ReloadingStationIndex(settings.station_index_path)
+
+# Scheduled departures from the GTFS static feed, loaded by the lifespan.
+timetable: Timetable | None = None
+
+# Coalesces concurrent refreshes of the same board into one PTV fetch.
+_departure_flight = SingleFlight("departures")
+
+# State visible to every worker process (pending settings, board activity, leases).
+shared_state = create_shared_state(settings.shared_state_backend)
+
+# Setup-page settings awaiting the /install/success webhook (TTL + size bound).
+pending_settings = PendingSettingsStore(
+    shared_state,
+    ttl_seconds=settings.pending_settings_ttl_seconds,
+    max_entries=settings.pending_settings_max_entries,
+)
+
+# Whether this worker holds the scheduler lease and runs push/prefetch jobs.
+_is_leader = False
+_LEADER_LEASE = "scheduler"
+
+# Boards polled by devices are recorded in shared state (namespace
+# "board_seen") for the prefetcher; this throttles the writes per worker.
+_BOARD_SEEN_WRITE_SECONDS = 30
+_board_seen_written: dict[str, float] = {}
+
+# Background stale-while-revalidate refreshes; referenced until they finish.
+_revalidations: set[asyncio.Task] = set()
+
+# Bounds concurrent PTV board fetches; excess requests are shed rather than queued.
+_upstream_gate = budget.AdmissionGate(
+    max_concurrent=settings.upstream_fetch_concurrency,
+    max_waiting=settings.upstream_fetch_queue,
+)
+
+# TRMNL expects these exact keys
+_LAYOUT_MAP = {
+    "markup": "full",
+    "markup_half_horizontal": "half_horizontal",
+    "markup_half_vertical": "half_vertical",
+    "markup_quadrant": "quadrant",
+}
+
+# Jinja2 environment for server-side rendering. Markup templates have their
+# CSS and indentation minified once when first compiled (see _prepare_templates).
 _template_dir = os.path.join(os.path.dirname(__file__), "templates")
+_template_loader = MinifyingLoader(
+    _template_dir,
+    minify={f"{name}.html" for name in _LAYOUT_MAP.values()},
+)
 jinja_env = jinja2.Environment(
-    loader=jinja2.FileSystemLoader(_template_dir),
+    loader=_template_loader,
     autoescape=False,
 )
 
+# Response compressors for /trmnl/markup, in order of preference.
+_COMPRESSORS = {}
+try:
+    import brotli
+
+    _COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+except ImportError:
+    pass
+_COMPRESSORS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+_MIN_COMPRESS_BYTES = 512
+
+# Running totals of /trmnl/markup body sizes before and after compression.
+markup_transfer_stats = {"responses": 0, "raw_bytes": 0, "sent_bytes": 0}
+
+# Per-board cache TTLs learned from headways and realtime update frequency.
+ttl_policy = AdaptiveTTLPolicy(
+    min_seconds=settings.adaptive_ttl_min_seconds,
+    max_seconds=settings.adaptive_ttl_max_seconds,
+)
+
+# Finished /trmnl/markup bodies keyed by a fingerprint of the render context,
+# shared by every user on the same board within the same refresh slot.
+markup_cache = TTLCache(settings.markup_cache_size)
+
+# Opt-in stack sampler for sampled requests and admin-triggered windows.
+profiler = (
+    StackProfiler(settings.profile_dir, settings.profile_interval_ms, settings.profile_max_files)
+    if settings.profiler_enabled
+    else None
+)
+
+
+def _worker_count() -> int:
+    return max(1, settings.web_concurrency)
+
+
+def _limiter_share(leader: bool) -> tuple[float, int]:
+    return worker_share(settings.ptv_rate_per_second, settings.ptv_rate_burst, _worker_count(), leader)
+
 
 def _clamped_seconds(value: int | None, default: int) -> int:
     if value is None:
@@ -49,11 +161,13 @@ def _parse_instant(raw: str | None) -> datetime | None:
     return parsed.astimezone(timezone.utc)
 
 
-def _cache_expires_at(data: dict, fetched_at: datetime) -> datetime:
-    """Return the earliest time cached transit data must be considered stale."""
-    candidates = [
-        fetched_at + timedelta(seconds=_clamped_seconds(settings.public_cache_seconds, 60)),
-    ]
+def _expires_with(data: dict, fetched_at: datetime, ttl_seconds: float, empty_seconds: float) -> datetime:
+    candidates = [fetched_at + timedelta(seconds=ttl_seconds)]
+
+    if data.get("degraded"):
+        # Missing stopping pattern: retry soon rather than caching the gap.
+        degraded_ttl = _clamped_seconds(settings.no_departures_cache_seconds, 30)
+        candidates.append(fetched_at + timedelta(seconds=degraded_ttl))
 
     departures = data.get("departures") or []
     if departures:
@@ -66,12 +180,28 @@ def _cache_expires_at(data: dict, fetched_at: datetime) -> datetime:
             grace = _clamped_seconds(settings.departure_cache_grace_seconds, 60)
             candidates.append(departure_at + timedelta(seconds=grace))
     else:
-        no_departures_ttl = _clamped_seconds(settings.no_departures_cache_seconds, 30)
-        candidates.append(fetched_at + timedelta(seconds=no_departures_ttl))
+        candidates.append(fetched_at + timedelta(seconds=empty_seconds))
 
     return min(candidates)
 
 
+def _cache_expires_at(data: dict, fetched_at: datetime, key: str | None = None) -> datetime:
+    """Return the earliest time cached transit data must be considered stale.
+
+    With a board key and ADAPTIVE_TTL_ENABLED, the fixed TTLs are replaced by
+    ones learned for that board (see app/adaptive_ttl.py).
+    """
+    ttl = _clamped_seconds(settings.public_cache_seconds, 60)
+    empty_ttl = _clamped_seconds(settings.no_departures_cache_seconds, 30)
+    baseline = _expires_with(data, fetched_at, ttl, empty_ttl)
+    if key is None or not settings.adaptive_ttl_enabled:
+        return baseline
+
+    adaptive = _expires_with(data, fetched_at, *ttl_policy.ttl_seconds(key, data, fetched_at, ttl, empty_ttl))
+    ttl_policy.record(key, baseline - fetched_at, adaptive - fetched_at)
+    return adaptive
+
+
 def _should_force_refresh(request: Request, form=None) -> bool:
     truthy = {"1", "true", "yes", "on"}
     keys = ("force_refresh", "refresh", "force")
@@ -95,50 +225,94 @@ def _should_force_refresh(request: Request, form=None) -> bool:
     return False
 
 
-def _build_render_context(data: dict) -> dict:
-    """Attach render metadata without persisting it into the PTV cache."""
+def _build_render_context(data: dict, station_name: str, is_stale: bool = False) -> dict:
+    """Attach the user's station name and render metadata without persisting
+    them into the shared PTV cache."""
     now_utc = datetime.now(timezone.utc)
     freshness_seconds = _clamped_seconds(settings.render_freshness_seconds, 60) or 1
     render_slot = int(now_utc.timestamp() // freshness_seconds)
     rendered_at_utc = datetime.fromtimestamp(render_slot * freshness_seconds, tz=timezone.utc)
     context = dict(data)
+    context["station_name"] = station_name
     context["rendered_at_utc"] = rendered_at_utc.isoformat()
     context["rendered_at"] = rendered_at_utc.astimezone(MELBOURNE_TZ).strftime("%I:%M %p").lstrip("0").lower()
     context["refresh_slot"] = render_slot
+    context["is_stale"] = is_stale
     return context
 
 
+def _stop_columns(stops: list[dict], per_col: int = 6, max_cols: int = 4) -> list[list[dict]]:
+    """Chunk the stopping pattern into the display's stop columns."""
+    return [
+        [{"name": s["name"], "is_current": s["is_current"], "is_express": s["is_express"]}
+         for s in stops[i:i + per_col]]
+        for i in range(0, min(len(stops), per_col * max_cols), per_col)
+    ]
+
+
+_PATTERN_BUDGET_RESERVE_SECONDS = 0.5
+_REVALIDATE_LEASE_SECONDS = 30
+# After a failed revalidation, stale polls keep serving the cached board
+# without retrying PTV for this long; a lease held by another worker is
+# left to that worker for a few seconds.
+_REVALIDATE_FAILURE_BACKOFF_SECONDS = 30
+_REVALIDATE_LEASE_MISS_BACKOFF_SECONDS = 5
+_revalidating: set[str] = set()
+_revalidate_backoff: dict[str, float] = {}
+
+
 async def fetch_departure_data(
     stop_id: int,
     platform_numbers: list[int] | None = None,
 ) -> dict:
-    """Fetch PTV departures + stopping pattern — shared by push mode and markup endpoint."""
-    ptv = PTVClient(settings.ptv_dev_id, settings.ptv_api_key)
+    """Fetch PTV departures + stopping pattern — shared by push mode and markup endpoint.
 
-    departures = await ptv.get_departures(
-        stop_id=stop_id,
-        route_type=0,
-        max_results=6,
-        platform_numbers=platform_numbers,
-    )
+    Falls back to the GTFS timetable (when loaded) if PTV fails or has no
+    departures for the stop.
+    """
+    now = datetime.now(timezone.utc)
+    degraded = False
+    scheduled = False
+    if (
+        timetable is not None
+        and settings.gtfs_skip_live_in_gaps
+        and timetable.in_service_gap(stop_id, platform_numbers, now, settings.gtfs_gap_minutes)
+    ):
+        departures = timetable.next_departures(stop_id, platform_numbers, now)
+        scheduled = True
+    else:
+        try:
+            departures = await ptv_client.get_departures(
+                stop_id=stop_id,
+                route_type=0,
+                max_results=6,
+                platform_numbers=platform_numbers,
+            )
+        except Exception as exc:
+            if timetable is None or not timetable.has_stop(stop_id):
+                raise
+            print(f"[timetable] PTV failed for stop {stop_id} ({exc!r}), serving scheduled departures")
+            departures = timetable.next_departures(stop_id, platform_numbers, now)
+            scheduled = degraded = True
+        else:
+            if not departures and timetable is not None:
+                departures = timetable.next_departures(stop_id, platform_numbers, now)
+                scheduled = bool(departures)
 
     stops = []
-    if departures:
+    if departures and not scheduled:
         try:
-            stops = await ptv.get_stopping_pattern(
-                run_ref=departures[0]["run_ref"],
-                current_stop_id=stop_id,
-            )
+            # Leave part of the request budget for serving the departures
+            # alone if the pattern lookup is what runs out of time.
+            with budget.reserve(_PATTERN_BUDGET_RESERVE_SECONDS):
+                stops = await ptv_client.get_stopping_pattern(
+                    run_ref=departures[0]["run_ref"],
+                    current_stop_id=stop_id,
+                )
         except Exception:
-            pass  # Degrade gracefully — departures still shown without pattern
-
-    per_col = 6
-    max_cols = 4
-    stop_columns = [
-        [{"name": s["name"], "is_current": s["is_current"], "is_express": s["is_express"]}
-         for s in stops[i:i + per_col]]
-        for i in range(0, min(len(stops), per_col * max_cols), per_col)
-    ]
+            # Degrade gracefully — departures still shown without pattern
+            # (including when the request budget ran out before the pattern).
+            degraded = True
 
     return {
         "departures": [
@@ -154,8 +328,22 @@ async def fetch_departure_data(
             }
             for d in departures
         ],
-        "stop_columns": stop_columns,
+        "stop_columns": _stop_columns(stops),
         "updated_at": datetime.now(timezone.utc).astimezone(MELBOURNE_TZ).strftime("%I:%M %p").lstrip("0").lower(),
+        "degraded": degraded,
+        "scheduled": scheduled,
+    }
+
+
+def _unavailable_board() -> dict:
+    """Empty board rendered when PTV cannot answer within the request budget
+    and nothing servable is cached."""
+    return {
+        "departures": [],
+        "stop_columns": [],
+        "updated_at": datetime.now(timezone.utc).astimezone(MELBOURNE_TZ).strftime("%I:%M %p").lstrip("0").lower(),
+        "degraded": True,
+        "scheduled": False,
     }
 
 
@@ -165,76 +353,450 @@ def _parse_platforms(raw: str | None) -> list[int] | None:
     return [int(p.strip()) for p in raw.split(",") if p.strip()]
 
 
-async def _get_fresh_data(user: dict, force_refresh: bool = False) -> dict:
-    """Return this user's departure data, using the DB cache only while the
-    cached payload is still valid for the visible transit state."""
-    cache_updated_at = user.get("cache_updated_at")
+async def _get_fresh_data(user: db.UserSettings, force_refresh: bool = False) -> tuple[dict, bool]:
+    """Return ``(data, is_stale)`` for this user's board.
 
-    if not force_refresh and cache_updated_at:
-        last_fetch = _parse_instant(cache_updated_at)
-        cached_json = user.get("cached_departures")
-        if last_fetch is not None and cached_json:
+    Fresh shared-cache entries are returned as-is. An expired entry still
+    within STALE_MAX_SECONDS is served immediately (flagged stale) while the
+    board is refreshed in the background; it is also the fallback when a
+    blocking refresh fails. The returned dict is shared and must not be mutated.
+    """
+    stop_id = user.stop_id
+    platform_numbers = _parse_platforms(user.platform_numbers)
+    key = departure_cache.station_key(stop_id, platform_numbers)
+    await _mark_board_seen(key)
+
+    entry = await departure_cache.get(key)
+    now = datetime.now(timezone.utc)
+    stale_limit = timedelta(seconds=_clamped_seconds(settings.stale_max_seconds, 600))
+    servable = entry if entry is not None and now - entry.expires_at <= stale_limit else None
+
+    if not force_refresh and entry is not None:
+        if entry.is_fresh(now):
+            metrics.BOARD_CACHE_LOOKUPS.labels("hit").inc()
+            return entry.data, False
+        if servable is not None:
+            metrics.BOARD_CACHE_LOOKUPS.labels("stale").inc()
+            _revalidate_in_background(stop_id, platform_numbers)
+            return servable.data, True
+    if not force_refresh:
+        metrics.BOARD_CACHE_LOOKUPS.labels("miss" if entry is None else "expired").inc()
+
+    # Cache miss or too stale — fetch a fresh batch from PTV for everyone on this board.
+    # The wait is bounded by the request deadline; the shared fetch keeps
+    # running for other waiters and refreshes the cache when it lands.
+    try:
+        async with asyncio.timeout(budget.remaining()):
+            return await _refresh_board(stop_id, platform_numbers), False
+    except Exception as exc:
+        if servable is None:
+            raise
+        print(f"[markup] refresh of {key} failed, serving stale data: {exc!r}")
+        return servable.data, True
+
+
+async def _mark_board_seen(key: str):
+    now = time.time()
+    write_every = min(_BOARD_SEEN_WRITE_SECONDS, settings.prefetch_active_window_seconds / 2)
+    if now - _board_seen_written.get(key, 0.0) < write_every:
+        return
+    _board_seen_written[key] = now
+    try:
+        await shared_state.set("board_seen", key, now, ttl_seconds=settings.prefetch_active_window_seconds)
+    except Exception as exc:
+        print(f"[shared] failed to record board activity for {key}: {exc!r}")
+
+
+def _revalidate_in_background(stop_id: int, platform_numbers: list[int] | None):
+    key = departure_cache.station_key(stop_id, platform_numbers)
+    # Cheap in-process checks first: a refresh already running here, or a
+    # recent failure / lease held elsewhere, skips the shared lease entirely.
+    if _departure_flight.running(key) or key in _revalidating:
+        return
+    if time.monotonic() < _revalidate_backoff.get(key, 0.0):
+        return
+    _revalidating.add(key)
+
+    async def revalidate():
+        budget.clear_deadline()  # Not bound by the request that triggered it
+        tracing.detach()
+        # Another worker may already be refreshing this board.
+        lease = f"refresh:{key}"
+        try:
+            if not await shared_state.acquire_lease(lease, WORKER_ID, _REVALIDATE_LEASE_SECONDS):
+                _revalidate_backoff[key] = time.monotonic() + _REVALIDATE_LEASE_MISS_BACKOFF_SECONDS
+                return
             try:
-                cached_data = json.loads(cached_json)
-            except (TypeError, json.JSONDecodeError):
-                cached_data = None
-            if cached_data is not None:
-                now = datetime.now(timezone.utc)
-                if now < _cache_expires_at(cached_data, last_fetch):
-                    return cached_data
-
-    # Cache miss or expired — fetch a fresh batch from PTV.
-    platform_numbers = _parse_platforms(user.get("platform_numbers"))
-    data = await fetch_departure_data(stop_id=user["stop_id"], platform_numbers=platform_numbers)
-    data["station_name"] = user["station_name"]
-    await db.set_cached_departures(user["uuid"], data)
-    return data
-
-
-# ── Push mode (optional, active when TRMNL_WEBHOOK_URL is set) ──────────────
-
-async def push_departures_to_trmnl():
-    """Fetch PTV data and push to TRMNL webhook."""
-    platform_numbers = _parse_platforms(settings.platform_numbers)
-
-    data = await fetch_departure_data(
-        stop_id=settings.default_stop_id,
-        platform_numbers=platform_numbers,
-    )
-    data["station_name"] = settings.station_name
+                with priority(Priority.BACKGROUND):
+                    await _refresh_board(stop_id, platform_numbers)
+                _revalidate_backoff.pop(key, None)
+            finally:
+                await shared_state.release_lease(lease, WORKER_ID)
+        except Exception as exc:
+            _revalidate_backoff[key] = time.monotonic() + _REVALIDATE_FAILURE_BACKOFF_SECONDS
+            print(f"[revalidate] stop_id={stop_id} failed: {exc!r}")
+        finally:
+            _revalidating.discard(key)
+
+    task = asyncio.create_task(revalidate())
+    _revalidations.add(task)
+    task.add_done_callback(_revalidations.discard)
+
+
+async def _refresh_board(stop_id: int, platform_numbers: list[int] | None) -> dict:
+    """Fetch a board from PTV and store it in the shared cache.
+
+    Concurrent refreshes of the same board (e.g. every device polling just
+    after expiry) await a single in-flight fetch instead of each calling PTV.
+    """
+    key = departure_cache.station_key(stop_id, platform_numbers)
+
+    async def refresh() -> dict:
+        async with _upstream_gate.admit():
+            data = await fetch_departure_data(stop_id=stop_id, platform_numbers=platform_numbers)
+        fetched_at = datetime.now(timezone.utc)
+        ttl_policy.observe(key, data, fetched_at)
+        await departure_cache.put(
+            key, stop_id, platform_numbers, data, fetched_at, _cache_expires_at(data, fetched_at, key)
+        )
+        return data
+
+    return await _departure_flight.do(key, refresh)
+
+
+# ── Background prefetch (public plugin mode) ─────────────────────────────────
+
+# PTV calls charged per board refresh: departures + stopping pattern.
+_PREFETCH_CALLS_PER_BOARD = 2
+_prefetch_window = {"started": 0.0, "calls": 0}
+
+
+def _prefetch_budget_remaining() -> int:
+    now = time.monotonic()
+    if now - _prefetch_window["started"] >= 60:
+        _prefetch_window["started"] = now
+        _prefetch_window["calls"] = 0
+    return max(0, settings.prefetch_ptv_budget_per_minute - _prefetch_window["calls"])
 
-    trmnl = TRMNLClient(settings.trmnl_webhook_url)
-    await trmnl.push_data(data)
-    print(f"Pushed {len(data['departures'])} departures to TRMNL")
+
+async def prefetch_popular_boards():
+    """Refresh shared cache entries for actively polled boards just before
+    their next expected poll, so markup requests are served from cache.
+
+    A board is due when its next poll (last seen + the shortest subscriber
+    refresh interval) falls within PREFETCH_LEAD_SECONDS and its entry will
+    have expired by then; boards are therefore fetched about once per poll,
+    not once per cache TTL. Due boards are ranked by subscribers per refresh
+    minute and refreshed within the per-minute PTV budget with bounded
+    concurrency.
+    """
+    active = await shared_state.items("board_seen")
+    if not active:
+        return
+
+    boards: dict[str, dict] = {}
+    for row in await db.get_board_subscriptions():
+        platform_numbers = _parse_platforms(row["platform_numbers"])
+        key = departure_cache.station_key(row["stop_id"], platform_numbers)
+        if key not in active:
+            continue
+        board = boards.setdefault(key, {
+            "stop_id": row["stop_id"],
+            "platform_numbers": platform_numbers,
+            "subscribers": 0,
+            "refresh_minutes": row["refresh_minutes"],
+        })
+        board["subscribers"] += row["subscribers"]
+        board["refresh_minutes"] = min(board["refresh_minutes"], row["refresh_minutes"])
+
+    now = time.time()
+    due = []
+    for key, board in boards.items():
+        next_poll = float(active[key]) + board["refresh_minutes"] * 60
+        # Activity is recorded at most every _BOARD_SEEN_WRITE_SECONDS, so
+        # the predicted poll may be that much early.
+        if not now - _BOARD_SEEN_WRITE_SECONDS <= next_poll <= now + settings.prefetch_lead_seconds:
+            continue
+        entry = await departure_cache.get(key)
+        if entry is None or entry.expires_at.timestamp() <= next_poll:
+            due.append(board)
+    if not due:
+        return
+
+    due.sort(key=lambda b: b["subscribers"] / max(1, b["refresh_minutes"]), reverse=True)
+    affordable = _prefetch_budget_remaining() // _PREFETCH_CALLS_PER_BOARD
+    due = due[:affordable]
+    _prefetch_window["calls"] += len(due) * _PREFETCH_CALLS_PER_BOARD
+
+    semaphore = asyncio.Semaphore(max(1, settings.prefetch_concurrency))
+
+    async def refresh(board: dict):
+        async with semaphore:
+            try:
+                with priority(Priority.BACKGROUND):
+                    await _refresh_board(board["stop_id"], board["platform_numbers"])
+            except Exception as exc:
+                print(f"[prefetch] stop_id={board['stop_id']} failed: {exc!r}")
+
+    await asyncio.gather(*(refresh(board) for board in due))
+
+
+# ── Push mode (optional, active when TRMNL_WEBHOOK_URL or PUSH_TARGETS is set) ─
+
+# Push-mode displays, resolved from settings by the lifespan.
+push_targets: list[PushTarget] = []
+
+# Last payload pushed to each webhook, with its fingerprint. Unchanged boards
+# are skipped and changed ones send only the keys that differ.
+_last_pushed: dict[str, tuple[bytes, dict]] = {}
+
+# Keys that change on every refresh and do not make a board worth pushing.
+_PUSH_VOLATILE_KEYS = frozenset({"updated_at"})
+
+_PUSH_OUTCOMES = ("pushed", "merged", "skipped", "failed")
+
+
+def _configured_push_targets() -> list[PushTarget]:
+    targets = list(settings.push_targets)
+    if settings.trmnl_webhook_url:
+        targets.insert(0, PushTarget(
+            webhook_url=settings.trmnl_webhook_url,
+            stop_id=settings.default_stop_id,
+            station_name=settings.station_name,
+            platform_numbers=settings.platform_numbers,
+        ))
+    return targets
+
+
+def _push_fingerprint(data: dict) -> bytes:
+    stable = {k: v for k, v in data.items() if k not in _PUSH_VOLATILE_KEYS}
+    return hashlib.blake2b(
+        json.dumps(stable, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+async def _push_target(target: PushTarget) -> str:
+    """Refresh one target's board and push it if it changed. The first push
+    to a webhook replaces its variables; later ones deep-merge the changed keys."""
+    with priority(Priority.SCHEDULED):
+        board = await _refresh_board(target.stop_id, _parse_platforms(target.platform_numbers))
+    data = {**board, "station_name": target.station_name}
+
+    fingerprint = _push_fingerprint(data)
+    previous = _last_pushed.get(target.webhook_url)
+    if previous is not None and previous[0] == fingerprint:
+        return "skipped"
+
+    client = TRMNLClient(target.webhook_url, client=push_http_client)
+    if previous is None:
+        await client.push_data(data)
+        outcome = "pushed"
+    else:
+        changed = {k: v for k, v in data.items() if previous[1].get(k) != v}
+        await client.push_data(changed, strategy="deep_merge")
+        outcome = "merged"
+    _last_pushed[target.webhook_url] = (fingerprint, data)
+    return outcome
+
+
+async def push_departures_to_trmnl() -> dict:
+    """Fetch every push target's board and push changed ones to TRMNL,
+    at most PUSH_CONCURRENCY at a time."""
+    semaphore = asyncio.Semaphore(max(1, settings.push_concurrency))
+
+    async def run(target: PushTarget) -> str:
+        async with semaphore:
+            try:
+                outcome = await _push_target(target)
+            except Exception as exc:
+                print(f"[push] {target.station_name} (stop {target.stop_id}) failed: {exc!r}")
+                outcome = "failed"
+        metrics.PUSHES.labels(outcome).inc()
+        return outcome
+
+    outcomes = await asyncio.gather(*(run(target) for target in push_targets))
+    summary = {key: outcomes.count(key) for key in _PUSH_OUTCOMES}
+    print(f"[push] {len(outcomes)} targets: " + ", ".join(f"{n} {key}" for key, n in summary.items()))
+    return summary
+
+
+# ── Leader election (multi-worker) ───────────────────────────────────────────
+
+async def _renew_leadership() -> bool:
+    """Take or keep the scheduler lease so only one worker process runs the
+    push and prefetch jobs."""
+    global _is_leader
+    try:
+        held = await shared_state.acquire_lease(_LEADER_LEASE, WORKER_ID, settings.leader_lease_seconds)
+    except Exception as exc:
+        print(f"[leader] lease renewal failed: {exc!r}")
+        held = False
+    if held != _is_leader:
+        print(f"[leader] {WORKER_ID} {'acquired' if held else 'lost'} the scheduler lease")
+        if ptv_client is not None and ptv_client.limiter is not None:
+            ptv_client.limiter.resize(*_limiter_share(leader=held))
+    _is_leader = held
+    return held
+
+
+async def sweep_shared_state():
+    """Delete expired pending settings and other expired shared entries."""
+    pending = await pending_settings.sweep()
+    other = await shared_state.sweep()
+    if pending or other:
+        print(f"[shared] swept {pending} expired pending settings, {other} other entries")
+
+
+def _leader_only(job):
+    @functools.wraps(job)
+    async def run():
+        if _is_leader:
+            await job()
+    return run
 
 
 # ── Lifespan ─────────────────────────────────────────────────────────────────
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global ptv_client, push_http_client, push_targets, timetable
+
+    ptv_client = PTVClient(
+        settings.ptv_dev_id,
+        settings.ptv_api_key,
+        client=create_async_client(),
+        pattern_cache_size=settings.pattern_cache_size,
+        pattern_cache_grace_seconds=settings.pattern_cache_grace_seconds,
+        pattern_cache_max_seconds=settings.pattern_cache_max_seconds,
+        pattern_single_request=settings.pattern_single_request,
+        breaker=CircuitBreaker(
+            "ptv",
+            failure_threshold=settings.ptv_breaker_failure_threshold,
+            reset_seconds=settings.ptv_breaker_reset_seconds,
+        ),
+        # Each worker gets a share of the PTV budget so the total across
+        # WEB_CONCURRENCY processes stays within it; the share is resized
+        # when this worker gains or loses the scheduler lease.
+        limiter=PriorityRateLimiter(
+            *_limiter_share(leader=False),
+            reserve={
+                Priority.SEARCH: settings.ptv_search_reserve,
+                Priority.SCHEDULED: settings.ptv_scheduled_reserve,
+                Priority.BACKGROUND: settings.ptv_background_reserve,
+            },
+            max_wait={
+                Priority.INTERACTIVE: settings.ptv_interactive_max_wait_seconds,
+                Priority.SEARCH: settings.ptv_search_max_wait_seconds,
+                Priority.SCHEDULED: settings.ptv_scheduled_max_wait_seconds,
+                Priority.BACKGROUND: settings.ptv_background_max_wait_seconds,
+            },
+        ),
+        topology_store=RouteTopologyStore(settings.route_topology_ttl_seconds),
+        base_url=settings.ptv_base_url,
+    )
+    push_targets = _configured_push_targets()
+    if push_targets:
+        push_http_client = create_async_client()
+
+    metrics.stats_collector.add("ptv_breaker", ptv_client.breaker.stats)
+    metrics.stats_collector.add("ptv_rate_limiter", ptv_client.limiter.stats)
+    metrics.stats_collector.add("pattern_cache", ptv_client.pattern_cache.stats)
+    metrics.stats_collector.add("pattern_singleflight", ptv_client.pattern_flight.stats)
+
+    _prepare_templates()
+    station_index.reload(force=True)
+    if settings.gtfs_path:
+        index = station_index.current()
+        names = dict(zip(index.names, index.stop_ids)) if index is not None else None
+        if names is None:
+            print("[timetable] no station index; GTFS stops cannot be matched to PTV stop ids")
+        try:
+            timetable = await asyncio.to_thread(Timetable.load, settings.gtfs_path, settings.gtfs_member, names)
+            print(f"[timetable] loaded {len(timetable)} stop times for {len(timetable.stop_slices)} stops")
+        except Exception as exc:
+            print(f"[timetable] failed to load {settings.gtfs_path}: {exc!r}")
+
     # Always init database
     db.DATABASE_PATH = settings.database_path
+    db.SQLITE_SYNCHRONOUS = settings.sqlite_synchronous
+    db.SQLITE_BUSY_TIMEOUT_MS = settings.sqlite_busy_timeout_ms
+    db.USER_CACHE_TTL_SECONDS = settings.user_cache_ttl_seconds
+    if _worker_count() > 1:
+        # /manage/save only invalidates the cache of the worker serving it.
+        db.USER_CACHE_TTL_SECONDS = min(
+            db.USER_CACHE_TTL_SECONDS, settings.multi_worker_user_cache_ttl_seconds
+        )
+    db.user_cache = TTLCache(settings.user_cache_size)
     await db.init_db()
 
-    # Only start scheduler if webhook URL is configured (private/push mode)
-    if settings.trmnl_webhook_url:
-        await push_departures_to_trmnl()
+    await _renew_leadership()
+
+    # Push job only if push targets are configured (private/push mode)
+    if push_targets:
+        if _is_leader:
+            await push_departures_to_trmnl()
         scheduler.add_job(
-            push_departures_to_trmnl,
+            _leader_only(push_departures_to_trmnl),
             "interval",
             minutes=settings.refresh_minutes,
             id="ptv_refresh",
         )
-        scheduler.start()
+
+    if settings.prefetch_enabled:
+        scheduler.add_job(
+            _leader_only(prefetch_popular_boards),
+            "interval",
+            seconds=max(1, settings.prefetch_interval_seconds),
+            id="ptv_prefetch",
+            max_instances=1,
+            coalesce=True,
+        )
+
+    scheduler.add_job(
+        _leader_only(sweep_shared_state),
+        "interval",
+        seconds=max(1, settings.shared_state_sweep_seconds),
+        id="shared_state_sweep",
+        max_instances=1,
+        coalesce=True,
+    )
+
+    scheduler.add_job(
+        _renew_leadership,
+        "interval",
+        seconds=max(1, settings.leader_lease_seconds // 3),
+        id="leader_lease",
+        max_instances=1,
+        coalesce=True,
+    )
+    scheduler.start()
 
     yield
 
     if scheduler.running:
         scheduler.shutdown()
+    if _is_leader:
+        await shared_state.release_lease(_LEADER_LEASE, WORKER_ID)
+
+    if profiler is not None:
+        await asyncio.to_thread(profiler.stop)
+    await ptv_client.aclose()
+    if push_http_client is not None:
+        await push_http_client.aclose()
+    await db.close_db()
 
 
 app = FastAPI(lifespan=lifespan)
 
+metrics.stats_collector.add("departures_singleflight", _departure_flight.stats)
+metrics.stats_collector.add("markup_cache", markup_cache.stats)
+metrics.stats_collector.add("markup_transfer", lambda: markup_transfer_stats)
+metrics.stats_collector.add("user_cache", lambda: db.user_cache.stats())
+metrics.stats_collector.add("upstream_gate", _upstream_gate.stats)
+metrics.stats_collector.add("pending_settings", pending_settings.stats)
+metrics.stats_collector.add("leader", lambda: {"is_leader": _is_leader})
+
 
 # ── Health ───────────────────────────────────────────────────────────────────
 
@@ -243,13 +805,62 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics for this worker process."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def _admin_error(request: Request) -> JSONResponse | None:
+    """Reject the request unless it carries ``Authorization: Bearer <ADMIN_TOKEN>``."""
+    if not settings.admin_token:
+        return JSONResponse({"error": "Admin endpoints disabled"}, status_code=404)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip(), settings.admin_token):
+        return JSONResponse({"error": "Unauthorized"}, status_code=401)
+    return None
+
+
+@app.get("/admin/profile")
+async def profile_status(request: Request):
+    """Open profiling window and recently written profiles for this worker."""
+    error = _admin_error(request)
+    if error is not None:
+        return error
+    if profiler is None:
+        return JSONResponse({"error": "Profiler not enabled"}, status_code=404)
+    window = profiler.window()
+    return {
+        "worker": WORKER_ID,
+        "window_seconds_left": round(window.until - time.monotonic(), 1) if window is not None else None,
+        "sample_rate": settings.profile_sample_rate,
+        "profiles": profiler.written,
+    }
+
+
+@app.post("/admin/profile")
+async def profile_window(request: Request, seconds: float = Query(30.0, gt=0)):
+    """Profile every request this worker serves for the next ``seconds``."""
+    error = _admin_error(request)
+    if error is not None:
+        return error
+    if profiler is None:
+        return JSONResponse({"error": "Profiler not enabled"}, status_code=404)
+    if profiler.window() is not None:
+        return JSONResponse({"error": "A profiling window is already open"}, status_code=409)
+    seconds = min(seconds, settings.profile_max_window_seconds)
+    profiler.start("window", seconds)
+    print(f"[profiler] {WORKER_ID} profiling all requests for {seconds:g}s")
+    return {"status": "profiling", "worker": WORKER_ID, "seconds": seconds, "output_dir": settings.profile_dir}
+
+
 @app.post("/refresh")
 async def manual_refresh():
     """Manually trigger a push-mode refresh."""
-    if not settings.trmnl_webhook_url:
+    if not push_targets:
         return JSONResponse({"error": "Push mode not configured"}, status_code=400)
-    await push_departures_to_trmnl()
-    return {"status": "refreshed"}
+    summary = await push_departures_to_trmnl()
+    return {"status": "refreshed", **summary}
 
 
 # ── OAuth install flow ───────────────────────────────────────────────────────
@@ -317,15 +928,13 @@ async def setup_save(
     """Store pending settings and redirect to TRMNL callback to complete install."""
     print(f"[setup/save] token_prefix={token[:12] if token else '(empty)'}..., stop_id={stop_id}, station={station_name}")
     if token:
-        # Guard against unbounded growth
-        if len(_pending_settings) > 1000:
-            _pending_settings.clear()
-        _pending_settings[token] = {
+        # Shared so whichever worker receives /install/success can apply them
+        await pending_settings.put(token, {
             "stop_id": stop_id,
             "station_name": station_name,
             "platform_numbers": platform_numbers.strip() or None,
             "refresh_minutes": max(1, refresh_minutes),
-        }
+        })
     return RedirectResponse(url=callback_url, status_code=302)
 
 
@@ -366,7 +975,7 @@ async def install_success(request: Request):
         )
 
     # Apply any pending settings from the setup page
-    pending = _pending_settings.pop(access_token, None)
+    pending = await pending_settings.pop(access_token)
     print(f"[install/success] pending settings found: {pending is not None}")
     if pending:
         await db.update_user_settings(
@@ -403,7 +1012,17 @@ async def trmnl_markup(request: Request):
 
     TRMNL sends application/x-www-form-urlencoded with user_uuid field.
     Response must use keys: markup, markup_half_horizontal, markup_half_vertical, markup_quadrant.
+    Sampled requests (TRACE_SAMPLE_RATE) get a Server-Timing header and a
+    JSON trace log line.
     """
+    with tracing.trace("trmnl_markup", settings.trace_sample_rate) as current:
+        response = await _trmnl_markup(request)
+    if current is not None:
+        response.headers["Server-Timing"] = current.server_timing()
+    return response
+
+
+async def _trmnl_markup(request: Request) -> Response:
     # TRMNL sends form-encoded data, not JSON
     form = await request.form()
     uuid = form.get("user_uuid")
@@ -419,35 +1038,120 @@ async def trmnl_markup(request: Request):
     if not uuid:
         return JSONResponse({"error": "Missing user_uuid"}, status_code=400)
 
-    user = await db.get_user(uuid)
+    with tracing.span("user"):
+        user = await db.get_user_settings(uuid)
     if not user:
         return JSONResponse({"error": "User not found"}, status_code=404)
 
-    data = _build_render_context(
-        await _get_fresh_data(user, force_refresh=_should_force_refresh(request, form))
-    )
-
-    # TRMNL expects these exact keys
-    layout_map = {
-        "markup": "full",
-        "markup_half_horizontal": "half_horizontal",
-        "markup_half_vertical": "half_vertical",
-        "markup_quadrant": "quadrant",
+    with budget.deadline(settings.markup_deadline_seconds), tracing.span("board"):
+        try:
+            board, is_stale = await _get_fresh_data(
+                user, force_refresh=_should_force_refresh(request, form)
+            )
+        except Exception as exc:
+            print(f"[markup] no servable data for stop_id={user.stop_id}: {exc!r}")
+            board, is_stale = _unavailable_board(), True
+    data = _build_render_context(board, station_name=user.station_name, is_stale=is_stale)
+
+    with tracing.span("render"):
+        body = _render_markup_body(data)
+    headers = {
+        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+        "Pragma": "no-cache",
+        "Expires": "0",
+        "Vary": "Accept-Encoding",
     }
+    content = body.raw
+    encoding = _negotiate_encoding(request.headers.get("accept-encoding", ""))
+    if encoding is not None and len(body.raw) >= _MIN_COMPRESS_BYTES:
+        with tracing.span("encode", encoding=encoding):
+            content = body.encode(encoding)
+        headers["Content-Encoding"] = encoding
+
+    markup_transfer_stats["responses"] += 1
+    markup_transfer_stats["raw_bytes"] += len(body.raw)
+    markup_transfer_stats["sent_bytes"] += len(content)
+
+    return Response(content, media_type="application/json", headers=headers)
+
+
+@dataclass(slots=True)
+class _MarkupBody:
+    raw: bytes
+    encoded: dict[str, bytes] = field(default_factory=dict)
+
+    def encode(self, encoding: str) -> bytes:
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = _COMPRESSORS[encoding](self.raw)
+        return body
+
+
+def _negotiate_encoding(accept_encoding: str) -> str | None:
+    """Pick the preferred supported encoding the client accepts, if any.
+    A coding listed with q=0 is refused even when ``*`` is accepted."""
+    accepted, refused = set(), set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip()
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    refused.add(name)
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name)
+    for encoding in _COMPRESSORS:
+        if encoding in refused:
+            continue
+        if encoding in accepted or ("*" in accepted and "*" not in refused):
+            return encoding
+    return None
+
+
+def _prepare_templates():
+    """Compile (and minify) the markup templates once at startup."""
+    for name in _LAYOUT_MAP.values():
+        jinja_env.get_template(f"{name}.html")
+    for name, (before, after) in sorted(_template_loader.stats.items()):
+        print(f"[templates] {name}: {before} -> {after} bytes")
+
+
+def _render_markup_body(context: dict) -> _MarkupBody:
+    """Render all four layouts into a serialized JSON body, reusing the
+    cached body when an identical context was rendered this slot."""
+    fingerprint = hashlib.blake2b(
+        json.dumps(context, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"),
+        digest_size=16,
+    ).digest()
+    body = markup_cache.get(fingerprint)
+    if body is not None:
+        return body
 
     result = {}
-    for response_key, template_name in layout_map.items():
+    for response_key, template_name in _LAYOUT_MAP.items():
         template = jinja_env.get_template(f"{template_name}.html")
-        result[response_key] = template.render(**data)
-
-    return JSONResponse(
-        result,
-        headers={
-            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-            "Pragma": "no-cache",
-            "Expires": "0",
-        },
-    )
+        with metrics.TEMPLATE_RENDER_SECONDS.labels(template_name).time(), tracing.span(f"render.{template_name}"):
+            result[response_key] = template.render(**context)
+    body = _MarkupBody(json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    # The context embeds its refresh slot, so entries only need to outlive it.
+    freshness_seconds = _clamped_seconds(settings.render_freshness_seconds, 60) or 1
+    markup_cache.set(fingerprint, body, time.time() + 2 * freshness_seconds)
+    return body
+
+
+@app.get("/api/cache/ttl-report")
+async def ttl_report():
+    """Learned cache TTLs per board and the PTV departure calls they saved."""
+    rows = ttl_policy.report()
+    return {
+        "adaptive_ttl_enabled": settings.adaptive_ttl_enabled,
+        "ptv_calls_saved": round(sum(row["ptv_calls_saved"] for row in rows), 1),
+        "boards": rows,
+    }
 
 
 # ── Settings page ────────────────────────────────────────────────────────────
@@ -498,7 +1202,6 @@ async def manage_save(
         platform_numbers=platforms,
         refresh_minutes=max(1, refresh_minutes),
     )
-    await db.flush_cached_departures(uuid)
 
     user = await db.get_user(uuid)
     template = jinja_env.get_template("manage.html")
@@ -521,13 +1224,32 @@ async def manage_save(
 
 @app.get("/api/stations/search")
 async def search_stations(q: str = Query(..., min_length=2)):
-    ptv = PTVClient(settings.ptv_dev_id, settings.ptv_api_key)
-    stops = await ptv.search_stops(q, route_type=0)
+    # Answer from the local index; only fall back to PTV when it has no match.
+    index = station_index.current()
+    if index is not None:
+        stops = index.search(q)
+        if stops:
+            return {"stops": stops}
+
+    with priority(Priority.SEARCH):
+        stops = await ptv_client.search_stops(q, route_type=0)
     return {"stops": stops}
 
 
+# Registered after every route so the metrics middleware knows them all.
+app.add_middleware(metrics.MetricsMiddleware, routes={route.path for route in app.routes})
+if profiler is not None:
+    app.add_middleware(
+        ProfilerMiddleware,
+        profiler=profiler,
+        paths={"/trmnl/markup"},
+        sample_rate=settings.profile_sample_rate,
+    )
+
+
 # ── Dev entry point ──────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="127.0.0.1", port=8000, reload=True)
+
@@ -0,0 +1,167 @@
+"""Prometheus metrics served at /metrics.
+
+Latency histograms and counters are recorded on the hot paths; the stats()
+dicts that components already keep (caches, single-flight, rate limiter,
+circuit breaker, admission gate) are exported at scrape time, running
+totals as counters and current levels as gauges.
+Each worker process exposes its own metrics.
+"""
+
+import functools
+import re
+import time
+from collections.abc import Callable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import REGISTRY, Collector
+
+PTV_REQUEST_SECONDS = Histogram(
+    "trmnl_ptv_request_duration_seconds",
+    "PTV API request latency by endpoint.",
+    ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+PTV_REQUESTS = Counter(
+    "trmnl_ptv_requests_total",
+    "PTV API requests by endpoint and outcome.",
+    ["endpoint", "outcome"],
+)
+SQLITE_SECONDS = Histogram(
+    "trmnl_sqlite_operation_duration_seconds",
+    "SQLite operation latency.",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5),
+)
+TEMPLATE_RENDER_SECONDS = Histogram(
+    "trmnl_template_render_duration_seconds",
+    "Jinja template render latency.",
+    ["template"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+BOARD_CACHE_LOOKUPS = Counter(
+    "trmnl_board_cache_lookups_total",
+    "Shared departure cache lookups for markup requests "
+    "(hit, stale = served while revalidating, expired = too old to serve, miss).",
+    ["result"],
+)
+PUSHES = Counter(
+    "trmnl_push_total",
+    "Push-mode webhook pushes by outcome.",
+    ["outcome"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "trmnl_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    ["route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "trmnl_http_requests_in_flight",
+    "HTTP requests currently being served, by route.",
+    ["route"],
+)
+
+_PTV_ENDPOINTS = (
+    ("/v3/departures/", "departures"),
+    ("/v3/pattern/", "pattern"),
+    ("/v3/search/", "search"),
+    ("/v3/stops/route/", "route_stops"),
+)
+
+
+def ptv_endpoint(url: str) -> str:
+    for marker, name in _PTV_ENDPOINTS:
+        if marker in url:
+            return name
+    return "other"
+
+
+def timed_sqlite(fn):
+    """Record the decorated database coroutine under its function name."""
+    histogram = SQLITE_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+# stats() keys that only ever grow; exported as counters so rate() works.
+_COUNTER_KEYS = frozenset({
+    "hits", "misses", "expirations", "evictions",  # Caches
+    "calls", "executions", "coalesced", "errors",  # Single-flight
+    "opened", "rejected",  # Circuit breaker
+    "admitted", "shed",  # Admission gate
+    "responses", "raw_bytes", "sent_bytes",  # Markup transfer
+})
+_COUNTER_PREFIXES = ("granted_", "delayed_", "dropped_")  # Rate limiter
+
+
+def _is_counter(key: str) -> bool:
+    return key in _COUNTER_KEYS or key.startswith(_COUNTER_PREFIXES)
+
+
+class StatsCollector(Collector):
+    """Exports ``stats()`` dicts as metrics named ``trmnl_<source>_<key>``.
+    Running totals become counters (``..._total``) and other numbers gauges;
+    strings (e.g. a breaker state) become a ``state`` label on a gauge set
+    to 1."""
+
+    def __init__(self):
+        self._sources: dict[str, Callable[[], dict]] = {}
+
+    def add(self, name: str, stats: Callable[[], dict]) -> None:
+        self._sources[re.sub(r"[^a-zA-Z0-9_]", "_", name)] = stats
+
+    def collect(self):
+        for source, stats in list(self._sources.items()):
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in values.items():
+                name = f"trmnl_{source}_{re.sub(r'[^a-zA-Z0-9_]', '_', key)}"
+                if isinstance(value, bool):
+                    yield GaugeMetricFamily(name, f"{source} {key}", value=int(value))
+                elif isinstance(value, (int, float)) and _is_counter(key):
+                    yield CounterMetricFamily(name, f"{source} {key}", value=value)
+                elif isinstance(value, (int, float)):
+                    yield GaugeMetricFamily(name, f"{source} {key}", value=value)
+                elif isinstance(value, str):
+                    family = GaugeMetricFamily(name, f"{source} {key}", labels=["state"])
+                    family.add_metric([value], 1)
+                    yield family
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing HTTP requests and tracking in-flight counts.
+    Routes outside ``routes`` are grouped as "other" to bound label values."""
+
+    def __init__(self, app, routes: set[str]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path", "")
+        route = path if path in self.routes else "other"
+        in_flight = HTTP_IN_FLIGHT.labels(route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(route).observe(time.perf_counter() - started)
@@ -0,0 +1,96 @@
+import re
+
+import jinja2
+
+_JINJA_TAG = re.compile(r"({{.*?}}|{%.*?%}|{#.*?#})", re.DOTALL)
+_STYLE_BLOCK = re.compile(r"(<style[^>]*>)(.*?)(</style>)", re.DOTALL | re.IGNORECASE)
+_CSS_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r"\s*([{};,])\s*")
+_CSS_COLON = re.compile(r":\s+")
+_LINE_WHITESPACE = re.compile(r"[ \t]*\n\s*")
+
+
+def _split_css_blocks(css: str) -> list[str]:
+    """Split minified CSS into top-level rules (at-rule blocks stay whole)."""
+    blocks = []
+    depth = 0
+    start = 0
+    for i, ch in enumerate(css):
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                blocks.append(css[start:i + 1])
+                start = i + 1
+        elif ch == ";" and depth == 0:
+            # Top-level statements such as @import
+            blocks.append(css[start:i + 1])
+            start = i + 1
+    if css[start:].strip():
+        blocks.append(css[start:])
+    return blocks
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and insignificant whitespace, and drop repeated rules.
+
+    Only the last copy of an identical rule is kept, which leaves the
+    cascade unchanged.
+    """
+    css = _CSS_COMMENT.sub("", css)
+    css = " ".join(css.split())
+    css = _CSS_PUNCTUATION.sub(r"\1", css)
+    css = _CSS_COLON.sub(":", css)
+    css = css.replace(";}", "}")
+
+    blocks = _split_css_blocks(css)
+    seen: set[str] = set()
+    kept = []
+    for block in reversed(blocks):
+        if block in seen:
+            continue
+        seen.add(block)
+        kept.append(block)
+    return "".join(reversed(kept))
+
+
+def _minify_text(text: str) -> str:
+    # Indentation and blank lines are never significant outside <pre>; a
+    # single newline keeps the space between inline elements.
+    return _LINE_WHITESPACE.sub("\n", text)
+
+
+def minify_template(source: str) -> str:
+    """Minify a Jinja HTML template's source, leaving Jinja tags untouched."""
+    def style(match: re.Match) -> str:
+        parts = _JINJA_TAG.split(match.group(2))
+        if len(parts) > 1:
+            return match.group(0)  # Templated CSS: leave as-is
+        return f"{match.group(1)}{minify_css(match.group(2))}{match.group(3)}"
+
+    source = _STYLE_BLOCK.sub(style, source)
+    parts = _JINJA_TAG.split(source)
+    # Odd indexes are Jinja tags; only the literal text between them changes.
+    return "".join(part if i % 2 else _minify_text(part) for i, part in enumerate(parts))
+
+
+class MinifyingLoader(jinja2.FileSystemLoader):
+    """FileSystemLoader that minifies the named templates when they load.
+
+    Jinja compiles each template once and caches it, so the minification
+    runs once per template at startup rather than per render.
+    """
+
+    def __init__(self, searchpath: str, minify: set[str]):
+        super().__init__(searchpath)
+        self.minify = minify
+        self.stats: dict[str, tuple[int, int]] = {}
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if template in self.minify:
+            minified = minify_template(source)
+            self.stats[template] = (len(source.encode("utf-8")), len(minified.encode("utf-8")))
+            source = minified
+        return source, filename, uptodate
@@ -0,0 +1,53 @@
+from typing import Any
+
+from .shared_state import SharedState
+
+NAMESPACE = "pending_settings"
+
+
+class PendingSettingsStore:
+    """Setup-page settings waiting for the /install/success webhook, keyed by
+    access token.
+
+    Entries live in shared state, so they survive restarts and are visible to
+    every worker. Each expires ``ttl_seconds`` after it was saved; past
+    ``max_entries`` the entries closest to expiry (the oldest) are evicted
+    one at a time instead of dropping every in-flight install.
+    """
+
+    def __init__(self, state: SharedState, ttl_seconds: int, max_entries: int):
+        self.state = state
+        self.ttl_seconds = max(1, ttl_seconds)
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    async def put(self, token: str, values: dict[str, Any]) -> None:
+        await self.state.set(NAMESPACE, token, values, ttl_seconds=self.ttl_seconds)
+        self.evictions += await self.state.trim(NAMESPACE, self.max_entries)
+
+    async def pop(self, token: str) -> dict[str, Any] | None:
+        values, expired = await self.state.pop(NAMESPACE, token)
+        if expired:
+            self.expirations += 1  # Expired before the sweep reached it
+        elif values is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return values
+
+    async def sweep(self) -> int:
+        """Delete expired entries; run periodically by the scheduler."""
+        expired = await self.state.sweep(NAMESPACE)
+        self.expirations += expired
+        return expired
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,170 @@
+"""Opt-in statistical profiler for production requests.
+
+While a profile session is open, a daemon thread samples the event-loop
+thread's Python stack every few milliseconds. The stacks are written as
+collapsed-stack files (``frame;frame;frame count`` per line), which
+flamegraph.pl, speedscope and inferno read directly.
+
+Sessions are opened per sampled /trmnl/markup request (ProfilerMiddleware)
+or for a fixed window from the admin endpoint. A request session also
+collects whatever other requests run on the loop at the same time; a window
+collects everything. Samples taken while the loop is idle in select() are
+dropped.
+
+Files are written off the event loop, and only the newest ``max_files``
+profiles in the output directory are kept.
+
+Nothing here runs unless PROFILER_ENABLED is set: the middleware is not
+installed and the sampler thread only exists while a session is open.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Leaf functions meaning the event loop is waiting for I/O, not working.
+_IDLE_LEAVES = {("selectors.py", "select"), ("selectors.py", "poll")}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame) -> str | None:
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+        return None
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+
+class ProfileSession:
+    def __init__(self, label: str, until: float | None = None):
+        self.label = label
+        self.until = until  # Monotonic end of a time window; None for a request
+        self.started_at = datetime.now(timezone.utc)
+        self.samples: Counter = Counter()
+
+
+class StackProfiler:
+    def __init__(self, output_dir: str, interval_ms: float = 5.0, max_files: int = 200):
+        self.output_dir = Path(output_dir)
+        self.interval = max(0.001, interval_ms / 1000)
+        self.max_files = max(1, max_files)
+        self.target_thread: int | None = None
+        self._sessions: list[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self.written: list[str] = []
+
+    def start(self, label: str, seconds: float | None = None) -> ProfileSession:
+        """Open a session on the calling (event-loop) thread; with ``seconds``
+        it closes and is written by the sampler when the window ends."""
+        session = ProfileSession(label, time.monotonic() + seconds if seconds else None)
+        with self._lock:
+            self.target_thread = threading.get_ident()
+            self._sessions.append(session)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stack-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def finish(self, session: ProfileSession) -> str | None:
+        """Close a session and write it; blocking, so call it off the loop."""
+        with self._lock:
+            if session not in self._sessions:
+                return None
+            self._sessions.remove(session)
+        return self._write(session)
+
+    def window(self) -> ProfileSession | None:
+        """The open time-window session, if any."""
+        with self._lock:
+            return next((s for s in self._sessions if s.until is not None), None)
+
+    def stop(self) -> None:
+        """Write every open session (e.g. at shutdown)."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            self._write(session)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self.target_thread)
+            stack = _collapse(frame) if frame is not None else None
+            now = time.monotonic()
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                expired = [s for s in self._sessions if s.until is not None and now >= s.until]
+                for session in self._sessions:
+                    if stack is not None:
+                        session.samples[stack] += 1
+                for session in expired:
+                    self._sessions.remove(session)
+            for session in expired:
+                self._write(session)
+
+    def _write(self, session: ProfileSession) -> str | None:
+        if not session.samples:
+            return None
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = session.started_at.strftime("%Y%m%dT%H%M%S.%f")
+        path = self.output_dir / f"{stamp}-{os.getpid()}-{session.label}.collapsed"
+        path.write_text(
+            "".join(f"{stack} {count}\n" for stack, count in session.samples.most_common()),
+            encoding="utf-8",
+        )
+        total = sum(session.samples.values())
+        print(f"[profiler] wrote {total} samples to {path}")
+        with self._lock:
+            self.written = (self.written + [str(path)])[-20:]
+        self._prune()
+        return str(path)
+
+    def _prune(self) -> None:
+        """Delete all but the newest ``max_files`` profiles. File names start
+        with the session's start time, so name order is age order."""
+        paths = sorted(self.output_dir.glob("*.collapsed"), key=lambda p: p.name)
+        for path in paths[:-self.max_files]:
+            path.unlink(missing_ok=True)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling a sampled fraction of requests to ``paths``."""
+
+    def __init__(self, app, profiler: StackProfiler, paths: set[str], sample_rate: float):
+        self.app = app
+        self.profiler = profiler
+        self.paths = paths
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope.get("path") not in self.paths
+            or self.sample_rate <= 0
+            or random.random() >= self.sample_rate
+            or self.profiler.window() is not None  # The window already covers it
+        ):
+            await self.app(scope, receive, send)
+            return
+        session = self.profiler.start(scope["path"].strip("/").replace("/", "_") or "root")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await asyncio.to_thread(self.profiler.finish, session)
@@ -1,25 +1,201 @@
+import asyncio
 import hashlib
 import re
 import hmac
+import time
+from bisect import bisect_left
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import quote, urlencode
 from zoneinfo import ZoneInfo
 
 import httpx
 
+from . import budget, metrics, tracing
+from .cache import TTLCache
+from .circuit_breaker import CircuitBreaker
+from .rate_limiter import PriorityRateLimiter
+from .singleflight import SingleFlight
+
 MELBOURNE_TZ = ZoneInfo("Australia/Melbourne")
 
 
+class PTVRequestError(Exception):
+    """A failed PTV request. Described by endpoint and status only: the
+    signed URL carries the devid and signature, which must not be logged."""
+
+    def __init__(self, endpoint: str, reason: str, status: int | None = None):
+        super().__init__(f"PTV {endpoint} request failed: {reason}")
+        self.endpoint = endpoint
+        self.status = status
+
+
 def _clean_stop_name(name: str) -> str:
     return re.sub(r"\s*\bStation\b\s*$", "", name, flags=re.IGNORECASE).strip()
 
 
+@dataclass(slots=True, frozen=True)
+class RunPattern:
+    """Raw whole-run stopping pattern, shared by every station on the run."""
+
+    path: tuple[int, ...]  # Every stop on the run's path, including skipped ones
+    calling: tuple[int, ...]  # Stops the run actually calls at, in order
+    names: dict[int, str]
+    last_departure: datetime | None
+
+    def stops_from(self, current_stop_id: int) -> list[dict]:
+        """Stops on the path from the current stop onward, each flagged
+        express when the run does not call there."""
+        # Stops the train actually calls at (from current stop onward)
+        try:
+            start = self.calling.index(current_stop_id)
+        except ValueError:
+            start = len(self.calling)
+        calling_ids = set(self.calling[start:])
+
+        # Ordered list of ALL stops on the run's path (from current stop onward)
+        try:
+            start = self.path.index(current_stop_id)
+        except ValueError:
+            return []
+        return [
+            {
+                "name": self.names.get(sid, "Unknown"),
+                "stop_id": sid,
+                "is_current": sid == current_stop_id,
+                "is_express": sid not in calling_ids,
+            }
+            for sid in self.path[start:]
+        ]
+
+
+@dataclass(slots=True, frozen=True)
+class RouteTopology:
+    """A route's stops in sequence order, with each stop's slice start
+    precomputed so "from this stop onward" is a dict lookup."""
+
+    stops: tuple[tuple[int, str], ...]  # (stop_id, cleaned name)
+    sequences: tuple[int, ...]
+    start_index: dict[int, int]
+
+    @classmethod
+    def from_stops(cls, stops) -> "RouteTopology":
+        """Build from (stop_id, name, stop_sequence) tuples in any order."""
+        ordered = sorted(stops, key=lambda s: s[2])
+        sequences = tuple(s[2] for s in ordered)
+        start_index: dict[int, int] = {}
+        for stop_id, _, sequence in ordered:
+            # Every stop at or after the current stop's sequence is "onward".
+            start_index.setdefault(stop_id, bisect_left(sequences, sequence))
+        return cls(
+            stops=tuple((s[0], s[1]) for s in ordered),
+            sequences=sequences,
+            start_index=start_index,
+        )
+
+    def stops_from(self, stop_id: int) -> tuple[tuple[int, str], ...]:
+        # Unknown stops slice from sequence 0, i.e. the whole route.
+        start = self.start_index.get(stop_id)
+        if start is None:
+            start = bisect_left(self.sequences, 0)
+        return self.stops[start:]
+
+
 class PTVClient:
     BASE_URL = "https://timetableapi.ptv.vic.gov.au"
 
-    def __init__(self, dev_id: str, api_key: str):
+    def __init__(
+        self,
+        dev_id: str,
+        api_key: str,
+        client: httpx.AsyncClient | None = None,
+        pattern_cache_size: int = 512,
+        pattern_cache_grace_seconds: int = 300,
+        pattern_cache_max_seconds: int = 4 * 3600,
+        pattern_cache_fallback_seconds: int = 600,
+        pattern_single_request: bool = False,
+        breaker: CircuitBreaker | None = None,
+        limiter: PriorityRateLimiter | None = None,
+        topology_store=None,
+        base_url: str | None = None,
+    ):
         self.dev_id = dev_id
         self.api_key = api_key
+        self.base_url = (base_url or self.BASE_URL).rstrip("/")
+        # Long-lived pooled client; reused across calls for connection keep-alive.
+        self._client = client if client is not None else httpx.AsyncClient()
+        # Fails fast with CircuitOpenError while PTV is repeatedly erroring.
+        self.breaker = breaker if breaker is not None else CircuitBreaker("ptv")
+        # Shared token bucket for all PTV calls; priority comes from the caller's
+        # rate_limiter.priority() context (interactive by default).
+        self.limiter = limiter
+        # Optional persistent cache of RouteTopology keyed by
+        # (route_id, direction_id, route_type); see route_topology.py.
+        self.topology_store = topology_store
+        # Concurrent pattern lookups for the same run share one pair of requests.
+        self.pattern_flight = SingleFlight("stopping_pattern")
+        # Whole-run patterns keyed by (run_ref, route_type), kept until shortly
+        # after the run's last departure (capped at pattern_cache_max_seconds).
+        self.pattern_cache = TTLCache(pattern_cache_size)
+        self.pattern_cache_grace_seconds = pattern_cache_grace_seconds
+        self.pattern_cache_max_seconds = pattern_cache_max_seconds
+        self.pattern_cache_fallback_seconds = pattern_cache_fallback_seconds
+        # Derive express stops from one include_skipped_stops response when
+        # possible; otherwise (or when disabled) issue both requests concurrently.
+        self.pattern_single_request = pattern_single_request
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _get_json(self, url: str) -> dict:
+        # Bound the call by the caller's remaining request budget, if any.
+        # Running out of budget is not an upstream failure, so it does not
+        # count against the circuit breaker.
+        time_left = budget.remaining()
+        if time_left is not None and time_left <= 0:
+            raise budget.BudgetExhausted("no time left for PTV request")
+        # Fail fast on an open circuit before spending a rate-limit token.
+        self.breaker.before_call()
+        if self.limiter is not None:
+            try:
+                with tracing.span("ptv.rate_limit"):
+                    await self.limiter.acquire()
+            except BaseException:
+                self.breaker.record_ignored()  # Free a half-open trial slot
+                raise
+            time_left = budget.remaining()
+        endpoint = metrics.ptv_endpoint(url)
+        with tracing.span(f"ptv.{endpoint}"):
+            return await self._request_json(url, endpoint, time_left)
+
+    async def _request_json(self, url: str, endpoint: str, time_left: float | None) -> dict:
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(time_left):
+                response = await self._client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            status = exc.response.status_code
+            if status >= 500 or status == 429:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()  # PTV is up; the request itself was rejected
+            metrics.PTV_REQUESTS.labels(endpoint, f"http_{status}").inc()
+            raise PTVRequestError(endpoint, f"HTTP {status}", status) from None
+        except httpx.TransportError as exc:
+            self.breaker.record_failure()
+            metrics.PTV_REQUESTS.labels(endpoint, "transport_error").inc()
+            raise PTVRequestError(endpoint, type(exc).__name__) from None
+        except BaseException as exc:
+            self.breaker.record_ignored()
+            outcome = "timeout" if isinstance(exc, TimeoutError) else "aborted"
+            metrics.PTV_REQUESTS.labels(endpoint, outcome).inc()
+            raise
+        finally:
+            metrics.PTV_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        self.breaker.record_success()
+        metrics.PTV_REQUESTS.labels(endpoint, "ok").inc()
+        return response.json()
 
     def _sign_url(self, path: str) -> str:
         """Generate signed URL for PTV API."""
@@ -32,7 +208,7 @@ class PTVClient:
             hashlib.sha1,
         ).hexdigest().upper()
 
-        return f"{self.BASE_URL}{path_with_devid}&signature={signature}"
+        return f"{self.base_url}{path_with_devid}&signature={signature}"
 
     async def get_departures(
         self,
@@ -53,10 +229,7 @@ class PTVClient:
 
         url = self._sign_url(full_path)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
+        data = await self._get_json(url)
 
         return self._process_departures(data)[:max_results]
 
@@ -107,35 +280,46 @@ class PTVClient:
         current_stop_id: int,
         route_type: int = 0,
     ) -> list[dict]:
-        """Get stops on a route from the current station onward."""
+        """Get stops on a route from the current station onward.
+
+        Nothing in the app calls this today: boards take their stops from
+        the run's stopping pattern (/v3/pattern). The route topology and its
+        SQLite cache are kept for callers that only need the route order.
+        """
+        topology = await self.get_route_topology(route_id, direction_id, route_type)
+        return [
+            {
+                "name": name,
+                "stop_id": stop_id,
+                "is_current": stop_id == current_stop_id,
+                "is_express": False,
+            }
+            for stop_id, name in topology.stops_from(current_stop_id)
+        ]
+
+    async def get_route_topology(self, route_id: int, direction_id: int, route_type: int = 0) -> RouteTopology:
+        """Ordered stop list of a route, from the topology store when cached."""
+        key = (route_id, direction_id, route_type)
+        if self.topology_store is not None:
+            topology = await self.topology_store.get(key)
+            if topology is not None:
+                return topology
+
         path = f"/v3/stops/route/{route_id}/route_type/{route_type}"
         params = {"direction_id": direction_id}
         full_path = f"{path}?{urlencode(params)}"
 
         url = self._sign_url(full_path)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
-
-        stops = sorted(data.get("stops", []), key=lambda s: s["stop_sequence"])
+        data = await self._get_json(url)
 
-        current_seq = next(
-            (s["stop_sequence"] for s in stops if s["stop_id"] == current_stop_id),
-            0,
+        topology = RouteTopology.from_stops(
+            (s["stop_id"], _clean_stop_name(s["stop_name"]), s["stop_sequence"])
+            for s in data.get("stops", [])
         )
-
-        return [
-            {
-                "name": _clean_stop_name(s["stop_name"]),
-                "stop_id": s["stop_id"],
-                "is_current": s["stop_id"] == current_stop_id,
-                "is_express": False,
-            }
-            for s in stops
-            if s["stop_sequence"] >= current_seq
-        ]
+        if self.topology_store is not None:
+            await self.topology_store.put(key, topology)
+        return topology
 
     async def search_stops(self, term: str, route_type: int = 0) -> list[dict]:
         """Search for stops by name, filtered to a route type."""
@@ -145,10 +329,7 @@ class PTVClient:
 
         url = self._sign_url(full_path)
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            data = response.json()
+        data = await self._get_json(url)
 
         return [
             {"stop_id": s["stop_id"], "stop_name": _clean_stop_name(s["stop_name"])}
@@ -156,65 +337,153 @@ class PTVClient:
         ]
 
     async def get_stopping_pattern(self, run_ref: str, current_stop_id: int, route_type: int = 0) -> list[dict]:
-        """Get stopping pattern for a specific run.
+        """Get the stopping pattern for a run from the current station onward.
+
+        The whole-run pattern is cached per (run_ref, route_type) until shortly
+        after the run's last departure, so every station on the same run shares
+        one entry and only the slice below is computed per request.
+        """
+        with tracing.span("ptv.stopping_pattern"):
+            pattern = await self._get_run_pattern(run_ref, route_type)
+        return pattern.stops_from(current_stop_id)
+
+    async def _get_run_pattern(self, run_ref: str, route_type: int) -> RunPattern:
+        key = (run_ref, route_type)
+        pattern = self.pattern_cache.get(key)
+        if pattern is not None:
+            return pattern
+
+        async def fetch() -> RunPattern:
+            fetched = await self._fetch_run_pattern(run_ref, route_type)
+            self.pattern_cache.set(key, fetched, self._pattern_expires_at(fetched))
+            return fetched
+
+        # Concurrent lookups of the same run share one fetch.
+        return await self.pattern_flight.do(key, fetch)
+
+    def _pattern_expires_at(self, pattern: RunPattern) -> float:
+        now = time.time()
+        if pattern.last_departure is None:
+            return now + self.pattern_cache_fallback_seconds
+        expires_at = pattern.last_departure.timestamp() + self.pattern_cache_grace_seconds
+        # Keep at least the grace period so a run that is already running late
+        # past its last estimate is not refetched on every request.
+        return min(
+            max(expires_at, now + self.pattern_cache_grace_seconds),
+            now + self.pattern_cache_max_seconds,
+        )
+
+    async def _fetch_run_pattern(self, run_ref: str, route_type: int) -> RunPattern:
+        """Fetch the raw stopping pattern for a run.
 
-        Makes two requests to the pattern endpoint:
+        A single include_skipped_stops request is enough when every departure
+        carries its ``skipped_stops`` list and those lists account for every
+        stop the run's ``express_stop_count`` says it skips: stops listed
+        there are express, everything else is a calling stop. Otherwise fall
+        back to diffing it against a calling-stops-only request:
         1. Without include_skipped_stops — gives us the stops the train calls at.
         2. With include_skipped_stops — gives us ALL stops on the train's actual
            path (including express-skipped ones).
 
-        By diffing the two we know exactly which stops are express, without
-        needing the route-stops endpoint (which returns city-loop stops that
-        may not be on this run's path at all).
+        Either way we know exactly which stops are express, without needing
+        the route-stops endpoint (which returns city-loop stops that may not
+        be on this run's path at all).
         """
         base_path = f"/v3/pattern/run/{run_ref}/route_type/{route_type}"
-
-        # Request 1: calling stops only
         params = {"expand": ["stop"]}
         url = self._sign_url(f"{base_path}?{urlencode(params, doseq=True)}")
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url)
-            resp.raise_for_status()
-            data_calling = resp.json()
-
-        # Request 2: all stops on the run's path (including skipped)
-        params_full = {"expand": ["stop"], "include_skipped_stops": "true"}
+        params_full = {"expand": ["stop", "run"], "include_skipped_stops": "true"}
         url_full = self._sign_url(f"{base_path}?{urlencode(params_full, doseq=True)}")
-        async with httpx.AsyncClient() as client:
-            resp_full = await client.get(url_full)
-            resp_full.raise_for_status()
-            data_full = resp_full.json()
-
-        stops_lookup = {**data_calling.get("stops", {}), **data_full.get("stops", {})}
-
-        def stop_name(stop_id):
-            info = stops_lookup.get(str(stop_id), {})
-            return _clean_stop_name(info.get("stop_name", "Unknown"))
-
-        # Build set of stop_ids the train actually calls at (from current stop onward)
-        calling_ids: set[int] = set()
-        found_current = False
-        for dep in data_calling.get("departures", []):
-            sid = dep.get("stop_id")
-            if sid == current_stop_id:
-                found_current = True
-            if found_current:
-                calling_ids.add(sid)
-
-        # Build ordered list of ALL stops on the run's path (from current stop onward)
-        found_current = False
-        result = []
-        for dep in data_full.get("departures", []):
-            sid = dep.get("stop_id")
-            if sid == current_stop_id:
-                found_current = True
-            if not found_current:
+
+        if self.pattern_single_request:
+            data_full = await self._get_json(url_full)
+            derived = _derive_pattern_from_skipped(data_full, run_ref)
+            if derived is not None:
+                path, calling, skipped_names = derived
+                return self._build_run_pattern(path, calling, [data_full], skipped_names)
+            data_calling = await self._get_json(url)
+        else:
+            data_calling, data_full = await asyncio.gather(
+                self._get_json(url), self._get_json(url_full)
+            )
+
+        return self._build_run_pattern(
+            path=tuple(dep.get("stop_id") for dep in data_full.get("departures", [])),
+            calling=tuple(dep.get("stop_id") for dep in data_calling.get("departures", [])),
+            responses=[data_calling, data_full],
+        )
+
+    @staticmethod
+    def _build_run_pattern(
+        path: tuple[int, ...],
+        calling: tuple[int, ...],
+        responses: list[dict],
+        extra_names: dict[int, str] | None = None,
+    ) -> RunPattern:
+        stops_lookup: dict = {}
+        for data in responses:
+            stops_lookup.update(data.get("stops") or {})
+        names = dict(extra_names or {})
+        for sid in path:
+            info = stops_lookup.get(str(sid))
+            if info or sid not in names:
+                names[sid] = _clean_stop_name((info or {}).get("stop_name", "Unknown"))
+
+        last_departure = None
+        for dep in (d for data in responses for d in data.get("departures", [])):
+            raw = dep.get("estimated_departure_utc") or dep.get("scheduled_departure_utc")
+            if not raw:
                 continue
-            result.append({
-                "name": stop_name(sid),
-                "stop_id": sid,
-                "is_current": sid == current_stop_id,
-                "is_express": sid not in calling_ids,
-            })
+            try:
+                departs = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            if departs.tzinfo is None:
+                departs = departs.replace(tzinfo=timezone.utc)
+            if last_departure is None or departs > last_departure:
+                last_departure = departs
+
+        return RunPattern(path=path, calling=calling, names=names, last_departure=last_departure)
+
+
+def _derive_pattern_from_skipped(
+    data_full: dict,
+    run_ref: str,
+) -> tuple[tuple[int, ...], tuple[int, ...], dict[int, str]] | None:
+    """Derive (path, calling stops, skipped stop names) from one
+    include_skipped_stops response, or None when the response does not
+    provably carry the skip data and the two-request diff is needed instead.
+
+    Each departure's ``skipped_stops`` are the stops passed without calling
+    after it; they are placed on the path right after that departure unless
+    the response already lists them as departures of their own. An empty
+    ``skipped_stops`` list is indistinguishable from missing detail, so the
+    skipped stops found must match the run's ``express_stop_count``.
+    """
+    departures = data_full.get("departures") or []
+    if not departures or any("skipped_stops" not in dep for dep in departures):
+        return None
+    run = (data_full.get("runs") or {}).get(str(run_ref)) or {}
+    express_stop_count = run.get("express_stop_count")
+    if not isinstance(express_stop_count, int):
+        return None
+
+    departure_ids = {dep.get("stop_id") for dep in departures}
+    skipped_ids: set[int] = set()
+    skipped_names: dict[int, str] = {}
+    path: list[int] = []
+    for dep in departures:
+        path.append(dep.get("stop_id"))
+        for stop in dep.get("skipped_stops") or []:
+            sid = stop.get("stop_id")
+            skipped_ids.add(sid)
+            if stop.get("stop_name"):
+                skipped_names[sid] = _clean_stop_name(stop["stop_name"])
+            if sid not in departure_ids:
+                path.append(sid)
+
+    if len(skipped_ids) != express_stop_count:
+        return None
+    calling = tuple(dep.get("stop_id") for dep in departures if dep.get("stop_id") not in skipped_ids)
+    return tuple(path), calling, skipped_names
 
-        return result
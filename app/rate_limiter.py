@@ -0,0 +1,139 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+
+from . import budget
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # /trmnl/markup
+    SEARCH = 1  # /api/stations/search
+    SCHEDULED = 2  # Push mode: waits for tokens rather than being dropped
+    BACKGROUND = 3  # Prefetch, revalidation
+
+
+class RateLimitedError(Exception):
+    """A PTV call was dropped because the rate limiter ran dry."""
+
+
+# Priority of PTV calls made by the current task (inherited by tasks it starts).
+_priority: ContextVar[Priority] = ContextVar("ptv_priority", default=Priority.INTERACTIVE)
+
+
+@contextmanager
+def priority(level: Priority):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+def set_priority(level: Priority) -> None:
+    """Set the current task's priority outside a ``priority()`` block."""
+    _priority.set(level)
+
+
+def worker_share(rate_per_second: float, burst: int, workers: int, leader: bool) -> tuple[float, int]:
+    """One worker's slice of the PTV budget across ``workers`` processes.
+
+    The leader runs every scheduled and background job, so it gets two
+    shares and each other worker one; the slices still add up to the whole
+    budget while exactly one worker leads.
+    """
+    if workers <= 1:
+        return rate_per_second, max(1, burst)
+    share = (2 if leader else 1) / (workers + 1)
+    return rate_per_second * share, max(1, int(burst * share))
+
+
+class PriorityRateLimiter:
+    """Token bucket shared by every PTV call, with priority classes.
+
+    Lower priorities may only take a token while the bucket stays above their
+    reserve (a fraction of ``burst``), which keeps headroom for interactive
+    requests. Each class waits at most its ``max_wait`` seconds (and never
+    past the request deadline) before the call is dropped.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        reserve: dict[Priority, float] | None = None,
+        max_wait: dict[Priority, float] | None = None,
+    ):
+        self.rate = max(0.001, rate_per_second)
+        self.burst = max(1, burst)
+        self.reserve = {
+            Priority.INTERACTIVE: 0.0,
+            Priority.SEARCH: 0.2,
+            Priority.SCHEDULED: 0.25,
+            Priority.BACKGROUND: 0.5,
+            **(reserve or {}),
+        }
+        self.max_wait = {
+            Priority.INTERACTIVE: 5.0,
+            Priority.SEARCH: 2.0,
+            Priority.SCHEDULED: 30.0,
+            Priority.BACKGROUND: 0.0,
+            **(max_wait or {}),
+        }
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self.granted = {p: 0 for p in Priority}
+        self.delayed = {p: 0 for p in Priority}
+        self.dropped = {p: 0 for p in Priority}
+
+    def resize(self, rate_per_second: float, burst: int) -> None:
+        """Change the budget in place, keeping the tokens already earned."""
+        self._refill()
+        self.rate = max(0.001, rate_per_second)
+        self.burst = max(1, burst)
+        self.tokens = min(self.tokens, float(self.burst))
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, level: Priority | None = None) -> None:
+        level = current_priority() if level is None else level
+        floor = self.reserve[level] * self.burst
+        max_wait = self.max_wait[level]
+        time_left = budget.remaining()
+        if time_left is not None:
+            max_wait = min(max_wait, time_left)
+
+        waited = 0.0
+        while True:
+            self._refill()
+            if self.tokens - 1 >= floor:
+                self.tokens -= 1
+                self.granted[level] += 1
+                if waited:
+                    self.delayed[level] += 1
+                return
+            needed = (floor + 1 - self.tokens) / self.rate
+            if waited + needed > max_wait:
+                self.dropped[level] += 1
+                raise RateLimitedError(f"PTV rate limit: {level.name.lower()} call dropped")
+            await asyncio.sleep(needed)
+            waited += needed
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "tokens": round(self.tokens, 2),
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            **{f"granted_{p.name.lower()}": n for p, n in self.granted.items()},
+            **{f"delayed_{p.name.lower()}": n for p, n in self.delayed.items()},
+            **{f"dropped_{p.name.lower()}": n for p, n in self.dropped.items()},
+        }
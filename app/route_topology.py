@@ -0,0 +1,41 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from . import database as db
+from .ptv_client import RouteTopology
+
+
+class RouteTopologyStore:
+    """Route stop lists kept in memory and persisted to the route_topology
+    table, refetched from PTV only after ``ttl_seconds``."""
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._memory: dict[tuple[int, int, int], tuple[datetime, RouteTopology]] = {}
+
+    async def get(self, key: tuple[int, int, int]) -> RouteTopology | None:
+        now = datetime.now(timezone.utc)
+        cached = self._memory.get(key)
+        if cached is None:
+            row = await db.get_route_topology(*key)
+            if row is None:
+                return None
+            cached = (
+                datetime.fromisoformat(row["fetched_at"]),
+                RouteTopology.from_stops(tuple(stop) for stop in json.loads(row["stops"])),
+            )
+            self._memory[key] = cached
+
+        fetched_at, topology = cached
+        if now - fetched_at >= self.ttl:
+            return None
+        return topology
+
+    async def put(self, key: tuple[int, int, int], topology: RouteTopology) -> None:
+        fetched_at = datetime.now(timezone.utc)
+        self._memory[key] = (fetched_at, topology)
+        stops = [
+            [stop_id, name, sequence]
+            for (stop_id, name), sequence in zip(topology.stops, topology.sequences)
+        ]
+        await db.set_route_topology(*key, stops, fetched_at)
@@ -0,0 +1,176 @@
+"""State shared by every worker process serving the app.
+
+Anything that must be seen by all uvicorn workers (or containers sharing the
+data volume) goes through a SharedState backend: pending setup settings,
+board activity used by the prefetcher, and leases that elect one worker to
+run scheduled jobs. ``SQLiteSharedState`` is the default; ``MemorySharedState``
+is an in-process stand-in for single-worker deployments and tests.
+"""
+
+import json
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Any
+
+from . import database as db
+
+# Identifies this process as a lease holder.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SharedState(ABC):
+    """Backend interface. Values are JSON-serialisable; ``ttl_seconds=None``
+    keeps a value until it is popped."""
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        ...
+
+    @abstractmethod
+    async def pop(self, namespace: str, key: str) -> tuple[Any | None, bool]:
+        """Delete a value atomically; returns ``(value, expired)``, where
+        ``expired`` means the key was present but past its TTL."""
+
+    @abstractmethod
+    async def items(self, namespace: str) -> dict[str, Any]:
+        ...
+
+    @abstractmethod
+    async def sweep(self, namespace: str | None = None) -> int:
+        """Delete expired values (in every namespace by default); returns the count."""
+
+    @abstractmethod
+    async def trim(self, namespace: str, max_entries: int) -> int:
+        """Evict the values closest to expiry beyond ``max_entries``; returns the count."""
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Take or renew ``name`` for ``ttl_seconds``; False if another holder has it."""
+
+    @abstractmethod
+    async def release_lease(self, name: str, holder: str) -> None:
+        ...
+
+
+class MemorySharedState(SharedState):
+    def __init__(self):
+        self._values: dict[tuple[str, str], tuple[Any, float | None]] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+
+    def _live(self, namespace: str, key: str, now: float) -> Any | None:
+        item = self._values.get((namespace, key))
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at is not None and expires_at <= now:
+            del self._values[(namespace, key)]
+            return None
+        return value
+
+    async def get(self, namespace: str, key: str) -> Any | None:
+        return self._live(namespace, key, time.time())
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds is not None else None
+        # Round-trip through JSON so callers see the same types as with SQLite.
+        self._values[(namespace, key)] = (json.loads(json.dumps(value)), expires_at)
+
+    async def pop(self, namespace: str, key: str) -> tuple[Any | None, bool]:
+        item = self._values.pop((namespace, key), None)
+        if item is None:
+            return None, False
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.time():
+            return None, True
+        return value, False
+
+    async def items(self, namespace: str) -> dict[str, Any]:
+        now = time.time()
+        keys = [key for ns, key in self._values if ns == namespace]
+        live = {key: self._live(namespace, key, now) for key in keys}
+        return {key: value for key, value in live.items() if value is not None}
+
+    async def sweep(self, namespace: str | None = None) -> int:
+        now = time.time()
+        expired = [
+            k for k, (_, expires_at) in self._values.items()
+            if (namespace is None or k[0] == namespace) and expires_at is not None and expires_at <= now
+        ]
+        for k in expired:
+            del self._values[k]
+        return len(expired)
+
+    async def trim(self, namespace: str, max_entries: int) -> int:
+        keys = [k for k in self._values if k[0] == namespace]
+        excess = len(keys) - max(0, max_entries)
+        if excess <= 0:
+            return 0
+        keys.sort(key=lambda k: self._values[k][1] if self._values[k][1] is not None else float("inf"))
+        for k in keys[:excess]:
+            del self._values[k]
+        return excess
+
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        current = self._leases.get(name)
+        if current is not None and current[0] != holder and current[1] > now:
+            return False
+        self._leases[name] = (holder, now + ttl_seconds)
+        return True
+
+    async def release_lease(self, name: str, holder: str) -> None:
+        if self._leases.get(name, (None,))[0] == holder:
+            del self._leases[name]
+
+
+class SQLiteSharedState(SharedState):
+    """Backed by the app database, so every process using the same
+    DATABASE_PATH shares it."""
+
+    async def get(self, namespace: str, key: str) -> Any | None:
+        raw = await db.get_shared_value(namespace, key, time.time())
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds is not None else None
+        await db.set_shared_value(namespace, key, json.dumps(value), expires_at)
+
+    async def pop(self, namespace: str, key: str) -> tuple[Any | None, bool]:
+        raw, expired = await db.pop_shared_value(namespace, key, time.time())
+        return (json.loads(raw) if raw is not None else None), expired
+
+    async def items(self, namespace: str) -> dict[str, Any]:
+        rows = await db.get_shared_values(namespace, time.time())
+        return {key: json.loads(raw) for key, raw in rows.items()}
+
+    async def sweep(self, namespace: str | None = None) -> int:
+        return await db.delete_expired_shared_values(namespace, time.time())
+
+    async def trim(self, namespace: str, max_entries: int) -> int:
+        return await db.trim_shared_values(namespace, max(0, max_entries))
+
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        return await db.acquire_lease(name, holder, now + ttl_seconds, now)
+
+    async def release_lease(self, name: str, holder: str) -> None:
+        await db.release_lease(name, holder)
+
+
+_BACKENDS = {
+    "sqlite": SQLiteSharedState,
+    "memory": MemorySharedState,
+}
+
+
+def create_shared_state(backend: str) -> SharedState:
+    try:
+        return _BACKENDS[backend.lower()]()
+    except KeyError:
+        raise ValueError(f"Invalid SHARED_STATE_BACKEND: {backend!r}") from None
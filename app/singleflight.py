@@ -0,0 +1,91 @@
+import asyncio
+import contextvars
+from collections.abc import Awaitable, Callable, Hashable
+from typing import TypeVar
+
+from . import budget
+from .rate_limiter import current_priority, set_priority
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight task.
+
+    The first caller for a key starts the work; callers arriving before it
+    finishes await the same task and receive the same result or exception.
+    Results are shared objects, so callers must not mutate them.
+
+    The shared task runs in its own copy of the first caller's context. Each
+    caller that joins raises its PTV priority to the highest and extends its
+    deadline to the latest among the waiters, so an interactive request that
+    coalesces onto a background refresh is not dropped or shed as background
+    work.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._contexts: dict[Hashable, contextvars.Context] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            context = contextvars.copy_context()
+            task = asyncio.create_task(fn(), context=context)
+            self._inflight[key] = task
+            self._contexts[key] = context
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+            self._join(self._contexts[key])
+
+        # Shield the shared task: a caller whose request is cancelled (client
+        # disconnect, timeout) must not cancel the fetch other callers await.
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _join(context: contextvars.Context) -> None:
+        """Widen the shared task's priority and deadline to cover the caller.
+
+        The task is suspended while another caller runs, so its context can
+        be updated in place; PTV calls it makes from now on see the change.
+        """
+        level = current_priority()
+        if level < context.run(current_priority):
+            context.run(set_priority, level)
+        at = budget.current_deadline()
+        shared_at = context.run(budget.current_deadline)
+        if shared_at is not None and (at is None or at > shared_at):
+            context.run(budget.set_deadline, at)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            del self._contexts[key]
+        # Retrieve the exception so it is never reported as unhandled when
+        # every waiter was cancelled before the task failed.
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+        }
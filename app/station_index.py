@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from .ptv_client import _clean_stop_name
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_NON_WORD.split(_clean_stop_name(text).lower())).strip()
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_range(keys: list[tuple[str, int]], prefix: str):
+    """Yield stop indexes whose key starts with ``prefix`` (keys are sorted)."""
+    i = bisect_left(keys, (prefix, -1))
+    while i < len(keys) and keys[i][0].startswith(prefix):
+        yield keys[i][1]
+        i += 1
+
+
+class StationIndex:
+    """In-memory stop search built from a PTV stops dump.
+
+    Answers the station picker locally with prefix matching on the name and
+    on each word of it, prefix matching on the suburb, and trigram fuzzy
+    matching for typos, so no keystroke has to reach PTV.
+    """
+
+    def __init__(self, stops: list[dict], route_type: int = 0):
+        unique: dict[int, dict] = {}
+        for stop in stops:
+            if stop.get("route_type", route_type) != route_type or "stop_id" not in stop:
+                continue
+            unique.setdefault(stop["stop_id"], stop)
+
+        self.stop_ids: tuple[int, ...] = tuple(unique)
+        self.names: tuple[str, ...] = tuple(_clean_stop_name(s["stop_name"]) for s in unique.values())
+        self._keys: tuple[str, ...] = tuple(_normalize(s["stop_name"]) for s in unique.values())
+
+        word_keys = []
+        suburb_keys = []
+        trigrams: dict[str, list[int]] = defaultdict(list)
+        for idx, (key, stop) in enumerate(zip(self._keys, unique.values())):
+            words = key.split()
+            for i in range(len(words)):
+                word_keys.append((" ".join(words[i:]), idx))
+            suburb = _normalize(stop.get("stop_suburb") or "")
+            if suburb:
+                suburb_keys.append((suburb, idx))
+            for gram in _trigrams(key):
+                trigrams[gram].append(idx)
+
+        self._word_keys = sorted(word_keys)
+        self._suburb_keys = sorted(suburb_keys)
+        self._trigrams = {gram: tuple(ids) for gram, ids in trigrams.items()}
+        self._trigram_counts = tuple(len(_trigrams(key)) for key in self._keys)
+
+    def __len__(self) -> int:
+        return len(self.stop_ids)
+
+    @classmethod
+    def from_file(cls, path: str, route_type: int = 0) -> "StationIndex":
+        """Load a PTV stops response (``{"stops": [...]}``), a list of such
+        responses, or a bare list of stops."""
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        responses = raw if isinstance(raw, list) else [raw]
+        stops = []
+        for item in responses:
+            if isinstance(item, dict) and "stops" in item:
+                stops.extend(item["stops"])
+            elif isinstance(item, dict):
+                stops.append(item)
+        return cls(stops, route_type=route_type)
+
+    def search(self, term: str, limit: int = 10) -> list[dict]:
+        """Return matches in the same shape as PTVClient.search_stops."""
+        query = _normalize(term)
+        if not query:
+            return []
+
+        scores: dict[int, float] = {}
+
+        def score(idx: int, value: float):
+            if value > scores.get(idx, 0.0):
+                scores[idx] = value
+
+        for idx in _prefix_range(self._word_keys, query):
+            score(idx, 3.0 if self._keys[idx] == query else 2.5 if self._keys[idx].startswith(query) else 2.0)
+        for idx in _prefix_range(self._suburb_keys, query):
+            score(idx, 1.5)
+
+        if len(scores) < limit:
+            query_grams = _trigrams(query)
+            shared: dict[int, int] = defaultdict(int)
+            for gram in query_grams:
+                for idx in self._trigrams.get(gram, ()):
+                    shared[idx] += 1
+            for idx, common in shared.items():
+                similarity = common / (len(query_grams) + self._trigram_counts[idx] - common)
+                if similarity >= 0.3:
+                    score(idx, similarity)
+
+        ranked = sorted(scores, key=lambda idx: (-scores[idx], self._keys[idx]))[:limit]
+        return [{"stop_id": self.stop_ids[idx], "stop_name": self.names[idx]} for idx in ranked]
+
+
+class ReloadingStationIndex:
+    """StationIndex backed by a file, reloaded when the file changes."""
+
+    def __init__(self, path: str | None, route_type: int = 0, check_seconds: float = 30.0):
+        self.path = path
+        self.route_type = route_type
+        self.check_seconds = check_seconds
+        self.index: StationIndex | None = None
+        self._mtime: float | None = None
+        self._checked_at = 0.0
+
+    def current(self) -> StationIndex | None:
+        """Return the loaded index, reloading it first if the file changed."""
+        now = time.monotonic()
+        if self.path and now - self._checked_at >= self.check_seconds:
+            self._checked_at = now
+            self.reload()
+        return self.index
+
+    def reload(self, force: bool = False) -> bool:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except (OSError, TypeError):
+            return False
+        if not force and mtime == self._mtime:
+            return False
+        try:
+            index = StationIndex.from_file(self.path, route_type=self.route_type)
+        except (OSError, ValueError) as exc:
+            print(f"[stations] failed to load {self.path}: {exc!r}")
+            return False
+        self.index, self._mtime = index, mtime
+        print(f"[stations] loaded {len(index)} stops from {self.path}")
+        return True
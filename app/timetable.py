@@ -0,0 +1,291 @@
+"""Offline scheduled-departure engine built from the GTFS static feed.
+
+Stop times are held in flat ``array`` columns sorted by (stop, departure
+time), so "next N departures at stop X" is a bisect plus a short forward
+scan. Used by fetch_departure_data when PTV is unavailable, has nothing for
+a stop, or during known service gaps.
+"""
+
+import csv
+import io
+import os
+import re
+import zipfile
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta, timezone
+
+from .ptv_client import MELBOURNE_TZ, _clean_stop_name
+
+_GTFS_STATION_SUFFIX = re.compile(r"\s*(Railway Station|Station)?\s*(\(.*\))?\s*$", re.IGNORECASE)
+
+
+def _parse_gtfs_time(raw: str) -> int:
+    """Seconds after service-day midnight; GTFS allows hours >= 24."""
+    h, m, s = raw.strip().split(":")
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+
+def _station_name_key(name: str) -> str:
+    return _clean_stop_name(_GTFS_STATION_SUFFIX.sub("", name)).lower()
+
+
+def _format_time(moment: datetime) -> str:
+    return moment.astimezone(MELBOURNE_TZ).strftime("%I:%M %p").lstrip("0").lower()
+
+
+class _Feed:
+    """Reads GTFS text files from a directory, a zip, or a zip nested in a
+    zip (Victoria's combined feed ships one zip per mode, e.g. ``2/``)."""
+
+    def __init__(self, path: str, member: str | None = None):
+        self._dir = path if os.path.isdir(path) else None
+        self._zip = None
+        if self._dir is None:
+            archive = zipfile.ZipFile(path)
+            if member:
+                archive = zipfile.ZipFile(io.BytesIO(archive.read(member)))
+            self._zip = archive
+
+    def has(self, name: str) -> bool:
+        if self._dir is not None:
+            return os.path.exists(os.path.join(self._dir, name))
+        return name in self._zip.namelist()
+
+    def rows(self, name: str):
+        if not self.has(name):
+            return
+        if self._dir is not None:
+            f = open(os.path.join(self._dir, name), encoding="utf-8-sig", newline="")
+        else:
+            f = io.TextIOWrapper(self._zip.open(name), encoding="utf-8-sig", newline="")
+        with f:
+            yield from csv.DictReader(f)
+
+
+class Timetable:
+    def __init__(self):
+        self.platform_names: list[str] = []
+        self.headsigns: list[str] = []
+        self.route_ids: list[str] = []
+        # Per trip
+        self.trip_service = array("i")
+        self.trip_headsign = array("i")
+        self.trip_route = array("i")
+        self.trip_direction = array("b")
+        # Per service
+        self.service_weekdays = array("B")  # Bit 0 = Monday
+        self.service_start = array("i")  # YYYYMMDD
+        self.service_end = array("i")
+        self.service_added: dict[int, set[int]] = {}
+        self.service_removed: dict[int, set[int]] = {}
+        # Stop-time columns sorted by (stop, departure seconds); each PTV stop
+        # owns the slice stop_slices[stop_id] = (start, end).
+        self.dep_seconds = array("i")
+        self.dep_trip = array("i")
+        self.dep_platform = array("i")
+        self.stop_slices: dict[int, tuple[int, int]] = {}
+        self._active: dict[int, set[int]] = {}
+
+    @classmethod
+    def load(cls, path: str, member: str | None = None, stop_ids_by_name: dict[str, int] | None = None) -> "Timetable":
+        """Load a GTFS feed. GTFS stops are mapped to PTV stop ids by the
+        cleaned name of their parent station (or their own name) through
+        stop_ids_by_name, e.g. from the station index. GTFS stop ids are
+        never used as PTV ids: the two numbering schemes differ, so a
+        numeric GTFS id can collide with an unrelated PTV stop."""
+        feed = _Feed(path, member)
+        tt = cls()
+        name_lookup = {_station_name_key(k): v for k, v in (stop_ids_by_name or {}).items()}
+
+        # Stops → PTV stop id and platform label
+        stop_rows = {row["stop_id"]: row for row in feed.rows("stops.txt")}
+
+        def ptv_id(gtfs_id: str) -> int | None:
+            row = stop_rows.get(gtfs_id)
+            if row is None:
+                return None
+            parent = stop_rows.get(row.get("parent_station") or "", row)
+            return name_lookup.get(_station_name_key(parent.get("stop_name", "")))
+
+        platform_idx: dict[str, int] = {}
+        stop_map: dict[str, tuple[int, int]] = {}
+        for gtfs_id, row in stop_rows.items():
+            sid = ptv_id(gtfs_id)
+            if sid is None:
+                continue
+            label = (row.get("platform_code") or "").strip()
+            if label not in platform_idx:
+                platform_idx[label] = len(tt.platform_names)
+                tt.platform_names.append(label)
+            stop_map[gtfs_id] = (sid, platform_idx[label])
+
+        # Services
+        service_idx: dict[str, int] = {}
+
+        def service(service_id: str) -> int:
+            idx = service_idx.get(service_id)
+            if idx is None:
+                idx = service_idx[service_id] = len(tt.service_weekdays)
+                tt.service_weekdays.append(0)
+                tt.service_start.append(0)
+                tt.service_end.append(0)
+            return idx
+
+        days = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+        for row in feed.rows("calendar.txt"):
+            idx = service(row["service_id"])
+            tt.service_weekdays[idx] = sum(1 << i for i, d in enumerate(days) if row.get(d) == "1")
+            tt.service_start[idx] = int(row["start_date"])
+            tt.service_end[idx] = int(row["end_date"])
+        for row in feed.rows("calendar_dates.txt"):
+            idx = service(row["service_id"])
+            target = tt.service_added if row["exception_type"] == "1" else tt.service_removed
+            target.setdefault(int(row["date"]), set()).add(idx)
+
+        # Trips
+        trip_idx: dict[str, int] = {}
+        headsign_idx: dict[str, int] = {}
+        route_idx: dict[str, int] = {}
+        for row in feed.rows("trips.txt"):
+            headsign = _clean_stop_name(row.get("trip_headsign") or "")
+            if headsign not in headsign_idx:
+                headsign_idx[headsign] = len(tt.headsigns)
+                tt.headsigns.append(headsign)
+            if row["route_id"] not in route_idx:
+                route_idx[row["route_id"]] = len(tt.route_ids)
+                tt.route_ids.append(row["route_id"])
+            trip_idx[row["trip_id"]] = len(tt.trip_service)
+            tt.trip_service.append(service(row["service_id"]))
+            tt.trip_headsign.append(headsign_idx[headsign])
+            tt.trip_route.append(route_idx[row["route_id"]])
+            tt.trip_direction.append(int(row.get("direction_id") or 0))
+
+        # Stop times, read into flat columns; a trip's final stop is arrival-only.
+        row_stop, row_secs, row_trip, row_seq, row_plat = (array("i") for _ in range(5))
+        last_seq: dict[int, int] = {}
+        for row in feed.rows("stop_times.txt"):
+            mapped = stop_map.get(row["stop_id"])
+            trip = trip_idx.get(row["trip_id"])
+            seq = int(row["stop_sequence"])
+            if trip is not None and seq > last_seq.get(trip, -1):
+                last_seq[trip] = seq
+            raw_time = row.get("departure_time") or row.get("arrival_time")
+            if mapped is None or trip is None or not raw_time:
+                continue
+            row_stop.append(mapped[0])
+            row_plat.append(mapped[1])
+            row_secs.append(_parse_gtfs_time(raw_time))
+            row_trip.append(trip)
+            row_seq.append(seq)
+
+        keep = [i for i in range(len(row_stop)) if row_seq[i] != last_seq[row_trip[i]]]
+        keep.sort(key=lambda i: (row_stop[i], row_secs[i]))
+        tt.dep_seconds = array("i", (row_secs[i] for i in keep))
+        tt.dep_trip = array("i", (row_trip[i] for i in keep))
+        tt.dep_platform = array("i", (row_plat[i] for i in keep))
+
+        start = 0
+        stops_sorted = [row_stop[i] for i in keep]
+        for pos in range(1, len(stops_sorted) + 1):
+            if pos == len(stops_sorted) or stops_sorted[pos] != stops_sorted[start]:
+                tt.stop_slices[stops_sorted[start]] = (start, pos)
+                start = pos
+        return tt
+
+    def __len__(self) -> int:
+        return len(self.dep_seconds)
+
+    def has_stop(self, stop_id: int) -> bool:
+        return stop_id in self.stop_slices
+
+    def _active_services(self, day: date) -> set[int]:
+        ymd = day.year * 10000 + day.month * 100 + day.day
+        if ymd in self._active:
+            return self._active[ymd]
+        bit = 1 << day.weekday()
+        active = {
+            idx for idx in range(len(self.service_weekdays))
+            if self.service_weekdays[idx] & bit and self.service_start[idx] <= ymd <= self.service_end[idx]
+        }
+        active |= self.service_added.get(ymd, set())
+        active -= self.service_removed.get(ymd, set())
+        if len(self._active) > 8:
+            self._active.clear()
+        self._active[ymd] = active
+        return active
+
+    def next_departures(
+        self,
+        stop_id: int,
+        platform_numbers: list[int] | None = None,
+        now: datetime | None = None,
+        limit: int = 6,
+        horizon_minutes: int = 24 * 60,
+    ) -> list[dict]:
+        """Next scheduled departures, in PTVClient._process_departures shape."""
+        bounds = self.stop_slices.get(stop_id)
+        if bounds is None:
+            return []
+        now = now or datetime.now(timezone.utc)
+        local_now = now.astimezone(MELBOURNE_TZ)
+        horizon = now + timedelta(minutes=horizon_minutes)
+        platforms = {str(p) for p in platform_numbers} if platform_numbers else None
+
+        found: list[tuple[datetime, int, int]] = []
+        # Yesterday's service day covers trips running past midnight (hours >= 24).
+        for offset in (-1, 0, 1):
+            service_day = local_now.date() + timedelta(days=offset)
+            midnight = datetime(service_day.year, service_day.month, service_day.day, tzinfo=MELBOURNE_TZ)
+            active = self._active_services(service_day)
+            if not active:
+                continue
+            after = int((now - midnight).total_seconds())
+            start, end = bounds
+            pos = bisect_left(self.dep_seconds, after, start, end)
+            per_day = 0
+            while pos < end and per_day < limit:
+                trip = self.dep_trip[pos]
+                departs = midnight + timedelta(seconds=self.dep_seconds[pos])
+                if departs > horizon:
+                    break
+                platform = self.platform_names[self.dep_platform[pos]]
+                # Feeds often leave platform_code empty; an unknown platform
+                # may be the requested one, so it matches any filter.
+                if self.trip_service[trip] in active and (platforms is None or not platform or platform in platforms):
+                    found.append((departs, trip, self.dep_platform[pos]))
+                    per_day += 1
+                pos += 1
+
+        found.sort(key=lambda item: item[0])
+        departures = []
+        for departs, trip, platform in found[:limit]:
+            departs_utc = departs.astimezone(timezone.utc)
+            departures.append({
+                "destination": self.headsigns[self.trip_headsign[trip]] or "Unknown",
+                "scheduled_time": _format_time(departs),
+                "estimated_time": _format_time(departs),
+                "scheduled_departure_utc": departs_utc.isoformat(),
+                "estimated_departure_utc": departs_utc.isoformat(),
+                "minutes_until": max(0, int((departs_utc - now).total_seconds() / 60)),
+                "platform": self.platform_names[platform],
+                "is_express": False,
+                "train_type": "Stops All",
+                "run_ref": "",
+                "route_id": self.route_ids[self.trip_route[trip]],
+                "direction_id": self.trip_direction[trip],
+            })
+        return departures
+
+    def in_service_gap(
+        self,
+        stop_id: int,
+        platform_numbers: list[int] | None = None,
+        now: datetime | None = None,
+        minutes: int = 60,
+    ) -> bool:
+        """True when the timetable knows this stop and schedules nothing in
+        the next ``minutes`` (e.g. overnight), so a live call can be skipped."""
+        if stop_id not in self.stop_slices:
+            return False
+        return not self.next_departures(stop_id, platform_numbers, now, limit=1, horizon_minutes=minutes)
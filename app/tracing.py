@@ -0,0 +1,119 @@
+"""Lightweight request tracing.
+
+A sampled request gets a Trace in a contextvar; ``span()`` blocks and
+``traced`` coroutines anywhere below it (PTV client, database, rendering)
+record their timings into it. When the request ends, the spans are logged
+as one pure-JSON line tagged ``"tag": "trace"`` and summarised in a
+``Server-Timing`` response header. Unsampled requests pay for one
+contextvar lookup per span.
+"""
+
+import functools
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    start: float  # Seconds after the trace started
+    duration: float
+    attrs: dict
+
+
+@dataclass(slots=True)
+class Trace:
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started: float = field(default_factory=time.perf_counter)
+    duration: float | None = None
+    spans: list[Span] = field(default_factory=list)
+
+    def server_timing(self) -> str:
+        """Spans summed per name, in first-seen order, plus the total."""
+        totals: dict[str, list[float]] = {}
+        for s in self.spans:
+            entry = totals.setdefault(s.name, [0.0, 0])
+            entry[0] += s.duration
+            entry[1] += 1
+        parts = []
+        for name, (duration, count) in totals.items():
+            part = f"{name};dur={duration * 1000:.1f}"
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        if self.duration is not None:
+            parts.append(f"total;dur={self.duration * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "tag": "trace",
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+            "spans": [
+                {
+                    "name": s.name,
+                    "start_ms": round(s.start * 1000, 2),
+                    "duration_ms": round(s.duration * 1000, 2),
+                    **s.attrs,
+                }
+                for s in self.spans
+            ],
+        }, separators=(",", ":"), default=str)
+
+
+@contextmanager
+def trace(name: str, sample_rate: float):
+    """Trace the block with probability ``sample_rate``; yields the Trace or None."""
+    if sample_rate <= 0 or (sample_rate < 1 and random.random() >= sample_rate):
+        yield None
+        return
+    current = Trace(name)
+    token = _trace.set(current)
+    try:
+        yield current
+    finally:
+        _trace.reset(token)
+        current.duration = time.perf_counter() - current.started
+        print(current.to_json())
+
+
+@contextmanager
+def span(name: str, **attrs):
+    current = _trace.get()
+    if current is None or current.duration is not None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        ended = time.perf_counter()
+        if current.duration is None:  # Work outliving its request is not recorded
+            current.spans.append(Span(name, started - current.started, ended - started, attrs))
+
+
+def traced(name: str):
+    """Decorator recording each call of a coroutine function as a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def detach() -> None:
+    """Stop recording spans for the current task (e.g. background work
+    started by a traced request)."""
+    _trace.set(None)
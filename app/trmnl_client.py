@@ -2,8 +2,16 @@ import httpx
 
 
 class TRMNLClient:
-    def __init__(self, webhook_url: str):
+    def __init__(self, webhook_url: str, client: httpx.AsyncClient | None = None):
         self.webhook_url = webhook_url
+        # Long-lived pooled client; reused across pushes for connection keep-alive.
+        # A client passed in may be shared by several webhooks and is closed by its owner.
+        self._owns_client = client is None
+        self._client = client if client is not None else httpx.AsyncClient()
+
+    async def aclose(self) -> None:
+        if self._owns_client:
+            await self._client.aclose()
 
     async def push_data(self, data: dict, strategy: str | None = None) -> dict:
         """Push data to TRMNL webhook.
@@ -15,17 +23,16 @@ class TRMNLClient:
         if strategy is not None:
             payload["merge_strategy"] = strategy
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.webhook_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
+        response = await self._client.post(
+            self.webhook_url,
+            json=payload,
+            headers={"Content-Type": "application/json"},
+        )
+        if not response.is_success:
+            raise httpx.HTTPStatusError(
+                f"{response.status_code} from TRMNL: {response.text}",
+                request=response.request,
+                response=response,
             )
-            if not response.is_success:
-                raise httpx.HTTPStatusError(
-                    f"{response.status_code} from TRMNL: {response.text}",
-                    request=response.request,
-                    response=response,
-                )
 
         return response.json()
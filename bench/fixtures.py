@@ -0,0 +1,103 @@
+"""Deterministic inputs for the benchmarks.
+
+Built from the recorded stopping pattern (patterns.md) and route stops
+(stops.md), re-timed relative to ``now`` so time-dependent code (minutes
+until departure, cache expiry) takes its normal paths. Every third run is
+an express skipping four stops, as in loadtest/fake_ptv.py.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+HEADWAY = timedelta(minutes=5)
+EXPRESS_SKIPS = slice(3, 7)
+
+
+def _utc(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _load() -> tuple[list[dict], dict[int, str]]:
+    pattern = json.loads((ROOT / "patterns.md").read_text(encoding="utf-8"))
+    stops = json.loads((ROOT / "stops.md").read_text(encoding="utf-8"))["stops"]
+    return pattern["departures"], {s["stop_id"]: s["stop_name"] for s in stops}
+
+
+class Fixtures:
+    def __init__(self, now: datetime | None = None):
+        now = (now or datetime.now(timezone.utc)).replace(second=0, microsecond=0)
+        recorded, self.names = _load()
+        origin = datetime.fromisoformat(recorded[0]["scheduled_departure_utc"].replace("Z", "+00:00"))
+        self.offsets = [
+            (d["stop_id"], datetime.fromisoformat(d["scheduled_departure_utc"].replace("Z", "+00:00")) - origin)
+            for d in recorded
+        ]
+        self.route_id = recorded[0]["route_id"]
+        self.direction_id = recorded[0]["direction_id"]
+        self.now = now
+        self.stop_id = self.offsets[1][0]
+        skipped = {sid for sid, _ in self.offsets[EXPRESS_SKIPS]}
+
+        # Six departures from the board's stop, the first express.
+        departures, runs = [], {}
+        for n in range(6):
+            run = 900 + n * 3
+            scheduled = now + timedelta(minutes=2) + n * HEADWAY
+            departures.append({
+                "stop_id": self.stop_id,
+                "route_id": self.route_id,
+                "run_id": run,
+                "run_ref": str(run),
+                "direction_id": self.direction_id,
+                "scheduled_departure_utc": _utc(scheduled),
+                "estimated_departure_utc": _utc(scheduled + timedelta(minutes=n % 3)) if n < 4 else None,
+                "platform_number": "1",
+                "skipped_stops": [],
+            })
+            runs[str(run)] = {
+                "run_id": run,
+                "run_ref": str(run),
+                "destination_name": "Flinders Street Station",
+                "express_stop_count": len(skipped) if n == 0 else 0,
+            }
+        self.departures_response = {
+            "departures": departures,
+            "runs": runs,
+            "routes": {},
+            "directions": {str(self.direction_id): {"direction_name": "City (Flinders Street)"}},
+        }
+
+        # Whole-run pattern of the express run, in both response shapes.
+        start = now + timedelta(minutes=2) - self.offsets[1][1]
+        full, calling = [], []
+        for sid, offset in self.offsets:
+            if sid in skipped:
+                full[-1]["skipped_stops"].append({"stop_id": sid, "stop_name": self.names.get(sid, "")})
+                continue
+            dep = {
+                "stop_id": sid,
+                "run_ref": "900",
+                "scheduled_departure_utc": _utc(start + offset),
+                "estimated_departure_utc": _utc(start + offset + timedelta(minutes=1)),
+                "skipped_stops": [],
+            }
+            full.append(dep)
+            calling.append({k: v for k, v in dep.items() if k != "skipped_stops"})
+        stops = {str(sid): {"stop_id": sid, "stop_name": self.names.get(sid, "Unknown")} for sid, _ in self.offsets}
+        self.pattern_response = {
+            "departures": full,
+            "stops": stops,
+            "runs": {"900": {"run_ref": "900", "express_stop_count": len(skipped)}},
+        }
+        # Calling-stops-only response plus the all-stops one, as diffed when
+        # departures carry no skipped_stops lists.
+        self.pattern_calling_response = {"departures": calling, "stops": stops}
+        self.pattern_path_response = {
+            "departures": [
+                {"stop_id": sid, "scheduled_departure_utc": _utc(start + offset)} for sid, offset in self.offsets
+            ],
+            "stops": stops,
+        }
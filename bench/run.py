@@ -0,0 +1,263 @@
+"""Microbenchmarks for the CPU hot paths, with a regression gate.
+
+    python -m bench.run                      # compare against bench/baseline.json
+    python -m bench.run --threshold 0.15     # fail on >15% slowdowns
+    python -m bench.run --update-baseline    # re-record the baseline
+
+Cases run on the fixtures in bench/fixtures.py, in several interleaved
+rounds. Each timing is divided by a pure-Python calibration loop timed
+just before it, which cancels machine speed and bursts of load, so a
+baseline recorded elsewhere still gates sensibly. A case regresses when
+its median calibrated time exceeds the baseline by more than --threshold
+plus a multiple of this run's noise across rounds, capped at 10 points.
+Cases whose rounds scatter by more than 10% are reported as too noisy to
+gate. Flagged and
+noisy cases are re-timed once before the run fails with exit status 1.
+Baselines are recorded with more rounds (9 by default) than comparisons.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+
+# app.config requires PTV credentials; the benchmarks never call PTV.
+os.environ.setdefault("PTV_DEV_ID", "bench")
+os.environ.setdefault("PTV_API_KEY", "bench")
+
+from app import main  # noqa: E402
+from app.ptv_client import PTVClient, _derive_pattern_from_skipped  # noqa: E402
+
+from .fixtures import Fixtures  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+# Multiples of the current run's measured noise tolerated on top of
+# --threshold, capped so a noisy run cannot widen the gate without bound.
+NOISE_FACTOR = 3.0
+MAX_NOISE_ALLOWANCE = 0.10
+# Rounds scattering more than this (relative median absolute deviation)
+# are too noisy to gate at all.
+MAX_NOISE = 0.10
+
+
+def _calibration():
+    # Dict/str/sort work in the same proportions as the hot paths.
+    rows = [{"stop_id": n, "name": f"Stop {n}"} for n in range(50)]
+    return sorted((r["name"].lower(), r["stop_id"]) for r in rows)
+
+
+def build_cases(fx: Fixtures) -> dict:
+    client = PTVClient("bench", "bench")
+    departures = client._process_departures(fx.departures_response)
+    path, calling, skipped_names = _derive_pattern_from_skipped(fx.pattern_response, "900")
+    pattern = PTVClient._build_run_pattern(path, calling, [fx.pattern_response], skipped_names)
+    stops = pattern.stops_from(fx.stop_id)
+    board = {
+        "departures": [
+            {key: d[key] for key in (
+                "destination", "scheduled_time", "estimated_time", "scheduled_departure_utc",
+                "estimated_departure_utc", "platform", "is_express", "train_type",
+            )}
+            for d in departures
+        ],
+        "stop_columns": main._stop_columns(stops),
+        "updated_at": "12:00 pm",
+        "degraded": False,
+        "scheduled": False,
+    }
+    context = main._build_render_context(board, "Bench Station")
+    instants = [d["estimated_departure_utc"] or d["scheduled_departure_utc"] for d in fx.departures_response["departures"]]
+    calling_path = tuple(d["stop_id"] for d in fx.pattern_path_response["departures"])
+    calling_ids = tuple(d["stop_id"] for d in fx.pattern_calling_response["departures"])
+    board_key = "bench:board"
+    main.ttl_policy.observe(board_key, board, fx.now)
+
+    cases = {
+        "ptv.process_departures": lambda: client._process_departures(fx.departures_response),
+        "ptv.derive_pattern_from_skipped": lambda: _derive_pattern_from_skipped(fx.pattern_response, "900"),
+        "ptv.build_run_pattern_diff": lambda: PTVClient._build_run_pattern(
+            calling_path, calling_ids, [fx.pattern_calling_response, fx.pattern_path_response]
+        ),
+        "ptv.pattern_stops_from": lambda: pattern.stops_from(fx.stop_id),
+        "main.parse_instant": lambda: [main._parse_instant(raw) for raw in instants],
+        "main.cache_expires_at": lambda: main._cache_expires_at(board, fx.now),
+        "main.cache_expires_at_adaptive": lambda: main._cache_expires_at(board, fx.now, board_key),
+        "main.build_render_context": lambda: main._build_render_context(board, "Bench Station"),
+        "main.stop_columns": lambda: main._stop_columns(stops),
+    }
+    for template_name in main._LAYOUT_MAP.values():
+        template = main.jinja_env.get_template(f"{template_name}.html")
+        cases[f"render.{template_name}"] = lambda template=template: template.render(**context)
+    return cases
+
+
+class Benchmark:
+    """A timeit timer with its loop count sized once, so each timing run
+    takes about ``min_time``."""
+
+    def __init__(self, fn, min_time: float):
+        self.timer = timeit.Timer(fn)
+        started = time.perf_counter()
+        fn()
+        once = max(time.perf_counter() - started, 1e-7)
+        number = max(1, int(min_time / once))
+        # Size from a short timed batch rather than the cold first call.
+        elapsed = self.timer.timeit(number=max(1, number // 10))
+        self.number = max(1, int(min_time * max(1, number // 10) / max(elapsed, 1e-9)))
+
+    def measure(self, repeat: int) -> float:
+        """Best seconds per call over ``repeat`` timing runs."""
+        return min(self.timer.repeat(repeat=repeat, number=self.number)) / self.number
+
+
+def run(names: list[str] | None, rounds: int, repeat: int, min_time: float, exact: bool = False) -> dict:
+    """Time the selected cases in ``rounds`` interleaved rounds.
+
+    Each timing is divided by a calibration timing taken right before it,
+    so a burst of machine-wide slowness affects both and cancels out. Per
+    case, the median ratio across rounds is the result and the median
+    absolute deviation of the ratios (relative to the median) its noise.
+    """
+    cases = build_cases(Fixtures())
+    selected = {
+        name: fn for name, fn in cases.items()
+        if not names or (name in names if exact else any(pattern in name for pattern in names))
+    }
+    calibration_bench = Benchmark(_calibration, min_time / 2)
+    benches = {name: Benchmark(fn, min_time) for name, fn in selected.items()}
+    times: dict[str, list[float]] = {name: [] for name in selected}
+    ratios: dict[str, list[float]] = {name: [] for name in selected}
+    calibrations: list[float] = []
+    for _ in range(max(1, rounds)):
+        for name, bench in benches.items():
+            calibration = calibration_bench.measure(repeat)
+            elapsed = bench.measure(repeat)
+            calibrations.append(calibration)
+            times[name].append(elapsed)
+            ratios[name].append(elapsed / calibration)
+
+    results = {"calibration_us": statistics.median(calibrations) * 1e6, "cases": {}}
+    for name in selected:
+        relative = statistics.median(ratios[name])
+        deviation = statistics.median(abs(r - relative) for r in ratios[name])
+        results["cases"][name] = {
+            "us_per_call": statistics.median(times[name]) * 1e6,
+            "relative": relative,
+            "noise": deviation / relative,
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> tuple[list[dict], bool]:
+    """A case regresses when its calibrated time grows by more than
+    ``threshold`` plus NOISE_FACTOR times this run's noise, capped at
+    MAX_NOISE_ALLOWANCE. Cases noisier than MAX_NOISE are marked "noisy":
+    their result cannot be trusted either way."""
+    rows, regressed = [], False
+    for name, current in results["cases"].items():
+        recorded = baseline.get("cases", {}).get(name)
+        row = {
+            "case": name,
+            "current_us": current["us_per_call"],
+            "baseline_us": None,
+            "change": None,
+            "allowed": None,
+            "status": "new",
+        }
+        if recorded is not None and recorded.get("relative"):
+            change = current["relative"] / recorded["relative"] - 1
+            allowed = threshold + min(NOISE_FACTOR * current["noise"], MAX_NOISE_ALLOWANCE)
+            row.update(baseline_us=recorded["us_per_call"], change=change, allowed=allowed)
+            if change > allowed:
+                row["status"] = "REGRESSED"
+                regressed = True
+            elif current["noise"] > MAX_NOISE:
+                row["status"] = "noisy"
+            elif change < -allowed:
+                row["status"] = "faster"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return rows, regressed
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("cases", nargs="*", help="Only run cases whose name contains one of these")
+    parser.add_argument(
+        "--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", "0.25")),
+        help="Allowed slowdown beyond measured noise, as a fraction of baseline "
+             "(default 0.25, or BENCH_THRESHOLD)",
+    )
+    parser.add_argument(
+        "--rounds", type=int, default=None,
+        help="Interleaved rounds per case (default 5, or 9 with --update-baseline)",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs per round (best is kept)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Seconds per timing run")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.rounds is None:
+        args.rounds = 9 if args.update_baseline else 5
+    results = run(args.cases, args.rounds, args.repeat, args.min_time)
+
+    if args.update_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() and args.cases else {"cases": {}}
+        baseline.update(
+            recorded_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            python=platform.python_version(),
+            machine=platform.machine(),
+            calibration_us=round(results["calibration_us"], 3),
+        )
+        for name, result in results["cases"].items():
+            baseline["cases"][name] = {key: round(value, 4) for key, value in result.items()}
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"[bench] wrote {len(results['cases'])} cases to {args.baseline}")
+        noisy = [name for name, result in results["cases"].items() if result["noise"] > MAX_NOISE]
+        if noisy:
+            print(f"[bench] warning: noisy baseline for {', '.join(noisy)}; re-record on a quieter machine")
+        return 0
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    rows, regressed = compare(results, baseline, args.threshold)
+    if regressed or any(row["status"] == "noisy" for row in rows):
+        # Confirm before failing: re-time the flagged and noisy cases and
+        # keep each case's better result, so one noisy stretch cannot fail
+        # the gate.
+        flagged = [row["case"] for row in rows if row["status"] in ("REGRESSED", "noisy")]
+        retry = run(flagged, args.rounds, args.repeat, args.min_time, exact=True)
+        for name, result in retry["cases"].items():
+            if result["relative"] < results["cases"][name]["relative"]:
+                results["cases"][name] = result
+        rows, regressed = compare(results, baseline, args.threshold)
+
+    if args.json:
+        print(json.dumps({"threshold": args.threshold, "rows": rows, "regressed": regressed}, indent=2))
+    else:
+        print(f"{'case':36} {'baseline us':>12} {'current us':>12} {'change':>8} {'allowed':>8}  status")
+        for row in rows:
+            baseline_us = f"{row['baseline_us']:.2f}" if row["baseline_us"] is not None else "-"
+            change = f"{row['change']:+.1%}" if row["change"] is not None else "-"
+            allowed = f"{row['allowed']:.0%}" if row["allowed"] is not None else "-"
+            print(
+                f"{row['case']:36} {baseline_us:>12} {row['current_us']:>12.2f} {change:>8} {allowed:>8}  {row['status']}"
+            )
+        noisy = [row["case"] for row in rows if row["status"] == "noisy"]
+        if noisy:
+            print(f"[bench] warning: too noisy to gate {', '.join(noisy)}; re-run with more --rounds on a quieter machine")
+        if regressed:
+            print("[bench] regression beyond the allowed slowdown")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
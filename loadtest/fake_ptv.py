@@ -0,0 +1,300 @@
+"""Local stand-in for the PTV Timetable API v3, for load tests.
+
+Serves departures, stopping patterns, route stops and search from the
+recorded fixtures (patterns.md, stops.md), checks every request's devid and
+HMAC signature exactly as PTVClient._sign_url produces them, and injects
+configurable latency, errors and hangs.
+
+    python -m loadtest.fake_ptv --port 9000 --latency-ms 80 --error-rate 0.01
+
+Point the app at it with PTV_BASE_URL=http://127.0.0.1:9000 and the same
+PTV_DEV_ID / PTV_API_KEY. GET /_stats returns call counts per endpoint,
+POST /_reset clears them, and POST /_config changes settings at runtime.
+
+Runs depart the fixture's origin every --headway-seconds; every third run
+runs express past a few stops, and estimates drift over time so realtime
+changes are visible to caching.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import random
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import parse_qs, unquote
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+@dataclass
+class FakeConfig:
+    dev_id: str = "1000"
+    api_key: str = "fake-api-key"
+    latency_ms: float = 50.0
+    jitter_ms: float = 25.0
+    error_rate: float = 0.0  # Fraction of requests answered with error_status
+    error_status: int = 500
+    hang_rate: float = 0.0  # Fraction of requests that stall for hang_seconds
+    hang_seconds: float = 30.0
+    headway_seconds: int = 300
+
+
+def _instant(raw: str) -> float:
+    return datetime.fromisoformat(raw.replace("Z", "+00:00")).timestamp()
+
+
+def _utc(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class Fixtures:
+    def __init__(self, root: Path):
+        pattern = json.loads((root / "patterns.md").read_text(encoding="utf-8"))
+        self.stops = json.loads((root / "stops.md").read_text(encoding="utf-8"))["stops"]
+        self.names = {s["stop_id"]: s["stop_name"] for s in self.stops}
+
+        departures = pattern["departures"]
+        origin = _instant(departures[0]["scheduled_departure_utc"])
+        self.route_id = departures[0]["route_id"]
+        self.direction_id = departures[0]["direction_id"]
+        # (stop_id, seconds after the run leaves its origin, platform)
+        self.pattern = [
+            (d["stop_id"], _instant(d["scheduled_departure_utc"]) - origin, d.get("platform_number") or "1")
+            for d in departures
+        ]
+        self.offsets = {sid: offset for sid, offset, _ in self.pattern}
+        self.destination = self.names.get(self.pattern[-1][0], "Flinders Street Station")
+        # Stops passed without calling by express runs.
+        self.express_skips = {sid for sid, _, _ in self.pattern[3:7]}
+
+
+config = FakeConfig()
+fixtures: Fixtures | None = None
+calls: Counter = Counter()
+app = FastAPI(title="Fake PTV API")
+
+
+def _fixtures() -> Fixtures:
+    global fixtures
+    if fixtures is None:
+        fixtures = Fixtures(ROOT)
+    return fixtures
+
+
+def _is_express(run: int) -> bool:
+    return run % 3 == 0
+
+
+def _delay(run: int, now: float) -> int:
+    """Seconds late: fixed per run plus a drift that changes every two minutes."""
+    return (run * 37) % 4 * 60 + (60 if run % 2 and int(now // 120) % 2 else 0)
+
+
+def _signature_error(request: Request) -> str | None:
+    raw_path = request.scope.get("raw_path", b"").decode("latin-1") or request.url.path
+    signed, sep, signature = request.url.query.rpartition("&signature=")
+    if not sep:
+        return "missing signature"
+    if parse_qs(signed).get("devid") != [config.dev_id]:
+        return "unknown devid"
+    expected = hmac.new(
+        config.api_key.encode("utf-8"), f"{raw_path}?{signed}".encode("utf-8"), hashlib.sha1
+    ).hexdigest().upper()
+    if not hmac.compare_digest(expected, signature):
+        return "invalid signature"
+    return None
+
+
+async def _serve(request: Request, endpoint: str, build) -> JSONResponse:
+    calls[endpoint] += 1
+    error = _signature_error(request)
+    if error is not None:
+        calls["rejected_signature"] += 1
+        return JSONResponse({"message": f"Forbidden: {error}", "status": {"version": "3.0", "health": 1}}, status_code=403)
+
+    await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-1, 1) * config.jitter_ms) / 1000)
+    if config.hang_rate and random.random() < config.hang_rate:
+        calls["hung"] += 1
+        await asyncio.sleep(config.hang_seconds)
+    if config.error_rate and random.random() < config.error_rate:
+        calls["errors"] += 1
+        return JSONResponse({"message": "Injected error"}, status_code=config.error_status)
+    return JSONResponse(build())
+
+
+def _run_info(run: int) -> dict:
+    fx = _fixtures()
+    express = len(fx.express_skips) if _is_express(run) else 0
+    return {"run_id": run, "run_ref": str(run), "destination_name": fx.destination, "express_stop_count": express}
+
+
+@app.get("/v3/departures/route_type/{route_type}/stop/{stop_id}")
+async def departures(request: Request, route_type: int, stop_id: int):
+    def build() -> dict:
+        fx = _fixtures()
+        params = parse_qs(request.url.query)
+        max_results = int(params.get("max_results", ["6"])[0])
+        platforms = params.get("platform_numbers")
+        offset = fx.offsets.get(stop_id, 0.0)
+        platform = platforms[0] if platforms else dict((s, p) for s, _, p in fx.pattern).get(stop_id, "1")
+
+        now = time.time()
+        run = math.ceil((now - offset) / config.headway_seconds)
+        items, runs = [], {}
+        while len(items) < max_results:
+            if not (_is_express(run) and stop_id in fx.express_skips):
+                scheduled = run * config.headway_seconds + offset
+                estimated = scheduled + _delay(run, now) if scheduled - now < 1800 else None
+                items.append({
+                    "stop_id": stop_id,
+                    "route_id": fx.route_id,
+                    "run_id": run,
+                    "run_ref": str(run),
+                    "direction_id": fx.direction_id,
+                    "disruption_ids": [],
+                    "scheduled_departure_utc": _utc(scheduled),
+                    "estimated_departure_utc": _utc(estimated) if estimated is not None else None,
+                    "at_platform": False,
+                    "platform_number": platform,
+                    "flags": "",
+                    "departure_sequence": 0,
+                    "departure_note": "",
+                    "skipped_stops": [],
+                })
+                runs[str(run)] = _run_info(run)
+            run += 1
+        return {
+            "departures": items,
+            "stops": {},
+            "routes": {},
+            "runs": runs,
+            "directions": {str(fx.direction_id): {"direction_id": fx.direction_id, "direction_name": "City (Flinders Street)"}},
+            "disruptions": {},
+            "status": {"version": "3.0", "health": 1},
+        }
+
+    return await _serve(request, "departures", build)
+
+
+@app.get("/v3/pattern/run/{run_ref}/route_type/{route_type}")
+async def pattern(request: Request, run_ref: str, route_type: int):
+    def build() -> dict:
+        fx = _fixtures()
+        params = parse_qs(request.url.query)
+        include_skipped = params.get("include_skipped_stops", ["false"])[0].lower() == "true"
+        run = int(run_ref) if run_ref.lstrip("-").isdigit() else 0
+        now = time.time()
+
+        items: list[dict] = []
+        for stop_id, offset, platform in fx.pattern:
+            if _is_express(run) and stop_id in fx.express_skips:
+                if include_skipped and items:
+                    items[-1]["skipped_stops"].append({"stop_id": stop_id, "stop_name": fx.names.get(stop_id, "")})
+                continue
+            scheduled = run * config.headway_seconds + offset
+            items.append({
+                "stop_id": stop_id,
+                "route_id": fx.route_id,
+                "run_id": run,
+                "run_ref": str(run),
+                "direction_id": fx.direction_id,
+                "disruption_ids": [],
+                "scheduled_departure_utc": _utc(scheduled),
+                "estimated_departure_utc": _utc(scheduled + _delay(run, now)),
+                "at_platform": False,
+                "platform_number": platform,
+                "flags": "",
+                "departure_sequence": len(items) + 1,
+                "departure_note": "",
+                "skipped_stops": [],
+            })
+        stops = {}
+        if "stop" in params.get("expand", []):
+            stops = {
+                str(sid): {"stop_id": sid, "stop_name": fx.names.get(sid, "Unknown")}
+                for sid, _, _ in fx.pattern
+            }
+        return {
+            "disruptions": [],
+            "departures": items,
+            "stops": stops,
+            "routes": {},
+            "runs": {str(run): _run_info(run)},
+            "directions": {},
+            "status": {"version": "3.0", "health": 1},
+        }
+
+    return await _serve(request, "pattern", build)
+
+
+@app.get("/v3/stops/route/{route_id}/route_type/{route_type}")
+async def route_stops(request: Request, route_id: int, route_type: int):
+    return await _serve(request, "route_stops", lambda: {
+        "stops": _fixtures().stops,
+        "status": {"version": "3.0", "health": 1},
+    })
+
+
+@app.get("/v3/search/{term}")
+async def search(request: Request, term: str):
+    def build() -> dict:
+        needle = unquote(term).lower()
+        return {
+            "stops": [s for s in _fixtures().stops if needle in s["stop_name"].lower()],
+            "routes": [],
+            "outlets": [],
+            "status": {"version": "3.0", "health": 1},
+        }
+
+    return await _serve(request, "search", build)
+
+
+@app.get("/_stats")
+async def stats():
+    upstream = sum(n for key, n in calls.items() if key in {"departures", "pattern", "route_stops", "search"})
+    return {"calls": dict(calls), "total": upstream, "config": asdict(config)}
+
+
+@app.post("/_reset")
+async def reset():
+    calls.clear()
+    return {"status": "reset"}
+
+
+@app.post("/_config")
+async def update_config(request: Request):
+    changes = await request.json()
+    known = {f.name for f in fields(FakeConfig)}
+    for key, value in changes.items():
+        if key in known:
+            setattr(config, key, type(getattr(config, key))(value))
+    return asdict(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    for f in fields(FakeConfig):
+        default = getattr(config, f.name)
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+    for f in fields(FakeConfig):
+        setattr(config, f.name, getattr(args, f.name))
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Fleet load generator for /trmnl/markup.
+
+Simulates N TRMNL devices spread over M stations, each polling the app's
+markup endpoint on an interval, and reports latency percentiles, throughput
+and PTV calls per device-minute (read from the fake PTV server's /_stats).
+
+    python -m loadtest.loadgen --devices 500 --stations 20 --duration 120 --poll-seconds 15
+
+Devices are provisioned through /manage and /manage/save as users named
+``loadtest-<n>``, so run it against a scratch DATABASE_PATH.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def pick_stations(count: int) -> list[dict]:
+    stops = json.loads((ROOT / "stops.md").read_text(encoding="utf-8"))["stops"]
+    return [{"stop_id": s["stop_id"], "station_name": s["stop_name"]} for s in stops[:count]]
+
+
+async def provision(client: httpx.AsyncClient, devices: int, stations: list[dict], concurrency: int) -> list[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def setup(n: int) -> str:
+        uuid = f"loadtest-{n}"
+        station = stations[n % len(stations)]
+        async with semaphore:
+            (await client.get("/manage", params={"uuid": uuid})).raise_for_status()
+            (await client.post("/manage/save", data={"uuid": uuid, **station})).raise_for_status()
+        return uuid
+
+    return await asyncio.gather(*(setup(n) for n in range(devices)))
+
+
+async def ptv_calls(client: httpx.AsyncClient, ptv_url: str | None) -> dict | None:
+    if not ptv_url:
+        return None
+    try:
+        response = await client.get(f"{ptv_url.rstrip('/')}/_stats")
+        response.raise_for_status()
+        return response.json()["calls"]
+    except httpx.HTTPError:
+        return None
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.app, limits=limits, timeout=args.timeout) as client:
+        stations = pick_stations(args.stations)
+        uuids = await provision(client, args.devices, stations, min(args.connections, 32))
+        before = await ptv_calls(client, args.ptv)
+
+        latencies: list[float] = []
+        statuses: dict[str, int] = {}
+        deadline = time.monotonic() + args.duration
+
+        async def device(uuid: str):
+            # Spread the fleet over the first poll interval.
+            await asyncio.sleep(random.uniform(0, args.poll_seconds))
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/trmnl/markup", data={"user_uuid": uuid})
+                    status = str(response.status_code)
+                except httpx.HTTPError as exc:
+                    status = type(exc).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                await asyncio.sleep(args.poll_seconds)
+
+        started = time.monotonic()
+        await asyncio.gather(*(device(uuid) for uuid in uuids))
+        elapsed = time.monotonic() - started
+        after = await ptv_calls(client, args.ptv)
+
+    latencies.sort()
+    report = {
+        "devices": args.devices,
+        "stations": len(stations),
+        "duration_seconds": round(elapsed, 1),
+        "requests": len(latencies),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p90": round(percentile(latencies, 0.90) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "max": round((latencies[-1] if latencies else 0.0) * 1000, 1),
+        },
+    }
+    if before is not None and after is not None:
+        upstream = {
+            key: after.get(key, 0) - before.get(key, 0)
+            for key in ("departures", "pattern", "route_stops", "search", "errors", "rejected_signature")
+        }
+        total = sum(upstream[key] for key in ("departures", "pattern", "route_stops", "search"))
+        device_minutes = args.devices * elapsed / 60
+        report["ptv_calls"] = upstream
+        report["ptv_calls_per_device_minute"] = round(total / device_minutes, 4) if device_minutes else 0.0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--app", default="http://127.0.0.1:8000", help="Base URL of the app under test")
+    parser.add_argument("--ptv", default="http://127.0.0.1:9000", help="Fake PTV server, for upstream call counts")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--stations", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds of polling")
+    parser.add_argument("--poll-seconds", type=float, default=15.0, help="Interval between a device's polls")
+    parser.add_argument("--connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    latency = report["latency_ms"]
+    print(f"{report['requests']} requests from {report['devices']} devices on {report['stations']} stations "
+          f"in {report['duration_seconds']}s ({report['throughput_rps']} req/s)")
+    print(f"latency ms: p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}")
+    print(f"statuses: {report['statuses']}")
+    if "ptv_calls" in report:
+        print(f"PTV calls: {report['ptv_calls']} ({report['ptv_calls_per_device_minute']} per device-minute)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import asyncio
+import types
+
+import pytest
+
+from app import database as db
+from app import shared_state
+from app.shared_state import MemorySharedState, SQLiteSharedState
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake wall clock for shared-state expiry; advance with ``clock[0] += s``."""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(shared_state, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def run_with_state(request, tmp_path, monkeypatch):
+    """Run ``body(state)`` against each SharedState backend; SQLite uses a
+    fresh database file."""
+
+    def run(body):
+        async def main():
+            if request.param == "memory":
+                return await body(MemorySharedState())
+            monkeypatch.setattr(db, "DATABASE_PATH", str(tmp_path / "shared.db"))
+            await db.init_db()
+            try:
+                return await body(SQLiteSharedState())
+            finally:
+                await db.close_db()
+
+        return asyncio.run(main())
+
+    return run
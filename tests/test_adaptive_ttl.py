@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta, timezone
+
+from app.adaptive_ttl import AdaptiveTTLPolicy
+
+DEFAULT_TTL = 60
+EMPTY_TTL = 30
+HEADWAY = 600
+START = datetime(2026, 3, 2, 8, 0, tzinfo=timezone.utc)
+
+
+def _utc(moment: datetime) -> str:
+    return moment.isoformat()
+
+
+def _board(now: datetime, estimate_shift) -> dict:
+    """Next four departures at least two minutes out, each estimated
+    ``estimate_shift(scheduled)`` seconds late."""
+    first = START + timedelta(seconds=HEADWAY) * max(0, int((now - START).total_seconds() + 120) // HEADWAY + 1)
+    departures = []
+    for n in range(4):
+        scheduled = first + timedelta(seconds=HEADWAY * n)
+        departures.append({
+            "destination": "Flinders Street",
+            "scheduled_departure_utc": _utc(scheduled),
+            "estimated_departure_utc": _utc(scheduled + timedelta(seconds=estimate_shift(scheduled))),
+        })
+    return {"departures": departures}
+
+
+def _simulate(estimate_shift_at, fetches: int = 40) -> list[float]:
+    """Fetch the board again each time its TTL runs out; return the TTLs."""
+    policy = AdaptiveTTLPolicy(min_seconds=20, max_seconds=600)
+    now, ttls = START, []
+    for n in range(fetches):
+        data = _board(now, lambda scheduled: estimate_shift_at(n, now, scheduled))
+        policy.observe("board", data, now)
+        ttl, _ = policy.ttl_seconds("board", data, now, DEFAULT_TTL, EMPTY_TTL)
+        ttls.append(ttl)
+        now += timedelta(seconds=ttl)
+    return ttls
+
+
+def test_ttl_stable_when_estimates_move_on_every_fetch():
+    # Worst case: every fetch sees each estimate a minute later than the last.
+    ttls = _simulate(lambda n, now, scheduled: 60 * n)
+    assert min(ttls) >= DEFAULT_TTL
+    assert len(set(ttls[-10:])) == 1
+
+
+def test_ttl_stable_under_constant_wall_clock_drift():
+    # Estimates slip 6 seconds per minute of wall clock.
+    ttls = _simulate(lambda n, now, scheduled: 0.1 * (now - START).total_seconds())
+    assert min(ttls) >= DEFAULT_TTL
+    assert max(ttls[-10:]) - min(ttls[-10:]) < 1
+
+
+def test_stable_estimates_lengthen_ttl_to_headway_limit():
+    ttls = _simulate(lambda n, now, scheduled: 0)
+    assert ttls[-1] == HEADWAY / 3
+
+
+def test_imminent_departure_undercuts_default_ttl():
+    policy = AdaptiveTTLPolicy(min_seconds=20, max_seconds=600)
+    now = START
+    data = {"departures": [{
+        "destination": "Flinders Street",
+        "scheduled_departure_utc": _utc(now + timedelta(seconds=35)),
+        "estimated_departure_utc": None,
+    }]}
+    policy.observe("board", data, now)
+    ttl, _ = policy.ttl_seconds("board", data, now, DEFAULT_TTL, EMPTY_TTL)
+    assert ttl == 35
+
+    data["departures"][0]["scheduled_departure_utc"] = _utc(now + timedelta(seconds=5))
+    ttl, _ = policy.ttl_seconds("board", data, now, DEFAULT_TTL, EMPTY_TTL)
+    assert ttl == 20
+
+
+def test_empty_board_backs_off():
+    policy = AdaptiveTTLPolicy(min_seconds=20, max_seconds=600)
+    ttls = []
+    for _ in range(4):
+        policy.observe("board", {"departures": []}, START)
+        ttls.append(policy.ttl_seconds("board", {"departures": []}, START, DEFAULT_TTL, EMPTY_TTL)[1])
+    assert ttls == [30, 60, 120, 240]
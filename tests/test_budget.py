@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app import budget
+from app.budget import AdmissionGate, BudgetExhausted
+
+
+def test_nested_deadlines_keep_the_earliest_and_reserve_holds_time_back():
+    async def run():
+        with budget.deadline(10):
+            with budget.deadline(60):
+                inner = budget.remaining()
+            with budget.reserve(4):
+                reserved = budget.remaining()
+            outer = budget.remaining()
+        return inner, reserved, outer, budget.remaining()
+
+    inner, reserved, outer, after = asyncio.run(run())
+    assert 9 < inner <= 10
+    assert 5 < reserved <= 6
+    assert 9 < outer <= 10
+    assert after is None
+
+
+def test_gate_sheds_beyond_the_wait_queue():
+    async def run():
+        gate = AdmissionGate(max_concurrent=1, max_waiting=1)
+        release = asyncio.Event()
+
+        async def fetch():
+            async with gate.admit():
+                await release.wait()
+                return "ok"
+
+        active = asyncio.create_task(fetch())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(fetch())
+        await asyncio.sleep(0)
+        with pytest.raises(BudgetExhausted):
+            await fetch()
+        release.set()
+        return await asyncio.gather(active, waiting), gate.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["ok", "ok"]
+    assert stats == {"active": 0, "waiting": 0, "admitted": 2, "shed": 1}
+
+
+def test_gate_gives_up_when_the_deadline_passes_while_waiting():
+    async def run():
+        gate = AdmissionGate(max_concurrent=1, max_waiting=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with budget.deadline(0.01), pytest.raises(BudgetExhausted):
+            async with gate.admit():
+                pass
+        stats = gate.stats()
+        release.set()
+        await holder
+        return stats
+
+    assert asyncio.run(run()) == {"active": 1, "waiting": 0, "admitted": 1, "shed": 1}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        gate = AdmissionGate(max_concurrent=1, max_waiting=1)
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.admit():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        waiting_after_cancel = gate.waiting
+        release.set()
+        await holder
+        return waiting_after_cancel, gate.stats()
+
+    waiting, stats = asyncio.run(run())
+    assert waiting == 0
+    assert stats == {"active": 0, "waiting": 0, "admitted": 1, "shed": 0}
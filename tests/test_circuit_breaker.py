@@ -0,0 +1,78 @@
+import types
+
+import pytest
+
+from app import circuit_breaker
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(circuit_breaker, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _open(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures_only(clock):
+    breaker = CircuitBreaker("ptv", failure_threshold=3, reset_seconds=30)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.before_call()
+    breaker.record_success()  # Resets the streak
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 3, "opened": 1, "rejected": 1}
+
+
+def test_half_open_lets_a_single_trial_through(clock):
+    breaker = CircuitBreaker("ptv", failure_threshold=1, reset_seconds=30)
+    _open(breaker)
+    clock[0] += 30
+    breaker.before_call()  # The trial
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Concurrent call while the trial is in flight
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()  # Closed again: calls pass
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_failed_trial_reopens_for_a_full_reset_period(clock):
+    breaker = CircuitBreaker("ptv", failure_threshold=1, reset_seconds=30)
+    _open(breaker)
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["opened"] == 2
+    clock[0] += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock[0] += 1
+    breaker.before_call()
+    assert breaker.state == "half_open"
+
+
+def test_ignored_trial_frees_the_slot_without_closing(clock):
+    breaker = CircuitBreaker("ptv", failure_threshold=1, reset_seconds=30)
+    _open(breaker)
+    clock[0] += 30
+    breaker.before_call()
+    breaker.record_ignored()  # e.g. the caller's deadline ran out
+    assert breaker.state == "half_open"
+    breaker.before_call()  # A new trial is allowed
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+os.environ.setdefault("PTV_DEV_ID", "test")
+os.environ.setdefault("PTV_API_KEY", "test")
+
+from app import main  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip", "gzip"),
+        ("gzip, deflate", "gzip"),
+        ("*", "br"),
+        ("gzip;q=0, *", "br"),
+        ("br;q=0, gzip;q=0, *", None),
+        ("gzip;q=0", None),
+        ("*;q=0", None),
+        ("*;q=0, gzip", "gzip"),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(header, expected, monkeypatch):
+    # Brotli first, as when the optional package is installed.
+    monkeypatch.setattr(main, "_COMPRESSORS", {"br": None, "gzip": None})
+    assert main._negotiate_encoding(header) == expected
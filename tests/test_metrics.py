@@ -0,0 +1,25 @@
+from prometheus_client import CollectorRegistry, generate_latest
+
+from app.metrics import StatsCollector
+
+
+def _exposition(stats: dict) -> str:
+    collector = StatsCollector()
+    collector.add("cache", lambda: stats)
+    registry = CollectorRegistry()
+    registry.register(collector)
+    return generate_latest(registry).decode()
+
+
+def test_running_totals_are_counters():
+    text = _exposition({"hits": 3, "evictions": 1, "granted_interactive": 7, "dropped_background": 2})
+    for name in ("hits", "evictions", "granted_interactive", "dropped_background"):
+        assert f"# TYPE trmnl_cache_{name}_total counter" in text
+    assert "trmnl_cache_hits_total 3.0" in text
+
+
+def test_levels_and_states_are_gauges():
+    text = _exposition({"size": 4, "tokens": 1.5, "in_flight": 0, "is_leader": True, "state": "closed"})
+    for name in ("size", "tokens", "in_flight", "is_leader", "state"):
+        assert f"# TYPE trmnl_cache_{name} gauge" in text
+    assert 'trmnl_cache_state{state="closed"} 1.0' in text
@@ -0,0 +1,113 @@
+"""The single include_skipped_stops request must produce the same stopping
+pattern as diffing the calling-stops and all-stops responses, and must
+fall back to that diff whenever the response cannot prove its skip data."""
+
+import asyncio
+import json
+from pathlib import Path
+
+import httpx
+import pytest
+
+from app.ptv_client import PTVClient, _derive_pattern_from_skipped
+
+FIXTURES = Path(__file__).parent / "fixtures"
+RUN_REF = "949180"
+EXPRESS_STOPS = {1047, 1147, 1125, 1170}
+
+
+def _load(name: str) -> dict:
+    return json.loads((FIXTURES / f"{name}.json").read_text(encoding="utf-8"))
+
+
+def _diff_pattern(calling: dict, full: dict):
+    return PTVClient._build_run_pattern(
+        path=tuple(dep["stop_id"] for dep in full["departures"]),
+        calling=tuple(dep["stop_id"] for dep in calling["departures"]),
+        responses=[calling, full],
+    )
+
+
+def _single_pattern(full: dict):
+    path, calling, skipped_names = _derive_pattern_from_skipped(full, RUN_REF)
+    return PTVClient._build_run_pattern(path, calling, [full], skipped_names)
+
+
+@pytest.mark.parametrize(
+    "calling_fixture, single_fixture, diff_full_fixture",
+    [
+        ("pattern_express_calling", "pattern_express_skipped", "pattern_express_skipped_no_detail"),
+        ("pattern_all_stops", "pattern_all_stops", "pattern_all_stops"),
+    ],
+)
+def test_single_request_matches_two_request_diff(calling_fixture, single_fixture, diff_full_fixture):
+    single = _single_pattern(_load(single_fixture))
+    diff = _diff_pattern(_load(calling_fixture), _load(diff_full_fixture))
+
+    assert single.path == diff.path
+    assert single.calling == diff.calling
+    for stop_id in diff.path:
+        assert single.stops_from(stop_id) == diff.stops_from(stop_id)
+
+
+def test_express_stops_flagged():
+    stops = _single_pattern(_load("pattern_express_skipped")).stops_from(1228)
+    assert {s["stop_id"] for s in stops if s["is_express"]} == EXPRESS_STOPS
+    assert len(stops) == 25
+
+
+def test_empty_skip_lists_on_express_run_need_the_diff():
+    # Every departure has skipped_stops: [] although the run skips four stops.
+    assert _derive_pattern_from_skipped(_load("pattern_express_skipped_no_detail"), RUN_REF) is None
+
+
+def test_missing_run_details_need_the_diff():
+    full = _load("pattern_express_skipped")
+    full["runs"] = {}
+    assert _derive_pattern_from_skipped(full, RUN_REF) is None
+
+
+def test_missing_skipped_stops_key_needs_the_diff():
+    full = _load("pattern_express_skipped")
+    del full["departures"][0]["skipped_stops"]
+    assert _derive_pattern_from_skipped(full, RUN_REF) is None
+
+
+def _fetch(single_request: bool, full_fixture: str) -> tuple[list[dict], list[str]]:
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        include_skipped = request.url.params.get("include_skipped_stops") == "true"
+        requested.append("full" if include_skipped else "calling")
+        return httpx.Response(200, json=_load(full_fixture if include_skipped else "pattern_express_calling"))
+
+    async def run():
+        client = PTVClient(
+            "1000", "key",
+            client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            pattern_single_request=single_request,
+        )
+        try:
+            return await client.get_stopping_pattern(RUN_REF, current_stop_id=1228)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run()), requested
+
+
+def test_fetch_uses_one_request_when_skip_data_checks_out():
+    stops, requested = _fetch(True, "pattern_express_skipped")
+    assert requested == ["full"]
+    assert {s["stop_id"] for s in stops if s["is_express"]} == EXPRESS_STOPS
+
+
+def test_fetch_falls_back_to_diff_without_skip_detail():
+    stops, requested = _fetch(True, "pattern_express_skipped_no_detail")
+    assert sorted(requested) == ["calling", "full"]
+    assert {s["stop_id"] for s in stops if s["is_express"]} == EXPRESS_STOPS
+
+
+def test_fetch_diffs_when_single_request_disabled():
+    stops, requested = _fetch(False, "pattern_express_skipped_no_detail")
+    assert sorted(requested) == ["calling", "full"]
+    assert {s["stop_id"] for s in stops if s["is_express"]} == EXPRESS_STOPS
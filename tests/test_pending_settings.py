@@ -0,0 +1,56 @@
+from app.pending_settings import PendingSettingsStore
+
+SETTINGS = {"stop_id": 1071, "station_name": "Flinders Street", "platform_numbers": None, "refresh_minutes": 5}
+
+
+def test_pop_returns_settings_once(run_with_state, clock):
+    async def body(state):
+        store = PendingSettingsStore(state, ttl_seconds=600, max_entries=10)
+        await store.put("token", SETTINGS)
+        return await store.pop("token"), await store.pop("token"), store.stats()
+
+    first, second, stats = run_with_state(body)
+    assert first == SETTINGS
+    assert second is None
+    assert stats == {"hits": 1, "misses": 1, "expirations": 0, "evictions": 0}
+
+
+def test_expired_entry_popped_before_sweep_counts_as_expiration(run_with_state, clock):
+    async def body(state):
+        store = PendingSettingsStore(state, ttl_seconds=600, max_entries=10)
+        await store.put("token", SETTINGS)
+        clock[0] += 601
+        return await store.pop("token"), store.stats()
+
+    values, stats = run_with_state(body)
+    assert values is None
+    assert stats == {"hits": 0, "misses": 0, "expirations": 1, "evictions": 0}
+
+
+def test_trim_evicts_oldest_entries_one_at_a_time(run_with_state, clock):
+    async def body(state):
+        store = PendingSettingsStore(state, ttl_seconds=600, max_entries=2)
+        for n in range(4):
+            await store.put(f"token{n}", {**SETTINGS, "stop_id": n})
+            clock[0] += 1
+        return [await store.pop(f"token{n}") for n in range(4)], store.stats()
+
+    popped, stats = run_with_state(body)
+    assert [p and p["stop_id"] for p in popped] == [None, None, 2, 3]
+    assert stats["evictions"] == 2
+
+
+def test_sweep_deletes_only_expired_entries(run_with_state, clock):
+    async def body(state):
+        store = PendingSettingsStore(state, ttl_seconds=600, max_entries=10)
+        await store.put("old", SETTINGS)
+        clock[0] += 300
+        await store.put("new", SETTINGS)
+        clock[0] += 301
+        swept = await store.sweep()
+        return swept, await store.pop("old"), await store.pop("new"), store.stats()
+
+    swept, old, new, stats = run_with_state(body)
+    assert swept == 1
+    assert old is None and new == SETTINGS
+    assert stats == {"hits": 1, "misses": 1, "expirations": 1, "evictions": 0}
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+from app.profiler import ProfilerMiddleware, StackProfiler
+
+
+def _profile(profiler: StackProfiler, label: str) -> str | None:
+    session = profiler.start(label)
+    session.samples["main.py:handler"] += 1
+    return profiler.finish(session)
+
+
+def test_keeps_only_newest_profiles(tmp_path):
+    profiler = StackProfiler(str(tmp_path), max_files=3)
+    written = [_profile(profiler, f"req{n}") for n in range(5)]
+    assert sorted(str(p) for p in tmp_path.iterdir()) == sorted(written[-3:])
+
+
+def test_middleware_writes_off_the_event_loop(tmp_path):
+    writer_threads = []
+
+    class RecordingProfiler(StackProfiler):
+        def finish(self, session):
+            writer_threads.append(threading.get_ident())
+            return super().finish(session)
+
+    profiler = RecordingProfiler(str(tmp_path))
+
+    async def app(scope, receive, send):
+        profiler.window()  # Any sampled request work
+
+    async def run():
+        middleware = ProfilerMiddleware(app, profiler, {"/trmnl/markup"}, sample_rate=1.0)
+        await middleware({"type": "http", "path": "/trmnl/markup"}, None, None)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert writer_threads and writer_threads[0] != loop_thread
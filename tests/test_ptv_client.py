@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.ptv_client import PTVClient
+from app.rate_limiter import Priority, PriorityRateLimiter, RateLimitedError, priority
+
+
+def _client(breaker: CircuitBreaker, limiter: PriorityRateLimiter) -> PTVClient:
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"departures": []}))
+    return PTVClient(
+        "1000", "key", client=httpx.AsyncClient(transport=transport), breaker=breaker, limiter=limiter
+    )
+
+
+def test_open_circuit_fails_fast_without_spending_a_token():
+    breaker = CircuitBreaker("ptv", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    limiter = PriorityRateLimiter(5.0, 20)
+    client = _client(breaker, limiter)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(client._get_json("https://ptv.test/v3/departures/route_type/0/stop/1071"))
+    assert limiter.granted[Priority.INTERACTIVE] == 0
+    assert limiter.tokens == pytest.approx(20, abs=0.5)
+
+
+def test_dropped_half_open_trial_frees_the_trial_slot():
+    breaker = CircuitBreaker("ptv", failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    limiter = PriorityRateLimiter(0.001, 2)
+    limiter.tokens = 0.0
+    client = _client(breaker, limiter)
+    url = "https://ptv.test/v3/departures/route_type/0/stop/1071"
+
+    async def run():
+        with priority(Priority.BACKGROUND), pytest.raises(RateLimitedError):
+            await client._get_json(url)
+        limiter.tokens = 2.0
+        return await client._get_json(url)
+
+    assert asyncio.run(run()) == {"departures": []}
+    assert breaker.state == "closed"
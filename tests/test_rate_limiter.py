@@ -0,0 +1,74 @@
+import asyncio
+import types
+
+import pytest
+
+from app import rate_limiter
+from app.rate_limiter import Priority, PriorityRateLimiter, RateLimitedError, worker_share
+
+# One push burst of four targets: departures plus two pattern requests each.
+PUSH_CALLS = 12
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Drive the limiter from a fake clock that sleeping advances."""
+    now = [1000.0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    monkeypatch.setattr(rate_limiter, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    monkeypatch.setattr(rate_limiter, "asyncio", types.SimpleNamespace(sleep=sleep))
+    return now
+
+
+def _burst(limiter: PriorityRateLimiter, level: Priority, calls: int) -> list[bool]:
+    async def call():
+        try:
+            await limiter.acquire(level)
+            return True
+        except RateLimitedError:
+            return False
+
+    async def run():
+        return await asyncio.gather(*(call() for _ in range(calls)))
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_push_burst_waits_for_tokens_instead_of_dropping(clock, workers):
+    limiter = PriorityRateLimiter(*worker_share(5.0, 20, workers, leader=True))
+    assert all(_burst(limiter, Priority.SCHEDULED, PUSH_CALLS))
+    assert limiter.dropped[Priority.SCHEDULED] == 0
+    assert limiter.granted[Priority.SCHEDULED] == PUSH_CALLS
+
+
+def test_background_burst_is_still_dropped_when_dry(clock):
+    limiter = PriorityRateLimiter(*worker_share(5.0, 20, 4, leader=True))
+    granted = _burst(limiter, Priority.BACKGROUND, PUSH_CALLS)
+    assert 0 < sum(granted) < PUSH_CALLS
+    assert limiter.delayed[Priority.BACKGROUND] == 0
+
+
+def test_scheduled_keeps_headroom_for_interactive(clock):
+    limiter = PriorityRateLimiter(5.0, 20)
+    limiter.tokens = 20 * 0.25  # At the scheduled reserve
+    assert _burst(limiter, Priority.INTERACTIVE, 5) == [True] * 5
+
+
+def test_leader_gets_a_larger_share_within_the_budget():
+    leader = worker_share(5.0, 20, 4, leader=True)
+    follower = worker_share(5.0, 20, 4, leader=False)
+    assert leader == (2.0, 8)
+    assert follower == (1.0, 4)
+    assert leader[0] + 3 * follower[0] == pytest.approx(5.0)
+    assert leader[1] + 3 * follower[1] <= 20
+    assert worker_share(5.0, 20, 1, leader=False) == (5.0, 20)
+
+
+def test_resize_keeps_earned_tokens_within_new_burst(clock):
+    limiter = PriorityRateLimiter(*worker_share(5.0, 20, 4, leader=True))
+    limiter.resize(*worker_share(5.0, 20, 4, leader=False))
+    assert (limiter.rate, limiter.burst, limiter.tokens) == (1.0, 4, 4.0)
@@ -0,0 +1,39 @@
+import asyncio
+
+from app import database as db
+from app.ptv_client import RouteTopology
+from app.route_topology import RouteTopologyStore
+
+# (stop_id, name, stop_sequence), deliberately out of order.
+STOPS = [(1071, "Flinders Street", 1), (1181, "Southern Cross", 2), (1162, "Richmond", 4), (1155, "Parliament", 3)]
+
+
+def test_stops_from_slices_onward_in_sequence_order():
+    topology = RouteTopology.from_stops(STOPS)
+    assert [stop_id for stop_id, _ in topology.stops] == [1071, 1181, 1155, 1162]
+    assert topology.stops_from(1155) == ((1155, "Parliament"), (1162, "Richmond"))
+    assert topology.stops_from(1162) == ((1162, "Richmond"),)
+
+
+def test_unknown_stop_returns_the_whole_route():
+    topology = RouteTopology.from_stops(STOPS)
+    assert topology.stops_from(99999) == topology.stops
+
+
+def test_store_round_trips_through_sqlite(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DATABASE_PATH", str(tmp_path / "topology.db"))
+
+    async def run():
+        await db.init_db()
+        try:
+            await RouteTopologyStore(ttl_seconds=3600).put((6, 1, 0), RouteTopology.from_stops(STOPS))
+            # A fresh store (another worker, or after a restart) reads SQLite.
+            fresh = await RouteTopologyStore(ttl_seconds=3600).get((6, 1, 0))
+            expired = await RouteTopologyStore(ttl_seconds=0).get((6, 1, 0))
+            return fresh, expired
+        finally:
+            await db.close_db()
+
+    fresh, expired = asyncio.run(run())
+    assert fresh.stops_from(1181) == RouteTopology.from_stops(STOPS).stops_from(1181)
+    assert expired is None
@@ -0,0 +1,89 @@
+"""SharedState contract, run against the in-process stand-in and SQLite."""
+
+import asyncio
+
+import pytest
+
+from app.shared_state import create_shared_state
+
+
+def test_values_expire_and_json_round_trip(run_with_state, clock):
+    async def body(state):
+        await state.set("ns", "kept", {"stop_id": 1071, "platforms": (1, 2)})
+        await state.set("ns", "short", "x", ttl_seconds=10)
+        await state.set("other", "kept", 1)
+        before = await state.items("ns")
+        clock[0] += 11
+        return before, await state.get("ns", "short"), await state.items("ns")
+
+    before, short, after = run_with_state(body)
+    assert before == {"kept": {"stop_id": 1071, "platforms": [1, 2]}, "short": "x"}
+    assert short is None
+    assert after == {"kept": {"stop_id": 1071, "platforms": [1, 2]}}
+
+
+def test_pop_is_atomic_and_reports_expiry(run_with_state, clock):
+    async def body(state):
+        await state.set("ns", "once", "value", ttl_seconds=60)
+        racers = await asyncio.gather(*(state.pop("ns", "once") for _ in range(5)))
+        await state.set("ns", "stale", "value", ttl_seconds=60)
+        clock[0] += 61
+        return racers, await state.pop("ns", "stale"), await state.pop("ns", "missing")
+
+    racers, stale, missing = run_with_state(body)
+    assert racers.count(("value", False)) == 1
+    assert racers.count((None, False)) == 4
+    assert stale == (None, True)
+    assert missing == (None, False)
+
+
+def test_sweep_and_trim(run_with_state, clock):
+    async def body(state):
+        for n in range(4):
+            await state.set("ns", f"k{n}", n, ttl_seconds=100 + n)
+        await state.set("ns", "forever", "x")
+        await state.set("other", "k", 1, ttl_seconds=1)
+        clock[0] += 100.5
+        swept = await state.sweep("ns")
+        trimmed = await state.trim("ns", 2)
+        return swept, trimmed, await state.items("ns"), await state.sweep()
+
+    swept, trimmed, remaining, swept_all = run_with_state(body)
+    assert swept == 1  # Only k0 had expired in "ns"
+    assert trimmed == 2  # k1 and k2, closest to expiry, go first
+    assert remaining == {"k3": 3, "forever": "x"}
+    assert swept_all == 1
+
+
+def test_lease_take_renew_expire_and_steal(run_with_state, clock):
+    async def body(state):
+        steps = [
+            await state.acquire_lease("scheduler", "a", 30),  # Free: taken
+            await state.acquire_lease("scheduler", "b", 30),  # Held by a
+        ]
+        clock[0] += 20
+        steps.append(await state.acquire_lease("scheduler", "a", 30))  # Renewed to t+50
+        clock[0] += 20
+        steps.append(await state.acquire_lease("scheduler", "b", 30))  # Renewal still valid
+        clock[0] += 11
+        steps.append(await state.acquire_lease("scheduler", "b", 30))  # Expired: stolen
+        steps.append(await state.acquire_lease("scheduler", "a", 30))  # Now b's
+        await state.release_lease("scheduler", "a")  # Not a's to release
+        steps.append(await state.acquire_lease("scheduler", "a", 30))
+        await state.release_lease("scheduler", "b")
+        steps.append(await state.acquire_lease("scheduler", "a", 30))  # Released: free
+        return steps
+
+    assert run_with_state(body) == [True, False, True, False, True, False, False, True]
+
+
+def test_concurrent_lease_acquire_has_one_winner(run_with_state, clock):
+    async def body(state):
+        return await asyncio.gather(*(state.acquire_lease("refresh:1071", f"w{n}", 30) for n in range(5)))
+
+    assert sorted(run_with_state(body)) == [False] * 4 + [True]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_shared_state("redis")
@@ -0,0 +1,170 @@
+"""Callers that coalesce onto a shared fetch must not inherit the first
+caller's PTV priority or deadline when their own are more generous."""
+
+import asyncio
+
+from app import budget
+from app.rate_limiter import Priority, PriorityRateLimiter, current_priority, priority
+from app.singleflight import SingleFlight
+
+
+def test_interactive_joiner_raises_background_fetch_priority():
+    limiter = PriorityRateLimiter(rate_per_second=0.001, burst=2)
+    limiter.tokens = 1.0  # Below the background reserve, enough for interactive
+
+    async def run():
+        flight = SingleFlight("test")
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            await release.wait()
+            await limiter.acquire()
+            return current_priority()
+
+        async def background():
+            with priority(Priority.BACKGROUND):
+                return await flight.do("board", fetch)
+
+        first = asyncio.create_task(background())
+        await started.wait()
+        joined = asyncio.create_task(flight.do("board", fetch))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, joined)
+
+    assert asyncio.run(run()) == [Priority.INTERACTIVE, Priority.INTERACTIVE]
+    assert limiter.granted[Priority.INTERACTIVE] == 1
+    assert limiter.dropped[Priority.BACKGROUND] == 0
+
+
+def test_lower_priority_joiner_leaves_fetch_priority_alone():
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return current_priority()
+
+        first = asyncio.create_task(flight.do("board", fetch))
+        await asyncio.sleep(0)
+        with priority(Priority.BACKGROUND):
+            joined = asyncio.create_task(flight.do("board", fetch))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, joined)
+
+    assert asyncio.run(run()) == [Priority.INTERACTIVE, Priority.INTERACTIVE]
+
+
+def _deadline_seen_by_fetch(first_seconds, joiner_seconds):
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return budget.remaining()
+
+        async def caller(seconds):
+            with budget.deadline(seconds):
+                return await flight.do("board", fetch)
+
+        first = asyncio.create_task(caller(first_seconds))
+        await asyncio.sleep(0)
+        joined = asyncio.create_task(caller(joiner_seconds))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, joined)
+
+    return asyncio.run(run())
+
+
+def test_fetch_runs_to_latest_waiter_deadline():
+    assert all(5 < remaining <= 10 for remaining in _deadline_seen_by_fetch(1, 10))
+    assert all(remaining <= 1 for remaining in _deadline_seen_by_fetch(1, 0.5))
+
+
+def test_unbounded_joiner_lifts_fetch_deadline():
+    # budget.deadline(None) leaves the joiner without a deadline.
+    assert _deadline_seen_by_fetch(1, None) == [None, None]
+
+
+def test_cancelling_first_waiter_does_not_cancel_the_others():
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+        started = []
+
+        async def fetch():
+            started.append(1)
+            await release.wait()
+            return {"departures": []}
+
+        first = asyncio.create_task(flight.do("board", fetch))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(flight.do("board", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*others)
+        return first.cancelled(), results, started, flight.stats()
+
+    first_cancelled, results, started, stats = asyncio.run(run())
+    assert first_cancelled
+    assert all(r is results[0] for r in results) and results[0] == {"departures": []}
+    assert started == [1]
+    assert stats == {"calls": 4, "executions": 1, "coalesced": 3, "errors": 0, "in_flight": 0}
+
+
+def test_exception_reaches_every_waiter_and_is_counted():
+    class UpstreamError(Exception):
+        pass
+
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            raise UpstreamError("PTV down")
+
+        waiters = [asyncio.create_task(flight.do("board", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+
+        async def ok():
+            return "fresh"
+
+        # The failed call is not cached: the next call runs again.
+        return results, await flight.do("board", ok), flight.stats()
+
+    results, retried, stats = asyncio.run(run())
+    assert all(isinstance(r, UpstreamError) for r in results)
+    assert retried == "fresh"
+    assert stats == {"calls": 4, "executions": 2, "coalesced": 2, "errors": 1, "in_flight": 0}
+
+
+def test_failure_with_every_waiter_cancelled_is_still_counted():
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            raise RuntimeError("PTV down")
+
+        waiter = asyncio.create_task(flight.do("board", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return flight.stats()
+
+    assert asyncio.run(run())["errors"] == 1
@@ -0,0 +1,63 @@
+import json
+
+from app.station_index import ReloadingStationIndex, StationIndex
+
+STOPS = [
+    {"stop_id": 1071, "stop_name": "Flinders Street Station", "stop_suburb": "Melbourne City", "route_type": 0},
+    {"stop_id": 1181, "stop_name": "Southern Cross Station", "stop_suburb": "Melbourne City", "route_type": 0},
+    {"stop_id": 1120, "stop_name": "Melbourne Central Station", "stop_suburb": "Melbourne City", "route_type": 0},
+    {"stop_id": 1162, "stop_name": "Richmond Station", "stop_suburb": "Richmond", "route_type": 0},
+    {"stop_id": 1026, "stop_name": "Box Hill Station", "stop_suburb": "Box Hill", "route_type": 0},
+    {"stop_id": 1071, "stop_name": "Flinders Street Station", "stop_suburb": "Melbourne City", "route_type": 0},
+    {"stop_id": 19843, "stop_name": "Flinders St/Elizabeth St", "stop_suburb": "Melbourne City", "route_type": 1},
+]
+
+
+def _ids(results: list[dict]) -> list[int]:
+    return [r["stop_id"] for r in results]
+
+
+def test_builds_one_entry_per_stop_of_the_route_type():
+    index = StationIndex(STOPS)
+    assert len(index) == 5
+    assert index.search("flinders") == [{"stop_id": 1071, "stop_name": "Flinders Street"}]
+
+
+def test_exact_name_outranks_prefix_outranks_word_prefix():
+    index = StationIndex(STOPS + [
+        {"stop_id": 1, "stop_name": "Central", "route_type": 0},
+        {"stop_id": 2, "stop_name": "Centralia Station", "route_type": 0},
+    ])
+    assert _ids(index.search("central")) == [1, 2, 1120]
+
+
+def test_suburb_prefix_matches_rank_below_name_matches():
+    index = StationIndex(STOPS)
+    results = _ids(index.search("melbourne"))
+    assert results[0] == 1120  # Name match
+    assert results[1:] == [1071, 1181]  # Suburb matches, alphabetical
+
+
+def test_fuzzy_matches_typos_when_prefixes_run_out():
+    index = StationIndex(STOPS)
+    assert _ids(index.search("richmnd"))[:1] == [1162]
+    assert _ids(index.search("southen cross"))[:1] == [1181]
+    assert index.search("zzzz") == []
+    assert index.search("  ") == []
+
+
+def test_limit_and_punctuation():
+    index = StationIndex(STOPS)
+    assert len(index.search("melbourne", limit=2)) == 2
+    assert _ids(index.search("box-hill")) == [1026]
+
+
+def test_reloading_index_picks_up_a_changed_file(tmp_path):
+    path = tmp_path / "stops.json"
+    path.write_text(json.dumps({"stops": STOPS[:2]}), encoding="utf-8")
+    reloading = ReloadingStationIndex(str(path), check_seconds=0)
+    assert len(reloading.current()) == 2
+
+    path.write_text(json.dumps([{"stops": STOPS[:2]}, {"stops": STOPS[2:4]}]), encoding="utf-8")
+    reloading.reload(force=True)
+    assert len(reloading.current()) == 4
@@ -0,0 +1,137 @@
+"""GTFS timetable fallback on a small synthetic feed.
+
+Flinders Street has GTFS platform stops 19854 (platform 1) and 19855 (no
+platform_code) under one parent station; PTV knows the station as 1071.
+Weekday service runs 1 Jan to 31 Dec 2026 except Thursday 5 March, and a
+one-off Saturday service runs on 7 March.
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.ptv_client import MELBOURNE_TZ, PTVClient
+from app.timetable import Timetable
+
+FLINDERS_STREET = 1071
+RICHMOND = 1162
+
+FEED = {
+    "stops.txt": [
+        "stop_id,stop_name,parent_station,platform_code,location_type",
+        "place_fss,Flinders Street Station,,,1",
+        "19854,Flinders Street Station,place_fss,1,0",
+        "19855,Flinders Street Station,place_fss,,0",
+        "20000,Richmond Station,,2,0",
+    ],
+    "trips.txt": [
+        "route_id,service_id,trip_id,trip_headsign,direction_id",
+        "R1,WK,morning,Richmond,0",
+        "R1,WK,late,Richmond,0",
+        "R1,SAT,special,Richmond,0",
+        "R1,WK,inbound,Flinders Street,1",
+    ],
+    "calendar.txt": [
+        "service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date",
+        "WK,1,1,1,1,1,0,0,20260101,20261231",
+    ],
+    "calendar_dates.txt": [
+        "service_id,date,exception_type",
+        "WK,20260305,2",
+        "SAT,20260307,1",
+    ],
+    "stop_times.txt": [
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence",
+        "morning,08:00:00,08:00:00,19854,1",
+        "morning,08:10:00,08:10:00,20000,2",
+        "late,24:30:00,24:30:00,19855,1",
+        "late,24:40:00,24:40:00,20000,2",
+        "special,09:00:00,09:00:00,19854,1",
+        "special,09:10:00,09:10:00,20000,2",
+        "inbound,08:20:00,08:20:00,20000,1",
+        "inbound,08:30:00,08:30:00,19854,2",
+    ],
+}
+
+
+@pytest.fixture
+def timetable(tmp_path):
+    for name, lines in FEED.items():
+        (tmp_path / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return Timetable.load(str(tmp_path), stop_ids_by_name={"Flinders Street": FLINDERS_STREET, "Richmond": RICHMOND})
+
+
+def _local(*args) -> datetime:
+    return datetime(*args, tzinfo=MELBOURNE_TZ).astimezone(timezone.utc)
+
+
+def _times(departures: list[dict]) -> list[str]:
+    return [d["scheduled_time"] for d in departures]
+
+
+def test_load_maps_stops_by_station_name_not_gtfs_id(timetable):
+    assert timetable.has_stop(FLINDERS_STREET)
+    assert timetable.has_stop(RICHMOND)
+    assert not timetable.has_stop(19854)
+    # Trip-final stops are arrival-only: 3 Flinders Street + 1 Richmond departures.
+    assert len(timetable) == 4
+
+
+def test_unmapped_stops_are_not_indexed(tmp_path):
+    for name, lines in FEED.items():
+        (tmp_path / name).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    assert len(Timetable.load(str(tmp_path))) == 0
+
+
+def test_after_midnight_trip_runs_on_previous_service_day(timetable):
+    # Monday's 24:30 trip departs at 00:30 on Tuesday.
+    departures = timetable.next_departures(FLINDERS_STREET, now=_local(2026, 3, 3, 0, 10))
+    assert _times(departures)[0] == "12:30 am"
+    assert departures[0]["scheduled_departure_utc"] == _local(2026, 3, 3, 0, 30).isoformat()
+
+
+def test_calendar_dates_remove_and_add_services(timetable):
+    # Weekday service is removed on Thursday 5 March.
+    assert timetable.next_departures(FLINDERS_STREET, now=_local(2026, 3, 5, 7, 0), horizon_minutes=12 * 60) == []
+    # The one-off service runs on Saturday 7 March only.
+    assert _times(timetable.next_departures(FLINDERS_STREET, now=_local(2026, 3, 7, 8, 30), limit=1)) == ["9:00 am"]
+    assert timetable.next_departures(FLINDERS_STREET, now=_local(2026, 3, 14, 8, 30), horizon_minutes=60) == []
+
+
+def test_empty_platform_code_matches_any_platform_filter(timetable):
+    # Only the 00:30 departure (no platform_code) can be on platform 2.
+    monday_late = _local(2026, 3, 2, 23, 45)
+    assert _times(timetable.next_departures(FLINDERS_STREET, [2], now=monday_late))[:1] == ["12:30 am"]
+    assert not timetable.in_service_gap(FLINDERS_STREET, [2], monday_late, minutes=60)
+    assert _times(timetable.next_departures(FLINDERS_STREET, [1], now=_local(2026, 3, 2, 7, 0)))[0] == "8:00 am"
+
+
+def test_service_gap_overnight(timetable):
+    assert timetable.in_service_gap(FLINDERS_STREET, None, _local(2026, 3, 3, 2, 0), minutes=60)
+    assert not timetable.in_service_gap(FLINDERS_STREET, None, _local(2026, 3, 3, 7, 30), minutes=60)
+    assert not timetable.in_service_gap(12345, None, _local(2026, 3, 3, 2, 0))
+
+
+def test_departure_shape_matches_ptv_client(timetable):
+    now = _local(2026, 3, 2, 7, 0)
+    scheduled = timetable.next_departures(FLINDERS_STREET, now=now)[0]
+    live = PTVClient("1000", "key")._process_departures({
+        "departures": [{
+            "stop_id": FLINDERS_STREET,
+            "route_id": 1,
+            "run_id": 1,
+            "run_ref": "1",
+            "direction_id": 1,
+            "scheduled_departure_utc": "2026-03-02T21:00:00Z",
+            "estimated_departure_utc": None,
+            "platform_number": "1",
+        }],
+        "runs": {"1": {"destination_name": "Richmond", "express_stop_count": 0}},
+    })[0]
+    assert scheduled.keys() == live.keys()
+    assert {k: type(v) for k, v in scheduled.items() if k != "route_id"} == {
+        k: type(v) for k, v in live.items() if k != "route_id"
+    }
+    assert scheduled["destination"] == "Richmond"
+    assert scheduled["platform"] == "1"
+    assert scheduled["minutes_until"] == 60
@@ -0,0 +1,14 @@
+import json
+
+from app import tracing
+
+
+def test_trace_log_line_is_pure_json(capsys):
+    with tracing.trace("trmnl_markup", sample_rate=1):
+        with tracing.span("board", cached=True):
+            pass
+    line = capsys.readouterr().out.strip()
+    record = json.loads(line)
+    assert record["tag"] == "trace"
+    assert record["name"] == "trmnl_markup"
+    assert [(s["name"], s["cached"]) for s in record["spans"]] == [("board", True)]